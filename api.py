@@ -0,0 +1,414 @@
+# api.py
+# Headless HTTP API over the analysis pipeline (FastAPI + uvicorn), so integrations do not go
+# through Streamlit:
+#   POST /analyze        {"text", "lang"?, "model"?, "reply"?, "budget_s"?}  -> stress, signals, replies
+#   POST /analyze/batch  {"texts", "lang"?}                                  -> stress + signals per text
+#   POST /reply          {"text", "stress_label", "stress_score", "signals", "model"?, "context"?}
+#   POST /reply/stream   same body as /analyze; Server-Sent Events per stage as it finishes
+#   GET  /health, /ready (default models loaded), /metrics (metrics.snapshot())
+# Pipeline stages run on a thread pool (or the inference_pool processes, whose exceptions
+# arrive with their original type, so DeadlineExceeded maps to 504 either way and a crashed
+# worker to 503). Concurrent /analyze classifications are micro-batched through
+# detect_stress_batch. Admission control bounds the requests in flight and waiting; beyond
+# that the API answers 503 with Retry-After.
+#
+#   python api.py [--host 0.0.0.0] [--port 8000]
+
+import argparse
+import asyncio
+import functools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+import metrics
+import vocab
+from audit import audit
+from classifier import detect_stress_batch
+from deadline import Deadline, DeadlineExceeded
+from degradation import controller
+from extractor import extract_signals
+from generate_response import empathetic_reply
+from inference_pool import WorkerCrashed, get_inference_pool
+from redflags import screen_redflags
+from registry import registry
+from signals import Signals
+from config import (
+    API_HOST, API_PORT, API_WORKERS, API_MAX_INFLIGHT, API_MAX_QUEUED, API_BATCH_WINDOW_MS,
+    API_MAX_BATCH, API_MAX_BATCH_ITEMS, API_DISCONNECT_POLL_S, INFERENCE_PRELOAD, INFERENCE_WORKERS,
+    REQUEST_BUDGET_S,
+    DEGRADE_PREFERRED_GENERATOR,
+)
+
+_executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+
+
+async def _call(fn, *args, **kwargs):
+    """Run a blocking pipeline stage off the event loop (in the process pool when enabled)."""
+    pool = get_inference_pool()
+    if pool is not None:
+        return await asyncio.wrap_future(pool.submit(fn.__name__, *args, **kwargs))
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+# ---- Admission control ----
+class _Admission:
+    """At most `max_inflight` requests run and `max_queued` wait; the rest are rejected."""
+
+    def __init__(self, max_inflight: int = API_MAX_INFLIGHT, max_queued: int = API_MAX_QUEUED):
+        self.max_queued = max_queued
+        self.waiting = 0
+        self.running = 0
+        self._slots = asyncio.Semaphore(max_inflight)
+
+    def check(self):
+        """Reject (503) when every slot is taken and the wait queue is full."""
+        if self._slots.locked() and self.waiting >= self.max_queued:
+            metrics.inc("api.rejected")
+            raise HTTPException(503, "Server busy, retry shortly", headers={"Retry-After": "1"})
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        metrics.set_gauge("api.inflight", self.running)
+        try:
+            yield
+        finally:
+            self.running -= 1
+            metrics.set_gauge("api.inflight", self.running)
+            self._slots.release()
+
+
+# ---- Micro-batching of classification ----
+class _StressBatcher:
+    """Collects /analyze texts for API_BATCH_WINDOW_MS (or API_MAX_BATCH) and classifies them together."""
+
+    def __init__(self, window_ms: float = API_BATCH_WINDOW_MS, max_batch: int = API_MAX_BATCH):
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: Dict[Optional[str], list] = {}  # lang -> [(text, future)]
+        self._timers = {}
+
+    async def classify(self, text: str, lang: str = None) -> dict:
+        fut = asyncio.get_running_loop().create_future()
+        group = self._pending.setdefault(lang, [])
+        group.append((text, fut))
+        if len(group) >= self.max_batch:
+            self._flush(lang)
+        elif lang not in self._timers:
+            self._timers[lang] = asyncio.get_running_loop().call_later(self.window_s, self._flush, lang)
+        return await fut
+
+    def _flush(self, lang):
+        timer = self._timers.pop(lang, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._pending.pop(lang, [])
+        if group:
+            metrics.observe("api.batch_size", len(group))
+            asyncio.ensure_future(self._run(group, lang))
+
+    async def _run(self, group, lang):
+        try:
+            results = await _call(detect_stress_batch, [text for text, _ in group], lang=lang,
+                                  batch_size=self.max_batch)
+        except Exception as e:
+            for _, fut in group:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), res in zip(group, results):
+            if not fut.done():
+                fut.set_result(res)
+
+
+# ---- Request / response shapes ----
+class AnalyzeRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=10_000)
+    lang: Optional[str] = None
+    model: str = Field("both", pattern="^(flan|groq|both|race)$")
+    reply: bool = True
+    budget_s: float = Field(REQUEST_BUDGET_S, gt=0, le=120)
+
+
+class BatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=API_MAX_BATCH_ITEMS)
+    lang: Optional[str] = None
+
+
+class ReplyRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=10_000)
+    stress_label: str
+    stress_score: float
+    signals: dict = Field(default_factory=dict)
+    model: str = Field("both", pattern="^(flan|groq|both|race)$")
+    context: str = ""
+    budget_s: float = Field(REQUEST_BUDGET_S, gt=0, le=120)
+
+
+def _stress_out(res: dict) -> dict:
+    vector = res.get("emotion_vector")
+    return {
+        "stress_label": res["stress_label"],
+        "stress_score": float(res["stress_score"]),
+        "emotions": {k: float(v) for k, v in (res.get("emotions") or {}).items()},
+        "emotion_vector": vector.tolist() if vector is not None else None,
+        "language": res.get("language"),
+    }
+
+
+def _redflags_out(redflags: dict) -> dict:
+    return {"red_flags": list(redflags["red_flags"]), "urgent": redflags["urgent"]}
+
+
+def _replies_out(replies: dict) -> dict:
+    return {k: v for k, v in replies.items() if v is not None}
+
+
+# ---- Readiness ----
+_preload_errors = {}
+_preloaded = threading.Event()
+
+
+def _preload():
+    """Load the default models in the background so /ready turns true without a first request."""
+    if INFERENCE_WORKERS > 0:
+        get_inference_pool()  # workers preload themselves
+    else:
+        for name in INFERENCE_PRELOAD:
+            try:
+                registry.get(name)
+            except Exception as e:
+                print(f"API preload of '{name}' failed:", e)
+                _preload_errors[name] = str(e)
+    _preloaded.set()
+
+
+def _readiness() -> dict:
+    if INFERENCE_WORKERS > 0:
+        pool = get_inference_pool()
+        ready = pool is not None and pool.ready_workers >= pool.workers
+        models = {"workers_ready": pool.ready_workers if pool is not None else 0, "workers": INFERENCE_WORKERS}
+    else:
+        # idle models evicted by the memory manager reload on use, so they do not unready the API
+        resident = registry.resident()
+        models = {name: name in resident for name in INFERENCE_PRELOAD}
+        ready = _preloaded.is_set() and not _preload_errors
+    return {"ready": ready, "models": models, "errors": dict(_preload_errors),
+            "mode": controller.mode, "vocabulary": vocab.current().version}
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    app.state.admission = _Admission()
+    app.state.batcher = _StressBatcher()
+    threading.Thread(target=_preload, name="api-preload", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="MindCare analysis API", lifespan=_lifespan)
+
+
+@app.middleware("http")
+async def _timing(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    metrics.observe(f"api.latency_ms.{request.url.path}", (time.perf_counter() - start) * 1000.0)
+    metrics.inc(f"api.responses.{response.status_code}")
+    return response
+
+
+@app.exception_handler(WorkerCrashed)
+async def _worker_crashed(request: Request, exc: WorkerCrashed):
+    # the pool has already started a replacement worker
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+
+# ---- Endpoints ----
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    state = _readiness()
+    if not state["ready"]:
+        raise HTTPException(503, detail=state)
+    return state
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return metrics.snapshot()
+
+
+@app.post("/analyze")
+async def analyze(req: AnalyzeRequest, request: Request):
+    async with request.app.state.admission.slot():
+        start = time.perf_counter()
+        deadline = Deadline(req.budget_s)
+        redflags = screen_redflags(req.text)  # fast lane first: never skipped or shed
+        with controller.request():
+            try:
+                stress = await request.app.state.batcher.classify(req.text, req.lang)
+                signals = await _call(extract_signals, req.text, redflags=redflags,
+                                      lang=stress.get("language"), deadline=deadline)
+                replies = None
+                if req.reply:
+                    replies = await _call(empathetic_reply, req.text, stress["stress_label"],
+                                          stress["stress_score"], signals, model=req.model, deadline=deadline)
+            except DeadlineExceeded as e:
+                audit("analysis", req.text, source="api", outcome="timeout", redflags=redflags)
+                raise HTTPException(504, str(e))
+        audit("analysis", req.text, source="api", model=req.model, mode=controller.mode,
+              latency_ms=round((time.perf_counter() - start) * 1000.0, 1), stress=stress,
+              signals=signals, redflags=redflags, responses=replies, deadline=deadline.outcomes or None)
+        return {
+            "redflags": _redflags_out(redflags),
+            "stress": _stress_out(stress),
+            "signals": signals.to_dict(),
+            "replies": _replies_out(replies) if replies is not None else None,
+            "deadline": deadline.outcomes,
+        }
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(req: BatchRequest, request: Request):
+    async with request.app.state.admission.slot():
+        with controller.request():
+            stress = await _call(detect_stress_batch, req.texts, lang=req.lang, batch_size=API_MAX_BATCH)
+            redflags = [screen_redflags(text) for text in req.texts]
+            signals = await asyncio.gather(*(
+                _call(extract_signals, text, redflags=rf, lang=res["language"])
+                for text, rf, res in zip(req.texts, redflags, stress)
+            ))
+            results = []
+            for text, rf, res, sig in zip(req.texts, redflags, stress, signals):
+                audit("analysis", text, source="api_batch", mode=controller.mode,
+                      stress=res, signals=sig, redflags=rf)
+                results.append({"redflags": _redflags_out(rf), "stress": _stress_out(res),
+                                "signals": sig.to_dict()})
+        return {"results": results}
+
+
+@app.post("/reply")
+async def reply(req: ReplyRequest, request: Request):
+    async with request.app.state.admission.slot():
+        deadline = Deadline(req.budget_s)
+        with controller.request():
+            replies = await _call(empathetic_reply, req.text, req.stress_label, req.stress_score,
+                                  Signals.from_dict(req.signals), model=req.model, context=req.context,
+                                  deadline=deadline)
+        return {"replies": _replies_out(replies), "deadline": deadline.outcomes}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _disconnected(request: Request):
+    """Resolves once the client of `request` has gone away."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(API_DISCONNECT_POLL_S)
+
+
+@app.post("/reply/stream")
+async def reply_stream(req: AnalyzeRequest, request: Request):
+    """
+    Server-Sent Events: "redflags", "stress", "signals", then one "reply" per generator as it
+    finishes (the faster one first), then "done" (or "error"). A client that disconnects while
+    replies are generating is noticed within API_DISCONNECT_POLL_S: the stream ends, the reply
+    results are discarded and the deadline is cancelled, which stops FLAN decoding at the next
+    token (in inference_pool workers too: the cancelled futures are passed on to the worker).
+    """
+    admission = request.app.state.admission
+    batcher = request.app.state.batcher
+    admission.check()  # reject before the 200 stream starts; the slot is taken inside
+
+    async def events():
+        async with admission.slot():
+            deadline = Deadline(req.budget_s)
+            redflags = screen_redflags(req.text)
+            yield _sse("redflags", _redflags_out(redflags))
+            with controller.request():
+                try:
+                    stress = await batcher.classify(req.text, req.lang)
+                    yield _sse("stress", _stress_out(stress))
+                    signals = await _call(extract_signals, req.text, redflags=redflags,
+                                          lang=stress.get("language"), deadline=deadline)
+                    yield _sse("signals", signals.to_dict())
+
+                    if req.model == "race":
+                        generators = ["race"]
+                    elif req.model == "both" and controller.allows("both_generators"):
+                        generators = ["flan", "groq"]
+                    elif req.model == "both":
+                        generators = [DEGRADE_PREFERRED_GENERATOR]
+                    else:
+                        generators = [req.model]
+                    pending = {asyncio.ensure_future(_call(empathetic_reply, req.text, stress["stress_label"],
+                                                           stress["stress_score"], signals, model=name,
+                                                           deadline=deadline))
+                               for name in generators}
+                    watcher = asyncio.ensure_future(_disconnected(request))
+                    try:
+                        while pending:
+                            done, _ = await asyncio.wait(pending | {watcher}, return_when=asyncio.FIRST_COMPLETED)
+                            if watcher in done:
+                                deadline.cancel()
+                                for fut in pending:
+                                    fut.cancel()
+                                metrics.inc("api.stream_disconnects")
+                                return
+                            for fut in done:
+                                pending.discard(fut)
+                                yield _sse("reply", _replies_out(fut.result()))
+                    finally:
+                        watcher.cancel()
+                        for fut in pending:
+                            fut.cancel()
+                except DeadlineExceeded as e:
+                    yield _sse("error", {"detail": str(e)})
+                    return
+                except Exception as e:
+                    # the 200 is already sent, so a failure must be an event the client can tell from "done"
+                    deadline.cancel()
+                    metrics.inc("api.stream_errors")
+                    print("Streaming analysis failed:", repr(e))
+                    yield _sse("error", {"detail": "analysis failed"})
+                    return
+            yield _sse("done", {"deadline": deadline.outcomes})
+            audit("analysis", req.text, source="api_stream", model=req.model, mode=controller.mode,
+                  stress=stress, signals=signals, redflags=redflags, deadline=deadline.outcomes or None)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the analysis pipeline over HTTP.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -149,10 +149,11 @@
 
 # app.py
 import streamlit as st
-import matplotlib.pyplot as plt
 
+from charts import show_bar_chart
 from classifier import detect_stress
 from extractor import extract_signals
+from redflags import screen_redflags
 from generate_response import empathetic_reply
 from evaluation import evaluate_classifier, evaluate_responses
 
@@ -187,24 +188,25 @@ if run:
     if not user_text.strip():
         st.warning("Please enter some text.")
     else:
+        # Red flag warning (fast lane, before any model runs)
+        redflags = screen_redflags(user_text)
+        if redflags["urgent"]:
+            st.error("⚠️ Red-flag phrases detected. If you’re in immediate danger or thinking about self-harm, please seek help now.")
+
         with st.spinner("Running models (may take ~10s first time)..."):
             res = detect_stress(user_text)
             score = res["stress_score"]
             label = res["stress_label"]
-            emotions = res.get("emotion_probs", {})
-            signals = extract_signals(user_text)
+            emotions = res.get("emotions", {})  # top-k labels
+            signals = extract_signals(user_text, redflags=redflags, lang=res.get("language"))
 
         # Stress classification
         st.subheader(f"Detected stress: **{label.capitalize()}** ({score:.2f})")
 
         # Emotion chart
         if emotions:
-            fig = plt.figure(figsize=(6, 3))
-            plt.bar(list(emotions.keys()), list(emotions.values()), color="skyblue")
-            plt.title("Emotion Probabilities")
-            plt.xlabel("Emotion")
-            plt.ylabel("Probability")
-            st.pyplot(fig)
+            show_bar_chart(emotions, "Emotion Probabilities", "Probability", xlabel="Emotion",
+                           figsize=(6, 3))
 
         # Extracted signals
         # with st.expander("Extracted signals (NER)", expanded=False):
@@ -214,18 +216,16 @@ if run:
         #         "coping": signals["coping"]
         #     })
 
-        # Red flag warning
-        if signals["urgent"]:
-            st.error("⚠️ Red-flag phrases detected. If you’re in immediate danger or thinking about self-harm, please seek help now.")
-
         # Supportive responses
         responses = empathetic_reply(user_text, label, score, signals)
         st.subheader("Supportive responses")
-        st.markdown("### 🤖 FLAN (local)")
-        st.markdown(responses["flan"])
-        st.markdown("---")
-        st.markdown("### ⚡ Groq (cloud)")
-        st.markdown(responses["groq"])
+        if responses["flan"]:
+            st.markdown("### 🤖 FLAN (local)")
+            st.markdown(responses["flan"])
+            st.markdown("---")
+        if responses["groq"]:
+            st.markdown("### ⚡ Groq (cloud)")
+            st.markdown(responses["groq"])
 
         st.markdown("---")
         st.caption("If you can, consider talking with a trusted friend or mental health professional.")
@@ -240,15 +240,10 @@ if run:
 
         # --- Classifier metrics bar chart ---
         st.markdown("### 🔍 Stress Classifier Metrics")
-        fig1 = plt.figure(figsize=(5, 3))
-        plt.bar(clf_metrics.keys(), clf_metrics.values(), color="skyblue")
-        plt.title("Classifier Evaluation")
-        plt.ylabel("Score")
-        plt.ylim(0, 1)  # keep metrics normalized
-        st.pyplot(fig1)
+        show_bar_chart(clf_metrics, "Classifier Evaluation", "Score", ylim=(0, 1))  # keep metrics normalized
 
         # response evaluation (demo with dummy references)
-        preds = [responses["flan"], responses["groq"]]
+        preds = [responses["flan"] or "", responses["groq"] or ""]
         refs = [
             "I understand this is tough. Try small breaks, breathing exercises, and talking to a friend.",
             "It sounds stressful. Maybe take a walk, journal your thoughts, and get some rest."
@@ -257,10 +252,6 @@ if run:
 
         # --- Response metrics bar chart ---
         st.markdown("### 💬 Response Quality Metrics")
-        fig2 = plt.figure(figsize=(5, 3))
-        plt.bar(resp_metrics.keys(), resp_metrics.values(), color="lightgreen")
-        plt.title("Response Evaluation (BLEU / ROUGE)")
-        plt.ylabel("Score")
-        plt.ylim(0, 1)
-        st.pyplot(fig2)
+        show_bar_chart(resp_metrics, "Response Evaluation (BLEU / ROUGE)", "Score",
+                       color="lightgreen", ylim=(0, 1))
 
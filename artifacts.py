@@ -0,0 +1,219 @@
+# artifacts.py
+# Local model artifacts: `python artifacts.py warmup` resolves every model the app uses into
+# ARTIFACT_DIR as safetensors; load_pipeline() builds pipelines from those files with the
+# weights memory-mapped, so several processes share one copy in the page cache.
+
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Tuple
+
+import torch
+from transformers import (
+    AutoConfig,
+    AutoModel,
+    AutoModelForSeq2SeqLM,
+    AutoModelForSequenceClassification,
+    AutoModelForTokenClassification,
+    AutoTokenizer,
+    pipeline,
+)
+
+import metrics
+from config import (
+    ARTIFACT_DIR,
+    EMBED_MODEL,
+    EMOTION_MODEL,
+    FLAN_DRAFT_MODEL,
+    FLAN_MODEL,
+    LANGUAGES,
+    MMAP_WEIGHTS,
+    NER_MODEL,
+    SEMANTIC_CACHE_ENABLED,
+    SENTIMENT_MODEL,
+)
+
+try:
+    from transformers.modeling_utils import no_init_weights
+except ImportError:  # older transformers: random init just costs a little start-up time
+    from contextlib import nullcontext as no_init_weights
+
+# model name -> auto class used to load it
+MODEL_SPECS = {
+    SENTIMENT_MODEL: AutoModelForSequenceClassification,
+    EMOTION_MODEL: AutoModelForSequenceClassification,
+    NER_MODEL: AutoModelForTokenClassification,
+    FLAN_MODEL: AutoModelForSeq2SeqLM,
+}
+for _models in LANGUAGES.values():
+    for _kind, _name in _models.items():
+        if _name:
+            MODEL_SPECS[_name] = (AutoModelForTokenClassification if _kind == "ner"
+                                  else AutoModelForSequenceClassification)
+if FLAN_DRAFT_MODEL:
+    MODEL_SPECS[FLAN_DRAFT_MODEL] = AutoModelForSeq2SeqLM
+if SEMANTIC_CACHE_ENABLED:
+    MODEL_SPECS[EMBED_MODEL] = AutoModel
+
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+# attribute on an mmap-loaded model holding its open mappings. They live and die with the
+# model: each tensor also keeps its mapping alive, so it is unmapped only when the last
+# tensor viewing it is collected. Never close() one explicitly.
+_MAPPINGS_ATTR = "_weight_mappings"
+
+
+def artifact_path(model_name: str) -> str:
+    return os.path.join(ARTIFACT_DIR, model_name.replace("/", "--"))
+
+
+def has_artifact(model_name: str) -> bool:
+    return bool(glob.glob(os.path.join(artifact_path(model_name), "*.safetensors")))
+
+
+def is_offline() -> bool:
+    return any(os.getenv(var, "").lower() in ("1", "true", "yes")
+               for var in ("HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE"))
+
+
+# --- Warmup ---
+def warmup(force: bool = False) -> Dict[str, dict]:
+    """
+    Download (if needed) and save every model in MODEL_SPECS as safetensors under ARTIFACT_DIR,
+    then load each artifact once. Returns {model: {"fetch_s", "load_ms"}}.
+    Raises RuntimeError when offline and anything is missing.
+    """
+    missing = [m for m in MODEL_SPECS if force or not has_artifact(m)]
+    if missing and is_offline():
+        raise RuntimeError(f"Offline and missing model artifacts: {', '.join(missing)}")
+
+    timings = {}
+    for name, auto_cls in MODEL_SPECS.items():
+        start = time.perf_counter()
+        if name in missing:
+            out = artifact_path(name)
+            auto_cls.from_pretrained(name).save_pretrained(out, safe_serialization=True)
+            AutoTokenizer.from_pretrained(name).save_pretrained(out)
+        fetched = time.perf_counter()
+        load_model(name)
+        timings[name] = {
+            "fetch_s": fetched - start,
+            "load_ms": (time.perf_counter() - fetched) * 1000.0,
+        }
+    return timings
+
+
+# --- Loading ---
+def _mmap_state_dict(path: str) -> Tuple[Dict[str, torch.Tensor], mmap.mmap]:
+    """Tensors viewing a copy-on-write mapping of a .safetensors file (no read into RAM), and the mapping."""
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    base = 8 + header_len
+    state = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dtype = _DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            state[key] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.tensor([], dtype=dtype).element_size()
+        state[key] = torch.frombuffer(mm, dtype=dtype, count=count, offset=base + start).view(info["shape"])
+    return state, mm
+
+
+def _load_mmap_model(model_name: str):
+    path = artifact_path(model_name)
+    with no_init_weights():
+        model = MODEL_SPECS[model_name].from_config(AutoConfig.from_pretrained(path))
+
+    state, mappings = {}, []
+    for file in sorted(glob.glob(os.path.join(path, "*.safetensors"))):
+        part, mm = _mmap_state_dict(file)
+        state.update(part)
+        mappings.append(mm)
+    missing, _ = model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+
+    # anything still missing must now be tied to a loaded tensor, or the weights are garbage
+    loaded = {t.data_ptr() for t in state.values()}
+    current = model.state_dict()
+    if any(current[k].data_ptr() not in loaded for k in missing):
+        print(f"{model_name}: incomplete mmap load, falling back to from_pretrained")
+        return MODEL_SPECS[model_name].from_pretrained(path, use_safetensors=True)
+    setattr(model, _MAPPINGS_ATTR, mappings)
+    return model.eval()
+
+
+def load_pipeline(task: str, model_name: str, **kwargs):
+    """
+    Build a pipeline from the local artifact when present (mmap-backed if MMAP_WEIGHTS),
+    otherwise from the hub. Fails fast when offline and the artifact is missing.
+    """
+    start = time.perf_counter()
+    if has_artifact(model_name):
+        path = artifact_path(model_name)
+        if MMAP_WEIGHTS and model_name in MODEL_SPECS:
+            model = _load_mmap_model(model_name)
+        else:
+            model = path
+        pipe = pipeline(task, model=model, tokenizer=AutoTokenizer.from_pretrained(path), **kwargs)
+    elif is_offline():
+        raise RuntimeError(
+            f"Offline and no artifact for {model_name} in {ARTIFACT_DIR}; run `python artifacts.py warmup`."
+        )
+    else:
+        pipe = pipeline(task, model=model_name, **kwargs)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    metrics.observe(f"model_load_ms.{model_name}", elapsed_ms)
+    print(f"Loaded {model_name} in {elapsed_ms:.0f} ms")
+    return pipe
+
+
+def load_model(model_name: str):
+    """Bare model (e.g. the FLAN draft model) from the artifact when present."""
+    if has_artifact(model_name):
+        if MMAP_WEIGHTS:
+            return _load_mmap_model(model_name)
+        return MODEL_SPECS[model_name].from_pretrained(artifact_path(model_name))
+    if is_offline():
+        raise RuntimeError(
+            f"Offline and no artifact for {model_name} in {ARTIFACT_DIR}; run `python artifacts.py warmup`."
+        )
+    return MODEL_SPECS[model_name].from_pretrained(model_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage local model artifacts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("warmup", help="resolve and cache every configured model")
+    warm.add_argument("--force", action="store_true", help="re-download existing artifacts")
+    args = parser.parse_args(argv)
+
+    if args.command == "warmup":
+        try:
+            timings = warmup(force=args.force)
+        except RuntimeError as e:
+            print(e)
+            return 1
+        for name, t in timings.items():
+            print(f"{name:50s} fetch {t['fetch_s']:7.2f}s  load {t['load_ms']:8.1f}ms  -> {artifact_path(name)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# audit.py
+# Server-side audit trail of analysis decisions (stress result, red flags / urgent, reply model
+# and winner, degradation mode, deadline outcomes). The request path only appends a tuple of
+# references to an in-memory queue; a writer thread builds the records, replaces the user text
+# with a keyed hash (AUDIT_TEXT_MODE "hash") or just its length ("redact"), writes NDJSON in
+# batches and fsyncs every AUDIT_FSYNC_INTERVAL_S. Segments rotate by size or age.
+# When the queue is full ordinary records are dropped (and counted); red-flag records go to a
+# separate unbounded queue that is never dropped and is fsynced as soon as it is written.
+
+import atexit
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+import metrics
+from signals import json_default
+from config import (
+    AUDIT_ENABLED, AUDIT_DIR, AUDIT_TEXT_MODE, AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE,
+    AUDIT_FSYNC_INTERVAL_S, AUDIT_SEGMENT_BYTES, AUDIT_SEGMENT_MAX_AGE_S,
+)
+
+
+_STRUCTURED = ("stress", "signals", "redflags", "responses")  # summarized by _encode, not copied
+
+
+def _is_red_flag(redflags, signals) -> bool:
+    if redflags and (redflags.get("urgent") or redflags.get("red_flags")):
+        return True
+    return bool(signals is not None and (signals.get("urgent") or signals.get("red_flags")))
+
+
+class AuditLog:
+    def __init__(self, directory: str = AUDIT_DIR, text_mode: str = AUDIT_TEXT_MODE,
+                 queue_size: int = AUDIT_QUEUE_SIZE):
+        self.directory = directory
+        self.text_mode = text_mode
+        self.queue_size = queue_size
+        key = os.getenv("MINDCARE_AUDIT_KEY")
+        if not key and text_mode == "hash":
+            print("MINDCARE_AUDIT_KEY not set; audit text hashes are only comparable within this process.")
+        self._key = key.encode("utf-8") if key else secrets.token_bytes(32)
+        self._queue = deque()
+        self._critical = deque()  # red-flag records, never dropped
+        self._wake = threading.Event()
+        self._closed = False
+        self._file = None
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- Request path ----
+    def record(self, event: str, user_text: str = "", **fields):
+        """Queue one record; returns immediately. Fields are read later by the writer thread."""
+        item = (time.time(), event, user_text, fields)
+        if _is_red_flag(fields.get("redflags"), fields.get("signals")):
+            self._critical.append(item)
+            self._wake.set()
+        elif len(self._queue) < self.queue_size:
+            self._queue.append(item)
+            if len(self._queue) == AUDIT_BATCH_SIZE:  # wake once per batch, not per record
+                self._wake.set()
+        else:
+            metrics.inc("audit.dropped")
+
+    # ---- Writer thread ----
+    def _text_fields(self, text: str) -> dict:
+        out = {"chars": len(text or "")}
+        if self.text_mode == "hash" and text:
+            out["text_hmac"] = hmac.new(self._key, text.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+        return out
+
+    def _encode(self, item) -> bytes:
+        ts, event, text, fields = item
+        stress = fields.get("stress") or {}
+        signals = fields.get("signals")
+        redflags = fields.get("redflags") or {}
+        responses = fields.get("responses") or {}
+        rec = {"ts": round(ts, 3), "event": event, **self._text_fields(text)}
+        if stress:
+            rec["stress_label"] = stress.get("stress_label")
+            rec["stress_score"] = round(float(stress.get("stress_score", 0.0)), 4)
+            rec["language"] = stress.get("language")
+        if signals is not None:
+            # counts only: trigger terms are named entities from the user's text
+            rec["signals"] = {key: len(signals.get(key) or ()) for key in ("triggers", "symptoms", "coping")}
+            rec["red_flags"] = list(signals.get("red_flags") or ())
+        elif redflags:
+            rec["red_flags"] = list(redflags.get("red_flags") or ())
+        rec["urgent"] = bool(redflags.get("urgent") or (signals is not None and signals.get("urgent")))
+        if responses:
+            rec["generators"] = sorted(k for k in ("flan", "groq") if responses.get(k))
+            if responses.get("winner"):
+                rec["winner"] = responses["winner"]
+        rec.update({k: v for k, v in fields.items() if v is not None and k not in _STRUCTURED})
+        return json.dumps(rec, separators=(",", ":"), default=json_default).encode("utf-8") + b"\n"
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"audit-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.ndjson"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        self._opened_at = time.time()
+        metrics.inc("audit.segments")
+
+    def _rotate_if_needed(self):
+        if self._file is None:
+            return
+        if (self._file.tell() >= AUDIT_SEGMENT_BYTES
+                or time.time() - self._opened_at >= AUDIT_SEGMENT_MAX_AGE_S):
+            self._fsync()
+            self._file.close()
+            self._file = None
+
+    def _fsync(self):
+        if self._file is None:
+            return
+        start = time.perf_counter()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.time()
+        metrics.observe("audit.fsync_ms", (time.perf_counter() - start) * 1000.0)
+
+    def _write_batch(self) -> int:
+        critical = []
+        while self._critical:
+            critical.append(self._critical.popleft())
+        batch = list(critical)
+        while self._queue and len(batch) < AUDIT_BATCH_SIZE * 4:
+            batch.append(self._queue.popleft())
+        if not batch:
+            return 0
+        data = []
+        for item in batch:
+            try:
+                data.append(self._encode(item))
+            except Exception as e:
+                print("Audit record could not be encoded:", e)
+                metrics.inc("audit.encode_failed")
+        try:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(b"".join(data))
+            if critical or time.time() - self._last_fsync >= AUDIT_FSYNC_INTERVAL_S:
+                self._fsync()
+            else:
+                self._file.flush()
+        except OSError:
+            self._critical.extendleft(reversed(critical))  # retried on the next pass
+            metrics.inc("audit.dropped", len(batch) - len(critical))
+            raise
+        metrics.inc("audit.written", len(data))
+        metrics.inc("audit.written_red_flag", len(critical))
+        metrics.set_gauge("audit.queue_depth", len(self._queue))
+        self._rotate_if_needed()
+        return len(batch)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(AUDIT_FSYNC_INTERVAL_S)
+            self._wake.clear()
+            try:
+                while self._write_batch():
+                    pass
+                if self._file is not None and time.time() - self._last_fsync >= AUDIT_FSYNC_INTERVAL_S:
+                    self._fsync()
+                self._rotate_if_needed()
+            except OSError as e:
+                print("Audit log write failed:", e)
+                metrics.inc("audit.write_failed")
+                time.sleep(1.0)
+
+    def close(self):
+        """Write everything still queued and fsync (also runs at interpreter exit)."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        try:
+            while self._write_batch():
+                pass
+            self._fsync()
+        except OSError as e:
+            print("Audit log write failed:", e)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_audit_log():
+    """Shared audit log, or None when AUDIT_ENABLED is off."""
+    global _log
+    if not AUDIT_ENABLED:
+        return None
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = AuditLog()
+    return _log
+
+
+def audit(event: str, user_text: str = "", **fields):
+    """record() on the shared log; a no-op when auditing is disabled."""
+    log = get_audit_log()
+    if log is not None:
+        log.record(event, user_text, **fields)
@@ -0,0 +1,112 @@
+# charts.py
+# Plotly figures for the Streamlit dashboards, memoized per user on the trend history
+# version (number of recorded messages). Streamlit reruns on every widget interaction;
+# unchanged history reuses the cached figure and new messages are appended to the
+# existing trace instead of rebuilding the DataFrame and figure.
+# show_bar_chart() draws the one-off matplotlib bar charts of app.py.
+
+import plotly.express as px
+
+from config import TREND_RECENT_POINTS
+
+
+def show_bar_chart(values: dict, title: str, ylabel: str, xlabel: str = None,
+                   color: str = "skyblue", ylim=None, figsize=(5, 3)):
+    """Render a matplotlib bar chart of `values` with st.pyplot."""
+    import matplotlib.pyplot as plt
+    import streamlit as st
+
+    fig = plt.figure(figsize=figsize)
+    plt.bar(list(values.keys()), list(values.values()), color=color)
+    plt.title(title)
+    if xlabel:
+        plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    if ylim is not None:
+        plt.ylim(*ylim)
+    st.pyplot(fig)
+    plt.close(fig)  # release the figure; pyplot keeps every open one alive
+
+
+def _add_zones(fig):
+    # Add color zones
+    fig.add_hline(y=0.7, line_dash="dash", line_color="red",
+                  annotation_text="High Stress Zone")
+    fig.add_hline(y=0.4, line_dash="dash", line_color="orange",
+                  annotation_text="Medium Stress Zone")
+    fig.update_layout(height=400)
+    return fig
+
+
+def build_stress_chart(engine):
+    """Stress chart from scratch: raw recent points, or daily means with EMA and p10-p90 band."""
+    if engine.summary()['count'] <= TREND_RECENT_POINTS:
+        df = engine.recent_points()
+        fig = px.line(df, x='timestamp', y='stress_score',
+                      title='Stress Level Over Time',
+                      labels={'stress_score': 'Stress Score', 'timestamp': 'Time'},
+                      color_discrete_sequence=['#2196F3'])
+    else:
+        # long-term users: daily means with EMA and rolling 10th-90th percentile band
+        df = engine.percentile_bands('daily').reset_index(names='timestamp')
+        fig = px.line(df, x='timestamp', y=['mean', 'ema'],
+                      title='Stress Level Over Time (daily)',
+                      labels={'value': 'Stress Score', 'timestamp': 'Day'},
+                      color_discrete_sequence=['#2196F3', '#9C27B0'])
+        fig.add_scatter(x=df['timestamp'], y=df['p90'], mode='lines', line_width=0,
+                        showlegend=False, hoverinfo='skip')
+        fig.add_scatter(x=df['timestamp'], y=df['p10'], mode='lines', line_width=0,
+                        fill='tonexty', fillcolor='rgba(33,150,243,0.15)', name='p10-p90')
+    return _add_zones(fig)
+
+
+def cached_stress_chart(engine, cache: dict):
+    """
+    Stress chart for `engine` using `cache` (a per-user dict kept in session state).
+    Same version -> cached figure; raw-point chart that only grew -> points appended.
+    """
+    version = engine.summary()['count']
+    if not version:
+        return None
+    entry = cache.get('stress')
+    if entry and entry['version'] == version:
+        return entry['fig']
+
+    raw = version <= TREND_RECENT_POINTS
+    if entry and raw and entry['raw'] and version > entry['version']:
+        fig = entry['fig']
+        new = engine.recent_points().iloc[-(version - entry['version']):]
+        trace = fig.data[0]
+        trace.x = tuple(trace.x) + tuple(new['timestamp'])
+        trace.y = tuple(trace.y) + tuple(new['stress_score'])
+    else:
+        fig = build_stress_chart(engine)
+    cache['stress'] = {'version': version, 'raw': raw, 'fig': fig}
+    return fig
+
+
+def cached_emotion_chart(engine, cache: dict):
+    """Average-emotion bar chart; updated in place when only the averages changed."""
+    version = engine.summary()['count']
+    entry = cache.get('emotion')
+    if entry and entry['version'] == version:
+        return entry['fig']
+
+    avg_emotions = engine.emotion_means()
+    if not avg_emotions:
+        return None
+    labels, values = list(avg_emotions.keys()), list(avg_emotions.values())
+
+    if entry and entry['fig'] is not None and list(entry['fig'].data[0].x) == labels:
+        fig = entry['fig']
+        fig.data[0].y = values
+        fig.data[0].marker.color = values
+    else:
+        fig = px.bar(x=labels, y=values,
+                     title='Average Emotion Distribution',
+                     labels={'x': 'Emotion', 'y': 'Average Score'},
+                     color=values,
+                     color_continuous_scale='viridis')
+        fig.update_layout(height=400)
+    cache['emotion'] = {'version': version, 'fig': fig}
+    return fig
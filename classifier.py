@@ -1,36 +1,58 @@
 # classifier.py
-from transformers import pipeline
+from artifacts import load_pipeline
+from config import DEFAULT_LANGUAGE, LANGUAGES
+from degradation import controller
+from deadline import Deadline, unbounded
+from language import route_language
+from registry import registry
+from preprocessing import classify
+from emotions import to_vectors, top_k, as_dict
 
-_sentiment_pipe = None
-_emotion_pipe = None
+# some checkpoints (e.g. twitter-roberta-base-sentiment) only expose generic label ids
+_SENTIMENT_LABELS = {"label_0": "negative", "label_1": "neutral", "label_2": "positive"}
 
 
-def get_sentiment_pipe():
-    global _sentiment_pipe
-    if _sentiment_pipe is None:
-        _sentiment_pipe = pipeline(
-            "text-classification",
-            model="cardiffnlp/twitter-roberta-base-sentiment",
-            framework="pt"
-        )
-    return _sentiment_pipe
+def _model_key(kind: str, lang: str) -> str:
+    """Registry key for a per-language classification model, registered on first use."""
+    key = f"{kind}:{lang}"
+    model = LANGUAGES[lang][kind]
+    registry.register(key, lambda: load_pipeline(
+        "text-classification",
+        model,
+        framework="pt"
+    ))
+    return key
 
 
-def get_stress_score(text: str):
+# default-language models are registered up front, others on their first routed message
+_model_key("sentiment", DEFAULT_LANGUAGE)
+_model_key("emotion", DEFAULT_LANGUAGE)
+
+
+def get_sentiment_pipe(lang: str = DEFAULT_LANGUAGE):
+    return registry.get(_model_key("sentiment", lang))
+
+
+def get_stress_score(text: str, lang: str = DEFAULT_LANGUAGE):
     """
     Approximate stress detection using sentiment.
     Negative sentiment => high stress
     Neutral => medium
     Positive => low stress
     """
-    pipe = get_sentiment_pipe()
-    results = pipe(text)
+    with registry.use(_model_key("sentiment", lang)) as pipe:
+        probs, labels = classify(pipe, [text])
+    return _sentiment_to_stress(_best(probs[0], labels))
+
+
+def _best(probs, labels) -> dict:
+    i = int(probs.argmax())
+    return {"label": labels[i], "score": float(probs[i])}
 
-    if not results or not isinstance(results, list):
-        return {"stress_label": "unknown", "stress_score": 0.0}
 
-    best = max(results, key=lambda x: x["score"])
+def _sentiment_to_stress(best: dict) -> dict:
     label = best["label"].lower()
+    label = _SENTIMENT_LABELS.get(label, label)
 
     # Map sentiment -> stress
     if "negative" in label:
@@ -45,48 +67,95 @@ def get_stress_score(text: str):
 # -----------------------------
 # Emotion Detection Pipeline
 # -----------------------------
-def get_emotion_pipe():
-    global _emotion_pipe
-    if _emotion_pipe is None:
-        _emotion_pipe = pipeline(
-            "text-classification",
-            model="j-hartmann/emotion-english-distilroberta-base",
-            framework="pt"
-        )
-    return _emotion_pipe
-
-
-def get_emotion_probs(text: str):
+def get_emotion_pipe(lang: str = DEFAULT_LANGUAGE):
+    return registry.get(_model_key("emotion", lang))
+
+
+def get_emotion_vector(text: str, lang: str = DEFAULT_LANGUAGE):
     """
     Run emotion classification on text.
-    Returns: dict mapping emotion -> score
+    Returns: float32 vector in EMOTION_LABELS order (None if the language has no emotion model)
     """
-    pipe = get_emotion_pipe()
-    results = pipe(text)
+    if not LANGUAGES[lang].get("emotion"):
+        return None
+    with registry.use(_model_key("emotion", lang)) as pipe:
+        probs, labels = classify(pipe, [text])
+    return to_vectors(probs, labels)[0]
 
-    if not results or not isinstance(results, list):
-        return {}
 
-    return {r["label"].lower(): float(r["score"]) for r in results}
+def get_emotion_probs(text: str, lang: str = DEFAULT_LANGUAGE):
+    """Returns: dict mapping emotion -> score ({} if the language has no emotion model)"""
+    return as_dict(get_emotion_vector(text, lang))
 
 # -----------------------------
 # Combined Stress + Emotion
 # -----------------------------
-def detect_stress(text: str):
+def detect_stress(text: str, lang: str = None, deadline: Deadline = None):
     """
-    Combined stress + emotion classification.
+    Combined stress + emotion classification, routed by language
+    (detected when `lang` is None). Unsupported languages skip inference.
+    Raises DeadlineExceeded if `deadline` has already run out.
     Returns:
       {
         "stress_label": str,
         "stress_score": float,
-        "emotions": dict
+        "emotions": dict,             # top EMOTION_TOP_K labels only
+        "emotion_vector": np.ndarray, # float32 in EMOTION_LABELS order, or None
+        "language": str
       }
     """
-    stress = get_stress_score(text)
-    emotions = get_emotion_probs(text)
+    deadline = deadline or unbounded()
+    deadline.check("detect_stress")
+    lang, supported = route_language(text, lang)
+    if not supported:
+        return {"stress_label": "unknown", "stress_score": 0.0, "emotions": {},
+                "emotion_vector": None, "language": lang}
+
+    with controller.stage("detect_stress"):
+        stress = get_stress_score(text, lang)
+        vector = get_emotion_vector(text, lang)
+    deadline.record("detect_stress", "ok")
 
     return {
         "stress_label": stress["stress_label"],
         "stress_score": stress["stress_score"],
-        "emotions": emotions,
+        "emotions": top_k(vector),
+        "emotion_vector": vector,
+        "language": lang,
     }
+
+
+def detect_stress_batch(texts, lang: str = None, batch_size: int = 16):
+    """
+    detect_stress() over many texts: messages are grouped by routed language and each
+    group goes through the pipelines as one batched call. Results keep the input order.
+    """
+    out = [None] * len(texts)
+    groups = {}
+    for i, text in enumerate(texts):
+        routed, supported = route_language(text, lang)
+        if not supported:
+            out[i] = {"stress_label": "unknown", "stress_score": 0.0, "emotions": {},
+                      "emotion_vector": None, "language": routed}
+        else:
+            groups.setdefault(routed, []).append(i)
+
+    for routed, idx in groups.items():
+        batch = [texts[i] for i in idx]
+        sentiments, emotions = [], []
+        with controller.stage("detect_stress"):
+            for start in range(0, len(batch), batch_size):
+                chunk = batch[start:start + batch_size]
+                with registry.use(_model_key("sentiment", routed)) as pipe:
+                    probs, labels = classify(pipe, chunk)
+                sentiments += [_best(p, labels) for p in probs]
+                if LANGUAGES[routed].get("emotion"):
+                    with registry.use(_model_key("emotion", routed)) as pipe:
+                        probs, labels = classify(pipe, chunk)
+                    emotions += list(to_vectors(probs, labels))
+                else:
+                    emotions += [None] * len(chunk)
+        for j, i in enumerate(idx):
+            out[i] = {**_sentiment_to_stress(sentiments[j]), "emotions": top_k(emotions[j]),
+                      "emotion_vector": emotions[j], "language": routed}
+    return out
@@ -1,6 +1,8 @@
 # config.py
 # small central place for settings
 
+import os
+
 # device: -1 -> CPU, >=0 -> GPU device id
 DEVICE = -1
 
@@ -8,8 +10,167 @@ DEVICE = -1
 STRESS_THRESHOLD = 0.5
 
 # Models (change if you want lighter/heavier)
+SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment"
 EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
 NER_MODEL = "dslim/bert-base-NER"
 FLAN_MODEL = "google/flan-t5-small"  # faster than base
 
 
+
+# red-flag fast lane: latency budget (ms) for screen_redflags on a typical message
+REDFLAG_BUDGET_MS = 1.0
+
+# semantic response cache (opt-in): reuse replies for near-duplicate messages
+SEMANTIC_CACHE_ENABLED = False
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92  # cosine similarity needed for a hit
+SEMANTIC_CACHE_MAX_ENTRIES = 5000
+SEMANTIC_CACHE_PATH = "cache/semantic_cache"  # None -> memory only
+
+# FLAN generation profiles (kwargs passed to generate(); "assisted" uses FLAN_DRAFT_MODEL)
+GEN_PROFILES = {
+    "fast": {"max_new_tokens": 80, "num_beams": 1, "do_sample": False},
+    "balanced": {"max_new_tokens": 120},
+    "quality": {"max_new_tokens": 120, "num_beams": 4, "no_repeat_ngram_size": 3, "early_stopping": True},
+    "speculative": {"max_new_tokens": 120, "num_beams": 1, "do_sample": False, "assisted": True},
+}
+DEFAULT_GEN_PROFILE = "balanced"
+# automatic step-down: in-flight FLAN calls at which each profile kicks in
+AUTO_PROFILE_QUEUE_DEPTH = {"fast": 4}
+FLAN_LATENCY_SLO_MS = 4000  # p95 above this steps the auto choice down one profile
+FLAN_DRAFT_MODEL = None  # e.g. "google/flan-t5-small" when FLAN_MODEL is base/large
+
+# load shedding: pressure = max(in-flight / DEGRADE_MAX_INFLIGHT, request latency / budget)
+DEGRADE_MAX_INFLIGHT = 8
+DEGRADE_LATENCY_BUDGET_MS = 8000
+# pressure at which each step turns on: no Groq fallback, single generator, greedy FLAN, templates
+DEGRADE_THRESHOLDS = [0.6, 0.75, 0.9, 1.1]
+DEGRADE_RECOVERY_FACTOR = 0.8  # step back up once pressure < threshold * factor
+DEGRADE_STAGE_HALF_LIFE_S = 30.0  # a stage average halves per this many seconds without samples
+DEGRADE_PREFERRED_GENERATOR = "groq"  # kept when "both" is requested under load (remote = no local CPU)
+
+# local model artifacts (safetensors) written by `python artifacts.py warmup`
+ARTIFACT_DIR = os.getenv("MINDCARE_ARTIFACT_DIR", "artifacts")
+MMAP_WEIGHTS = True  # memory-map artifact weights so processes share the page cache
+
+# model registry: concurrent inference calls allowed per model, and torch intra-op threads
+MODEL_INFERENCE_SLOTS = 1
+TORCH_NUM_THREADS = int(os.getenv("MINDCARE_TORCH_THREADS", "0")) or None  # None -> cores / models
+
+# memory manager: unload idle models and shed models above an RSS watermark
+MODEL_IDLE_TTL_S = 1800  # 0 -> never evict for idleness
+MEMORY_RSS_WATERMARK_MB = 0  # 0 -> no watermark
+MEMORY_CHECK_INTERVAL_S = 30
+
+# languages: per-language models (None -> stage skipped for that language)
+DEFAULT_LANGUAGE = "en"
+LANGUAGES = {
+    "en": {"sentiment": SENTIMENT_MODEL, "emotion": EMOTION_MODEL, "ner": NER_MODEL},
+    "es": {
+        "sentiment": "cardiffnlp/twitter-xlm-roberta-base-sentiment",
+        "emotion": None,
+        "ner": "Davlan/bert-base-multilingual-cased-ner-hrl",
+    },
+}
+# "reject": unsupported languages skip local inference; "default": route to DEFAULT_LANGUAGE models
+UNSUPPORTED_LANGUAGE_POLICY = "reject"
+LANGID_MODEL_PATH = os.getenv("MINDCARE_LANGID_MODEL")  # optional fastText lid.176.ftz
+
+# multi-turn context: token budget for the rolling summary of earlier turns
+CONTEXT_TOKEN_BUDGET = 96
+CONTEXT_RECENT_TURNS = 3  # earlier turns kept as short lines, older ones only as keywords
+
+# longitudinal stress trends (per-user aggregates persisted across sessions)
+TREND_STORE_DIR = "data/trends"
+TREND_EMA_ALPHA = 0.3
+TREND_SPIKE_Z = 2.5  # |score - EMA| in running std-devs that counts as a spike
+TREND_CUSUM_K = 0.05  # CUSUM slack and decision threshold for change points
+TREND_CUSUM_H = 0.5
+TREND_HOURLY_RETENTION_DAYS = 90
+TREND_RECENT_POINTS = 200  # raw points kept for fine-grained charts
+TREND_SAVE_INTERVAL_S = 5.0  # a user's store is written at most this often (and at exit)
+TREND_ANON_MAX_ENGINES = 500  # anonymous sessions' in-memory engines kept (least recently used dropped)
+
+# background analysis jobs for the Streamlit UI
+UI_JOB_WORKERS = 4  # shared across sessions; a cancelled job frees its worker at the next stage
+UI_POLL_INTERVAL_S = 0.5  # rerun interval while a job is still running
+UI_JOB_DEADLINE_GRACE_S = 2.0  # past its deadline plus this, a job still running is marked failed
+
+# Groq structured extraction fallback in extract_signals
+GROQ_EXTRACT_MODEL = "llama3-8b-8192"
+GROQ_EXTRACT_CACHE_SIZE = 1024  # results (including empty ones) cached per normalized text
+GROQ_EXTRACT_MIN_CALLS = 20  # completed responses in the window before the yield is judged
+GROQ_EXTRACT_MIN_YIELD = 0.2  # fraction of recent responses that must return at least one signal
+GROQ_EXTRACT_YIELD_WINDOW = 100  # most recent completed responses the yield is computed over
+GROQ_EXTRACT_PROBE_INTERVAL_S = 60.0  # while skipped for low yield, let one call through this often
+
+# race mode: run FLAN and Groq concurrently, first reply passing the quality gate wins
+RACE_LOSER_POLICY = "cancel"  # "cancel" the slower generator, or let it "finish" into the semantic cache
+RACE_TIMEOUT_S = 30.0
+RACE_MIN_CHARS = 40
+RACE_MAX_CHARS = 1500
+RACE_MIN_DISTINCT_RATIO = 0.5  # distinct / total word trigrams below this counts as repetitive
+
+# offline evaluation harness (python evaluation.py run data.jsonl)
+EVAL_CACHE_DIR = "cache/eval"
+EVAL_BATCH_SIZE = 16
+
+# red-flag benchmark gates (python redflag_bench.py exits non-zero when one is missed)
+REDFLAG_BENCH_MIN_RECALL = 0.995
+REDFLAG_BENCH_MAX_FPR = 0.005
+REDFLAG_BENCH_MAX_P99_MS = REDFLAG_BUDGET_MS
+
+# keyword vocabularies (red flags, symptoms, coping), hot-reloaded when the file changes
+VOCAB_PATH = os.getenv("MINDCARE_VOCAB_PATH", "vocab/vocabulary.json")
+VOCAB_RELOAD_INTERVAL_S = 5  # 0 disables the watcher
+REDFLAG_URGENT_WEIGHT = 1.0  # summed weight of non-negated red-flag hits that makes a message urgent
+SIGNALS_VOCAB_MAX_TERMS = 1024  # per keyword category; free-text Groq terms beyond it are dropped
+
+# shared tokenization for the classification models
+MAX_SEQ_LEN = 256  # tokens; longer messages are truncated explicitly
+TOKEN_CACHE_SIZE = 4096  # cached encodings (per tokenizer definition and text)
+
+# emotion vectors: fixed label order shared by every emotion model, storage and charts
+EMOTION_LABELS = ["anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise"]
+EMOTION_TOP_K = 3  # labels kept in the sparse "emotions" dict of detect_stress results
+
+# process-pool inference (0 = run models in the calling process)
+INFERENCE_WORKERS = int(os.getenv("MINDCARE_INFERENCE_WORKERS", "0"))
+INFERENCE_CORES_PER_WORKER = int(os.getenv("MINDCARE_CORES_PER_WORKER", "0")) or None  # None -> cores / workers
+INFERENCE_PRELOAD = [f"{kind}:{DEFAULT_LANGUAGE}" for kind in ("sentiment", "emotion", "ner")]  # loaded by each worker at start
+INFERENCE_HEALTH_CHECK_S = 1.0  # how often dead workers are looked for (their requests fail, they restart)
+INFERENCE_CANCEL_POLL_S = 0.1  # how often callers' cancelled deadlines are passed on to workers
+
+# request deadlines (seconds); stages below their minimum remaining budget are skipped
+REQUEST_BUDGET_S = float(os.getenv("MINDCARE_REQUEST_BUDGET_S", "20"))
+DEADLINE_MIN_GROQ_FALLBACK_S = 2.0     # Groq extraction fallback in extract_signals
+DEADLINE_MIN_SECOND_GENERATOR_S = 6.0  # second reply generator in "both" mode
+DEADLINE_MIN_GENERATION_S = 1.0        # any live generation; below this the templated reply is used
+
+# response bank: curated replies per (stress label, symptoms, coping), served before live generation
+RESPONSE_BANK_ENABLED = False
+RESPONSE_BANK_PATH = "cache/response_bank.json"  # written by `python response_bank.py build`
+RESPONSE_BANK_MIN_SUPPORT = 5  # historical messages a combination needs to get an entry
+RESPONSE_BANK_VARIANTS = 3     # curated replies kept per combination
+
+# audit log: NDJSON records of analysis decisions, written off the request path
+AUDIT_ENABLED = True
+AUDIT_DIR = os.getenv("MINDCARE_AUDIT_DIR", "data/audit")
+AUDIT_TEXT_MODE = "hash"  # "hash": keyed HMAC of the text (key: MINDCARE_AUDIT_KEY); "redact": length only
+AUDIT_QUEUE_SIZE = 10000  # queued records before ordinary ones are dropped (red-flag records never are)
+AUDIT_BATCH_SIZE = 256
+AUDIT_FSYNC_INTERVAL_S = 1.0  # red-flag records are fsynced immediately
+AUDIT_SEGMENT_BYTES = 64 * 1024 * 1024
+AUDIT_SEGMENT_MAX_AGE_S = 24 * 3600
+
+# HTTP API (python api.py): admission control and request batching
+API_HOST = os.getenv("MINDCARE_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("MINDCARE_API_PORT", "8000"))
+API_WORKERS = 8            # threads running pipeline stages (when INFERENCE_WORKERS is 0)
+API_MAX_INFLIGHT = 16      # requests processed concurrently
+API_MAX_QUEUED = 64        # requests waiting for a slot; beyond this -> 503 with Retry-After
+RACE_POOL_WORKERS = 2 * API_MAX_INFLIGHT  # reply race threads: both generators of every in-flight request
+API_BATCH_WINDOW_MS = 10   # concurrent /analyze classifications within this window share one batch
+API_MAX_BATCH = 16
+API_MAX_BATCH_ITEMS = 256  # texts accepted by /analyze/batch
+API_DISCONNECT_POLL_S = 0.25  # how often /reply/stream checks whether its client is gone
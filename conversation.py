@@ -0,0 +1,90 @@
+# conversation.py
+# Rolling, token-budgeted summary of earlier turns so generators can see the conversation
+# without the prompt growing with it. One ConversationContext lives per session.
+
+import re
+from collections import Counter, deque
+from typing import Callable, List, Optional
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_RECENT_TURNS
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_TOP_K = 4  # keywords kept per category in the long-term part of the summary
+_TURN_TOKENS = 20  # tokens kept from each recent turn
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap subword-count estimate (words and punctuation, +30% for word pieces)."""
+    return int(len(_TOKEN_RE.findall(text)) * 1.3 + 0.5)
+
+
+def _truncate(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    words = text.split()
+    while words and count(" ".join(words)) > max_tokens:
+        words = words[:-1]
+    return " ".join(words)
+
+
+class ConversationContext:
+    """
+    Incrementally maintained summary of a session:
+      - long-term: stress trajectory and most frequent symptoms/triggers/coping so far
+      - short-term: first sentence of the last CONTEXT_RECENT_TURNS user messages
+    render() is cached and always fits in `budget_tokens`.
+    """
+
+    def __init__(self, budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+                 recent_turns: int = CONTEXT_RECENT_TURNS,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self.budget_tokens = budget_tokens
+        self.count_tokens = count_tokens or approx_tokens
+        self.turns = 0
+        self.stress_labels: List[str] = []
+        self.keywords = {"symptoms": Counter(), "triggers": Counter(), "coping": Counter()}
+        self.recent = deque(maxlen=recent_turns)
+        self._rendered = ""
+
+    def add_turn(self, user_text: str, stress_label: str = None, signals: dict = None):
+        """Fold one finished turn into the summary (O(1) in conversation length)."""
+        self.turns += 1
+        if stress_label:
+            if not self.stress_labels or self.stress_labels[-1] != stress_label:
+                self.stress_labels.append(stress_label)
+                self.stress_labels = self.stress_labels[-4:]
+        for key, counter in self.keywords.items():
+            counter.update((signals or {}).get(key) or [])
+
+        first = _SENTENCE_RE.split((user_text or "").strip(), maxsplit=1)[0]
+        self.recent.append(_truncate(first, _TURN_TOKENS, self.count_tokens))
+        self._rendered = self._render()
+
+    def _render(self) -> str:
+        if not self.turns:
+            return ""
+        parts = []
+        if self.stress_labels:
+            parts.append("stress " + " -> ".join(self.stress_labels))
+        for key, counter in self.keywords.items():
+            top = [w for w, _ in counter.most_common(_TOP_K)]
+            if top:
+                parts.append(f"{key}: {', '.join(top)}")
+        long_term = "; ".join(parts)
+
+        # drop the oldest recent turns first, then trim the long-term part
+        recent = list(self.recent)
+        while True:
+            text = long_term
+            if recent:
+                text = (text + ". " if text else "") + "Recently said: " + " | ".join(recent)
+            if self.count_tokens(text) <= self.budget_tokens or not recent:
+                break
+            recent.pop(0)
+        return _truncate(text, self.budget_tokens, self.count_tokens)
+
+    def render(self) -> str:
+        """Summary of all turns added so far ('' before the first turn)."""
+        return self._rendered
+
+    def clear(self):
+        self.__init__(self.budget_tokens, self.recent.maxlen, self.count_tokens)
@@ -0,0 +1,87 @@
+# deadline.py
+# Per-request time budget threaded through detect_stress -> extract_signals -> empathetic_reply.
+# Stages ask it whether an optional step still fits (Groq extraction fallback, the second
+# generator), pass remaining() as the timeout of remote calls, and stop FLAN decoding once it
+# expires or is cancelled. Every stage records its outcome ("ok", "skipped", "timeout") on the
+# deadline and in metrics as deadline.<stage>.<outcome>.
+
+import math
+import threading
+import time
+
+import metrics
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """
+    `budget_s` None means unbounded (only cancellation applies). The expiry is on the
+    system-wide monotonic clock, so a pickled Deadline stays valid in inference_pool workers;
+    the cancel event and recorded outcomes stay in the process that created it.
+    """
+
+    def __init__(self, budget_s: float = None, cancel: threading.Event = None):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s if budget_s is not None else math.inf
+        self._cancel = cancel if cancel is not None else threading.Event()
+        self.outcomes = {}
+
+    def remaining(self) -> float:
+        """Seconds left (0.0 once cancelled or expired, inf when unbounded)."""
+        if self._cancel.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def timeout(self, cap: float = None):
+        """Timeout for a remote call: the remaining budget, capped; None if unbounded and uncapped."""
+        remaining = self.remaining()
+        if cap is not None:
+            remaining = min(remaining, cap)
+        return None if math.isinf(remaining) else remaining
+
+    def record(self, stage: str, outcome: str):
+        self.outcomes[stage] = outcome
+        metrics.inc(f"deadline.{stage}.{outcome}")
+
+    def allows(self, stage: str, min_s: float) -> bool:
+        """Whether at least `min_s` is left for an optional stage; records "skipped" if not."""
+        if self.remaining() >= min_s:
+            return True
+        self.record(stage, "skipped")
+        return False
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded (recorded as "timeout") if a required stage cannot start."""
+        if self.expired():
+            self.record(stage, "timeout")
+            raise DeadlineExceeded(f"deadline exceeded before {stage}")
+
+    def __getstate__(self):
+        return {"budget_s": self.budget_s, "expires_at": self.expires_at,
+                "cancelled": self._cancel.is_set(), "outcomes": dict(self.outcomes)}
+
+    def __setstate__(self, state):
+        self.budget_s = state["budget_s"]
+        self.expires_at = state["expires_at"]
+        self._cancel = threading.Event()
+        if state["cancelled"]:
+            self._cancel.set()
+        self.outcomes = state["outcomes"]
+
+
+def unbounded() -> Deadline:
+    """Deadline for callers that did not pass one."""
+    return Deadline()
@@ -0,0 +1,133 @@
+# degradation.py
+# Load-shedding controller: tracks in-flight requests and stage latencies and steps the
+# pipeline down gracefully under load. Red-flag screening (redflags.py) never consults
+# this controller, so it stays on in every mode.
+
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from config import (
+    DEGRADE_MAX_INFLIGHT,
+    DEGRADE_LATENCY_BUDGET_MS,
+    DEGRADE_THRESHOLDS,
+    DEGRADE_RECOVERY_FACTOR,
+    DEGRADE_STAGE_HALF_LIFE_S,
+)
+
+# Modes in order of increasing degradation; mode i switches off everything below it
+MODES = ["full", "no_groq_fallback", "single_generator", "greedy", "templated"]
+
+# feature -> first mode in which it is switched off
+_FEATURE_OFF_AT = {
+    "groq_fallback": 1,
+    "both_generators": 2,
+    "beam_search": 3,
+    "live_generation": 4,
+}
+
+_EWMA_ALPHA = 0.2
+
+
+class DegradationController:
+    def __init__(self, max_inflight: int = DEGRADE_MAX_INFLIGHT,
+                 latency_budget_ms: float = DEGRADE_LATENCY_BUDGET_MS,
+                 thresholds=DEGRADE_THRESHOLDS,
+                 recovery_factor: float = DEGRADE_RECOVERY_FACTOR):
+        self.max_inflight = max_inflight
+        self.latency_budget_ms = latency_budget_ms
+        self.thresholds = list(thresholds)
+        self.recovery_factor = recovery_factor
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._stage_ms = {}  # stage -> (EWMA latency, monotonic time of its last sample)
+        self._local = threading.local()  # per thread: ms to leave out of stage timings
+        self._level = 0
+
+    @property
+    def mode(self) -> str:
+        return MODES[self._level]
+
+    def allows(self, feature: str) -> bool:
+        """Whether `feature` (see _FEATURE_OFF_AT) is still enabled in the current mode."""
+        return self._level < _FEATURE_OFF_AT[feature]
+
+    def pressure(self) -> float:
+        with self._lock:
+            return self._pressure()
+
+    def _stage_estimate(self, name: str, now: float) -> float:
+        """
+        A stage's average, halved for every DEGRADE_STAGE_HALF_LIFE_S without a sample.
+        Degraded modes skip stages (templated mode never runs empathetic_reply's generators),
+        so an average that only moved on new samples would hold the controller down forever.
+        """
+        ewma, at = self._stage_ms[name]
+        return ewma * 0.5 ** ((now - at) / DEGRADE_STAGE_HALF_LIFE_S)
+
+    def _pressure(self) -> float:
+        now = time.monotonic()
+        by_inflight = self._inflight / self.max_inflight
+        by_latency = sum(self._stage_estimate(name, now) for name in self._stage_ms) / self.latency_budget_ms
+        return max(by_inflight, by_latency)
+
+    def _evaluate(self):
+        """Move at most one level per call, with hysteresis on the way back up."""
+        p = self._pressure()
+        level = self._level
+        if level < len(self.thresholds) and p >= self.thresholds[level]:
+            level += 1
+        elif level > 0 and p < self.thresholds[level - 1] * self.recovery_factor:
+            level -= 1
+        if level != self._level:
+            metrics.inc(f"degradation.transitions.{MODES[self._level]}->{MODES[level]}")
+            metrics.set_gauge("degradation.level", level)
+            metrics.observe("degradation.transition_pressure", p)
+            self._level = level
+        metrics.set_gauge("degradation.pressure", p)
+
+    @contextmanager
+    def request(self):
+        """Wrap one end-to-end analysis so it counts as in flight."""
+        with self._lock:
+            self._inflight += 1
+            metrics.set_gauge("degradation.inflight", self._inflight)
+            self._evaluate()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                metrics.set_gauge("degradation.inflight", self._inflight)
+                self._evaluate()
+
+    def exclude(self, ms: float):
+        """Leave `ms` spent in this thread (e.g. loading a model) out of the stages it is timing."""
+        self._local.excluded_ms = getattr(self._local, "excluded_ms", 0.0) + ms
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time one pipeline stage and fold it into that stage's moving average. Time reported
+        through exclude() (cold model loads) is not counted, so a restart or an eviction does
+        not read as load.
+        """
+        start = time.perf_counter()
+        excluded_before = getattr(self._local, "excluded_ms", 0.0)
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            metrics.observe(f"stage_ms.{name}", elapsed_ms)
+            excluded_ms = getattr(self._local, "excluded_ms", 0.0) - excluded_before
+            sample_ms = max(0.0, elapsed_ms - excluded_ms)
+            with self._lock:
+                now = time.monotonic()
+                prev = self._stage_estimate(name, now) if name in self._stage_ms else None
+                ewma = sample_ms if prev is None else _EWMA_ALPHA * sample_ms + (1 - _EWMA_ALPHA) * prev
+                self._stage_ms[name] = (ewma, now)
+                self._evaluate()
+
+
+controller = DegradationController()
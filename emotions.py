@@ -0,0 +1,64 @@
+# emotions.py
+# Fixed-order float32 emotion vectors (config.EMOTION_LABELS). Model outputs are mapped onto
+# this order once, so sessions and the trend store keep one small array per message and
+# averages over any number of turns are a single NumPy reduction.
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from config import EMOTION_LABELS, EMOTION_TOP_K
+
+LABELS = tuple(EMOTION_LABELS)
+_INDEX = {label: i for i, label in enumerate(LABELS)}
+
+
+@lru_cache(maxsize=32)
+def _columns(model_labels: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """(source columns, target positions) mapping a model's label order onto LABELS."""
+    pairs = [(j, _INDEX[label]) for j, label in enumerate(model_labels) if label in _INDEX]
+    unknown = len(model_labels) - len(pairs)
+    if unknown:
+        metrics.inc("emotions.unmapped_labels", unknown)
+        print(f"Emotion labels not in EMOTION_LABELS are dropped: "
+              f"{[l for l in model_labels if l not in _INDEX]}")
+    src, dst = zip(*pairs) if pairs else ((), ())
+    return np.asarray(src, dtype=np.intp), np.asarray(dst, dtype=np.intp)
+
+
+def to_vectors(probs: np.ndarray, model_labels: Iterable[str]) -> np.ndarray:
+    """(n, num_model_labels) probabilities -> (n, len(LABELS)) float32 in canonical order."""
+    src, dst = _columns(tuple(model_labels))
+    out = np.zeros((probs.shape[0], len(LABELS)), dtype=np.float32)
+    out[:, dst] = probs[:, src]
+    return out
+
+
+def from_dict(emotions: Dict[str, float]) -> np.ndarray:
+    """Legacy label -> score dict to a vector (unknown labels dropped)."""
+    vec = np.zeros(len(LABELS), dtype=np.float32)
+    for label, score in (emotions or {}).items():
+        i = _INDEX.get(label.lower())
+        if i is not None:
+            vec[i] = score
+    return vec
+
+
+def top_k(vec: Optional[np.ndarray], k: int = EMOTION_TOP_K) -> Dict[str, float]:
+    """Sparse form: the k highest-scoring labels, highest first."""
+    if vec is None or not len(vec):
+        return {}
+    idx = np.argsort(vec)[::-1][:k]
+    return {LABELS[i]: float(vec[i]) for i in idx if vec[i] > 0}
+
+
+def as_dict(vec: Optional[np.ndarray]) -> Dict[str, float]:
+    return {} if vec is None else dict(zip(LABELS, vec.tolist()))
+
+
+def mean(vectors: List[np.ndarray]) -> Optional[np.ndarray]:
+    """Average of many vectors (None entries, e.g. languages without an emotion model, skipped)."""
+    vectors = [v for v in vectors if v is not None]
+    return np.mean(np.stack(vectors), axis=0) if vectors else None
@@ -0,0 +1,286 @@
+# evaluation.py
+# Metrics for the stress classifier, signal extraction and generated replies, plus an offline
+# harness: `python evaluation.py run data.jsonl` streams a labeled JSONL dataset through
+# batched detect_stress / extract_signals (and optionally empathetic_reply), caches
+# predictions per item so reruns only process changed items, and prints a JSON report.
+#
+# Dataset lines (all keys but "text" optional):
+#   {"id": "...", "text": "...", "stress_label": "high", "emotion": "fear",
+#    "triggers": [...], "symptoms": [...], "red_flags": [...], "reference": "..."}
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List
+
+from sklearn.metrics import accuracy_score, classification_report, precision_recall_fscore_support
+
+from config import (
+    SENTIMENT_MODEL, EMOTION_MODEL, NER_MODEL, FLAN_MODEL, LANGUAGES,
+    EVAL_CACHE_DIR, EVAL_BATCH_SIZE,
+    MAX_SEQ_LEN, EMOTION_LABELS, EMOTION_TOP_K, REDFLAG_URGENT_WEIGHT, UNSUPPORTED_LANGUAGE_POLICY,
+)
+
+_TOKEN_RE = re.compile(r"\w+")
+_EXTRACTED = ("triggers", "symptoms", "red_flags")
+
+
+# ---- Classifier metrics ----
+def evaluate_classifier(y_true, y_pred) -> Dict[str, float]:
+    """accuracy / precision / recall / f1 (binary for 0/1 labels, macro-averaged otherwise)."""
+    if not y_true:
+        return {"accuracy": 0.0, "precision": 0.0, "recall": 0.0, "f1": 0.0}
+    average = "binary" if set(y_true) | set(y_pred) <= {0, 1} else "macro"
+    precision, recall, f1, _ = precision_recall_fscore_support(y_true, y_pred, average=average, zero_division=0)
+    return {
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision),
+        "recall": float(recall),
+        "f1": float(f1),
+    }
+
+
+def per_class_report(y_true, y_pred) -> Dict[str, dict]:
+    """precision / recall / f1 / support per label."""
+    report = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+    return {label: {k: float(v) for k, v in stats.items()}
+            for label, stats in report.items() if isinstance(stats, dict) and label not in ("macro avg", "weighted avg")}
+
+
+# ---- Extraction metrics ----
+def evaluate_sets(gold: List[Iterable[str]], predicted: List[Iterable[str]]) -> Dict[str, float]:
+    """Micro precision / recall / f1 over per-item term sets (case-insensitive)."""
+    tp = fp = fn = 0
+    for g, p in zip(gold, predicted):
+        g = {x.lower().strip() for x in g}
+        p = {x.lower().strip() for x in p}
+        tp += len(g & p)
+        fp += len(p - g)
+        fn += len(g - p)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1, "support": tp + fn}
+
+
+# ---- Response metrics (BLEU / ROUGE, pure Python) ----
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def bleu(pred: str, ref: str, max_n: int = 4) -> float:
+    """Sentence BLEU with add-one smoothing on higher-order n-grams and brevity penalty."""
+    p, r = _tokens(pred), _tokens(ref)
+    if not p or not r:
+        return 0.0
+    log_prec = 0.0
+    for n in range(1, max_n + 1):
+        p_ngrams = Counter(tuple(p[i:i + n]) for i in range(len(p) - n + 1))
+        r_ngrams = Counter(tuple(r[i:i + n]) for i in range(len(r) - n + 1))
+        overlap = sum((p_ngrams & r_ngrams).values())
+        total = sum(p_ngrams.values())
+        if n > 1:
+            overlap, total = overlap + 1, total + 1
+        if not total or not overlap:
+            return 0.0
+        log_prec += math.log(overlap / total) / max_n
+    bp = 1.0 if len(p) > len(r) else math.exp(1 - len(r) / len(p))
+    return bp * math.exp(log_prec)
+
+
+def _f1(overlap: int, n_pred: int, n_ref: int) -> float:
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / n_pred, overlap / n_ref
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge1(pred: str, ref: str) -> float:
+    p, r = _tokens(pred), _tokens(ref)
+    return _f1(sum((Counter(p) & Counter(r)).values()), len(p), len(r))
+
+
+def rouge_l(pred: str, ref: str) -> float:
+    p, r = _tokens(pred), _tokens(ref)
+    if not p or not r:
+        return 0.0
+    prev = [0] * (len(r) + 1)
+    for a in p:
+        cur = [0]
+        for j, b in enumerate(r):
+            cur.append(prev[j] + 1 if a == b else max(prev[j + 1], cur[j]))
+        prev = cur
+    return _f1(prev[-1], len(p), len(r))
+
+
+def _score_pair(pair) -> Dict[str, float]:
+    pred, ref = pair
+    return {"bleu": bleu(pred, ref), "rouge1": rouge1(pred, ref), "rougeL": rouge_l(pred, ref)}
+
+
+def evaluate_responses(preds: List[str], refs: List[str], workers: int = 1) -> Dict[str, float]:
+    """Mean BLEU / ROUGE-1 / ROUGE-L F1 of predictions against references."""
+    pairs = list(zip(preds, refs))
+    if not pairs:
+        return {"bleu": 0.0, "rouge1": 0.0, "rougeL": 0.0}
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            scores = list(pool.map(_score_pair, pairs, chunksize=64))
+    else:
+        scores = [_score_pair(p) for p in pairs]
+    return {k: sum(s[k] for s in scores) / len(scores) for k in ("bleu", "rouge1", "rougeL")}
+
+
+# ---- Offline harness ----
+def _models_fingerprint(reply_model: str = None) -> str:
+    """Changes whenever a model, the vocabulary or a preprocessing setting that affects predictions changes."""
+    import vocab
+
+    parts = [SENTIMENT_MODEL, EMOTION_MODEL, NER_MODEL, json.dumps(LANGUAGES, sort_keys=True),
+             str(vocab.current().version), str(MAX_SEQ_LEN), ",".join(EMOTION_LABELS), str(EMOTION_TOP_K),
+             str(REDFLAG_URGENT_WEIGHT), UNSUPPORTED_LANGUAGE_POLICY]
+    if reply_model:
+        parts += [FLAN_MODEL, reply_model]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def _item_key(item: dict, with_replies: bool) -> str:
+    fields = {"text": item["text"], "reply": with_replies}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _predict_batch(texts: List[str], reply_model: str = None, batch_size: int = EVAL_BATCH_SIZE) -> List[dict]:
+    """Predictions for one batch (runs in a worker process when --workers > 1)."""
+    from classifier import detect_stress_batch
+    from extractor import extract_signals
+    from generate_response import empathetic_reply
+
+    stress = detect_stress_batch(texts, batch_size=batch_size)
+    out = []
+    for text, res in zip(texts, stress):
+        signals = extract_signals(text, lang=res["language"])
+        pred = {
+            "stress_label": res["stress_label"],
+            "stress_score": res["stress_score"],
+            "emotion": max(res["emotions"], key=res["emotions"].get) if res["emotions"] else None,
+            "signals": signals.to_dict(),
+        }
+        if reply_model:
+            replies = empathetic_reply(text, res["stress_label"], res["stress_score"], signals, model=reply_model)
+            pred["replies"] = {k: v for k, v in replies.items() if k in ("flan", "groq") and v}
+        out.append(pred)
+    return out
+
+
+def _read_jsonl(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def run(dataset: str, batch_size: int = EVAL_BATCH_SIZE, workers: int = 1,
+        reply_model: str = None, cache_dir: str = EVAL_CACHE_DIR) -> dict:
+    """Evaluate `dataset`; predictions are cached per item and model fingerprint."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"predictions-{_models_fingerprint(reply_model)}.jsonl")
+    cache = {}
+    if os.path.exists(cache_path):
+        for row in _read_jsonl(cache_path):
+            cache[row["key"]] = row["pred"]
+
+    items, todo = [], []
+    for item in _read_jsonl(dataset):
+        item["_key"] = _item_key(item, bool(reply_model))
+        items.append(item)
+        if item["_key"] not in cache:
+            todo.append(item)
+    todo = list({it["_key"]: it for it in todo}.values())  # duplicates are predicted once
+
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    with open(cache_path, "a", encoding="utf-8") as f:
+        def _save(batch, preds):
+            for it, pred in zip(batch, preds):
+                cache[it["_key"]] = pred
+                f.write(json.dumps({"key": it["_key"], "pred": pred}) + "\n")
+            f.flush()
+
+        if workers > 1 and batches:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(_predict_batch, [it["text"] for it in b], reply_model, batch_size)
+                           for b in batches]
+                for batch, fut in zip(batches, futures):
+                    _save(batch, fut.result())
+        else:
+            for batch in batches:
+                _save(batch, _predict_batch([it["text"] for it in batch], reply_model, batch_size))
+
+    report = {"items": len(items), "predicted": len(todo), "cached": len(items) - len(todo)}
+
+    labeled = [it for it in items if it.get("stress_label")]
+    if labeled:
+        y_true = [it["stress_label"] for it in labeled]
+        y_pred = [cache[it["_key"]]["stress_label"] for it in labeled]
+        report["stress"] = {"overall": evaluate_classifier(y_true, y_pred),
+                            "per_level": per_class_report(y_true, y_pred)}
+
+    labeled = [it for it in items if it.get("emotion")]
+    if labeled:
+        y_true = [it["emotion"] for it in labeled]
+        y_pred = [cache[it["_key"]]["emotion"] or "none" for it in labeled]
+        report["emotion"] = {"overall": evaluate_classifier(y_true, y_pred),
+                             "per_emotion": per_class_report(y_true, y_pred)}
+
+    for key in _EXTRACTED:
+        labeled = [it for it in items if key in it]
+        if labeled:
+            report[key] = evaluate_sets([it[key] for it in labeled],
+                                        [cache[it["_key"]]["signals"][key] for it in labeled])
+
+    if reply_model:
+        labeled = [it for it in items if it.get("reference")]
+        by_backend = {}
+        for it in labeled:
+            for backend, text in cache[it["_key"]].get("replies", {}).items():
+                by_backend.setdefault(backend, ([], []))
+                by_backend[backend][0].append(text)
+                by_backend[backend][1].append(it["reference"])
+        report["responses"] = {backend: evaluate_responses(preds, refs, workers=workers)
+                               for backend, (preds, refs) in by_backend.items()}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline evaluation over a labeled JSONL dataset.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ev = sub.add_parser("run", help="evaluate classifier, extraction and (optionally) replies")
+    ev.add_argument("dataset", help="JSONL file, one labeled message per line")
+    ev.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE)
+    ev.add_argument("--workers", type=int, default=1, help="processes for inference and scoring")
+    ev.add_argument("--replies", choices=["flan", "groq", "both"], default=None,
+                    help="also generate replies and score them against 'reference'")
+    ev.add_argument("--cache-dir", default=EVAL_CACHE_DIR)
+    ev.add_argument("--out", help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.dataset, batch_size=args.batch_size, workers=args.workers,
+                     reply_model=args.replies, cache_dir=args.cache_dir)
+        text = json.dumps(report, indent=2)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,102 +1,265 @@
 # extractor.py
 # NER-based extraction of triggers/symptoms/coping hints using local HF pipeline + Groq fallback
 
+import json
 import os
 import threading
-from typing import Dict, List
-from transformers import pipeline
-from config import NER_MODEL, DEVICE
-from groq import Groq
-
-# --- Local NER setup ---
-_ner_pipe = None
-_ner_lock = threading.Lock()
-
-def get_ner_pipe():
-    global _ner_pipe
-    if _ner_pipe is None:
-        with _ner_lock:
-            if _ner_pipe is None:
-                _ner_pipe = pipeline(
-                    "ner",
-                    model=NER_MODEL,
-                    aggregation_strategy="simple",
-                    device=DEVICE
-                )
-    return _ner_pipe
+import time
+from collections import OrderedDict, deque
+from artifacts import load_pipeline
+from config import (
+    DEVICE, DEFAULT_LANGUAGE, LANGUAGES,
+    GROQ_EXTRACT_MODEL, GROQ_EXTRACT_CACHE_SIZE, GROQ_EXTRACT_MIN_CALLS, GROQ_EXTRACT_MIN_YIELD,
+    GROQ_EXTRACT_YIELD_WINDOW, GROQ_EXTRACT_PROBE_INTERVAL_S,
+    DEADLINE_MIN_GROQ_FALLBACK_S,
+)
+from groq import Groq, BadRequestError, APITimeoutError
+import metrics
+from redflags import REDFLAGS, screen_redflags
+from degradation import controller
+from deadline import Deadline, DeadlineExceeded, unbounded
+from language import route_language
+from registry import registry
+import vocab
+from signals import Signals, EMPTY, VOCABS, as_terms
+from structured import JsonObjectScanner, extract_json, validate_keys
+from preprocessing import normalize_text
+
+# --- Local NER setup (one model per language, registered on first use) ---
+def _ner_key(lang: str) -> str:
+    key = f"ner:{lang}"
+    model = LANGUAGES[lang]["ner"]
+    registry.register(key, lambda: load_pipeline(
+        "ner",
+        model,
+        aggregation_strategy="simple",
+        device=DEVICE
+    ))
+    return key
+
+_ner_key(DEFAULT_LANGUAGE)
+
+def get_ner_pipe(lang: str = DEFAULT_LANGUAGE):
+    return registry.get(_ner_key(lang))
 
 # --- Keyword dictionaries ---
-COPING_HINTS = [
-    "walk", "walking", "run", "running", "exercise", "yoga", "meditate",
-    "breathing", "breathe", "journal", "journaling", "talk", "therapy",
-    "counselor", "counsellor", "music", "nap", "rest"
-]
-
-SYMPTOMS = [
-    "tired", "fatigue", "can't sleep", "insomnia", "panic", "heart racing",
-    "headache", "nausea", "crying", "shaking", "stressed", "anxious",
-    "overwhelmed", "burnout", "dizzy", "hopeless", "worthless"
-]
-
-REDFLAGS = [
-    "suicide", "suicidal", "self-harm", "kill myself", "end it all",
-    "hopeless", "worthless", "overdose", "cutting"
-]
+# Symptom/coping vocabularies per language come from the vocabulary file (vocab.py, hot
+# reloaded); languages missing there get NER/Groq signals only. Each compiled version is
+# turned once into (lowercased surface form, Signals bit) tables, so matching builds the
+# bitset directly and synonyms map onto their canonical term.
+_keyword_tables = (None, {})  # (vocabulary, {lang: {category: [(surface, bit)]}}), swapped atomically
+
+def _keyword_bits(v) -> dict:
+    global _keyword_tables
+    cached_vocab, tables = _keyword_tables
+    if cached_vocab is not v:
+        tables = {
+            lang: {cat: [(surface, VOCABS[cat].bit(term)) for surface, term in table]
+                   for cat, table in cats.items()}
+            for lang, cats in v.keywords.items()
+        }
+        _keyword_tables = (v, tables)
+    return tables
+
+_keyword_bits(vocab.current())  # intern the keywords up front so they get the low Signals ids
+
+def _match_bits(lowered: str, table) -> int:
+    bits = 0
+    for term, bit in table:
+        if term in lowered:
+            bits |= bit
+    return bits
 
 # --- Groq setup (optional fallback) ---
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-def extract_signals(text: str) -> Dict[str, List[str] or bool]:
-    """Extract triggers, symptoms, coping, red_flags, urgent from text."""
+# ---- Groq structured extraction fallback ----
+_GROQ_KEYS = ("triggers", "symptoms", "coping")
+_groq_cache = OrderedDict()  # normalized text -> validated dict ({} when nothing usable came back)
+_groq_cache_lock = threading.Lock()
+_json_mode = True  # cleared if the API rejects response_format
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+# Yield is judged on recent completed responses only: errors and timeouts say nothing about
+# whether the fallback finds signals, and a window lets the fallback recover after a bad spell.
+_groq_yields = deque(maxlen=GROQ_EXTRACT_YIELD_WINDOW)  # True if a response had any signal
+_groq_last_probe = 0.0
+
+def _groq_low_yield() -> bool:
+    """
+    True while recent responses show the fallback rarely returns any signal. One probe call
+    per GROQ_EXTRACT_PROBE_INTERVAL_S still goes through, so a recovered yield is noticed.
+    """
+    global _groq_last_probe
+    with _groq_cache_lock:
+        recent = list(_groq_yields)
+        if len(recent) < GROQ_EXTRACT_MIN_CALLS or sum(recent) / len(recent) >= GROQ_EXTRACT_MIN_YIELD:
+            return False
+        now = time.monotonic()
+        if now - _groq_last_probe >= GROQ_EXTRACT_PROBE_INTERVAL_S:
+            _groq_last_probe = now
+            metrics.inc("extract.groq.probes")
+            return False
+        return True
+
+def _groq_request(prompt: str, deadline: Deadline):
+    """
+    (parsed object or None, parse path). JSON mode first, then a streamed tolerant parse.
+    Requests time out with the deadline; a stream still open when it expires is abandoned.
+    """
+    global _json_mode
+    kwargs = dict(
+        model=GROQ_EXTRACT_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        max_tokens=200,
+        timeout=deadline.timeout(),
+    )
+    if _json_mode:
+        try:
+            resp = client.chat.completions.create(response_format={"type": "json_object"}, **kwargs)
+        except BadRequestError as e:
+            print("Groq JSON mode unavailable, falling back to tolerant parsing:", e)
+            _json_mode = False
+        else:
+            content = resp.choices[0].message.content or ""
+            try:
+                return json.loads(content), "json_mode"
+            except ValueError:
+                return extract_json(content), "tolerant"
+
+    # stream and stop reading as soon as the first JSON object closes
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    scanner = JsonObjectScanner()
+    try:
+        for chunk in stream:
+            if scanner.feed(chunk.choices[0].delta.content or "") is not None:
+                break
+            if deadline.expired():
+                raise DeadlineExceeded("groq_extract")
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    return scanner.result, "tolerant"
 
-    t = (text or "").strip()
+def groq_extract(text: str, deadline: Deadline = None) -> dict:
+    """
+    Triggers/symptoms/coping lists from Groq for `text`, cached per normalized text.
+    Returns {} when the call fails or times out, the output does not validate, or the
+    fallback is skipped.
+    """
+    deadline = deadline or unbounded()
+    key = _normalize(text)
+    with _groq_cache_lock:
+        if key in _groq_cache:
+            _groq_cache.move_to_end(key)
+            metrics.inc("extract.groq.cache_hits")
+            return _groq_cache[key]
+    if _groq_low_yield():
+        metrics.inc("extract.groq.skipped_low_yield")
+        return {}
+
+    prompt = f"""
+    Extract structured mental health signals from this user text.
+    Respond with a JSON object only, exactly these keys, each a list of short strings:
+    {{"triggers": [], "symptoms": [], "coping": []}}
+
+    User text: "{text}"
+    JSON:
+    """
+    metrics.inc("extract.groq.calls")
+    try:
+        data, path = _groq_request(prompt, deadline)
+    except (APITimeoutError, DeadlineExceeded):
+        metrics.inc("extract.groq.errors")
+        deadline.record("groq_extract", "timeout")
+        return {}  # transient; not cached
+    except Exception as e:
+        print("Groq fallback failed:", e)
+        metrics.inc("extract.groq.errors")
+        return {}  # transient; not cached
+
+    parsed = validate_keys(data, _GROQ_KEYS)
+    if parsed is None:
+        metrics.inc("extract.groq.parse_failed")
+        parsed = {}
+    else:
+        metrics.inc(f"extract.groq.parsed.{path}")
+        if any(parsed.values()):
+            metrics.inc("extract.groq.nonempty")
+    with _groq_cache_lock:
+        _groq_yields.append(any(parsed.values()))
+    calls = metrics.counter("extract.groq.calls")
+    metrics.set_gauge("extract.groq.parse_success_rate",
+                      (calls - metrics.counter("extract.groq.parse_failed") - metrics.counter("extract.groq.errors")) / calls)
+
+    deadline.record("groq_extract", "ok")
+    with _groq_cache_lock:
+        _groq_cache[key] = parsed
+        while len(_groq_cache) > GROQ_EXTRACT_CACHE_SIZE:
+            _groq_cache.popitem(last=False)
+    return parsed
+
+def extract_signals(text: str, redflags: dict = None, lang: str = None,
+                    deadline: Deadline = None) -> Signals:
+    """
+    Extract triggers, symptoms, coping, red_flags, urgent from text.
+    Pass the result of screen_redflags() as `redflags` to reuse an earlier screening.
+    NER model and keyword tables follow the message language (detected when `lang` is None);
+    unsupported languages skip the local NER pass.
+    If `deadline` has run out only the red-flag screening is returned; the Groq fallback
+    runs only with DEADLINE_MIN_GROQ_FALLBACK_S left.
+    """
+    deadline = deadline or unbounded()
+
+    t = normalize_text(text)
     if not t:
-        return {"triggers": [], "symptoms": [], "coping": [], "red_flags": [], "urgent": False}
+        return EMPTY
+
+    # ---- Red-flag fast lane (runs before any model) ----
+    if redflags is None:
+        redflags = screen_redflags(t)
+    red_flags = VOCABS["red_flags"].encode(redflags["red_flags"])
+    urgent = redflags["urgent"]
+    if deadline.expired():
+        deadline.record("extract_signals", "timeout")
+        return Signals(red_flags=red_flags, urgent=urgent)
+
+    # ---- Unsupported language: red flags only, no models and no remote fallback ----
+    lang, supported = route_language(t, lang)
+    if not supported:
+        metrics.inc("extract.unsupported_language")
+        deadline.record("extract_signals", "ok")
+        return Signals(red_flags=red_flags, urgent=urgent)
 
     # ---- Local NER pass ----
-    ner = get_ner_pipe()(t[:512])
-    triggers = set()
-    for ent in ner:
-        word = ent.get("word", "").strip()
-        group = ent.get("entity_group", "")
-        if word and group in ("ORG", "MISC", "LOC", "PER", "DATE"):
-            triggers.add(word)
-
-    coping = sorted([w for w in COPING_HINTS if w.lower() in t.lower()])
-    symptoms = sorted([s for s in SYMPTOMS if s.lower() in t.lower()])
-    red_flags = sorted([r for r in REDFLAGS if r.lower() in t.lower()])
-    urgent = len(red_flags) > 0
-
-    # ---- If everything is empty → fallback to Groq ----
-    if not triggers and not symptoms and not coping:
-        try:
-            prompt = f"""
-            Extract structured mental health signals from this user text.
-            Return valid JSON only with these keys: triggers, symptoms, coping.
-
-            User text: "{t}"
-            JSON:
-            """
-            resp = client.chat.completions.create(
-                model="llama3-8b-8192",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=200,
-            )
-            groq_out = resp.choices[0].message.content.strip()
-            import json
-            data = json.loads(groq_out)
-
-            triggers = data.get("triggers", [])
-            symptoms = data.get("symptoms", [])
-            coping = data.get("coping", [])
-        except Exception as e:
-            print("Groq fallback failed:", e)
-
-    return {
-        "triggers": sorted(set(triggers)),
-        "symptoms": sorted(set(symptoms)),
-        "coping": sorted(set(coping)),
-        "red_flags": red_flags,
-        "urgent": urgent
-    }
+    ner = []
+    if LANGUAGES[lang].get("ner"):
+        with controller.stage("extract_signals"):
+            with registry.use(_ner_key(lang)) as ner_pipe:
+                ner = ner_pipe(t[:512])
+    triggers = as_terms(
+        ent.get("word", "") for ent in ner
+        if ent.get("entity_group", "") in ("ORG", "MISC", "LOC", "PER", "DATE")
+    )
+
+    tables = _keyword_bits(vocab.current()).get(lang, {})
+    lowered = t.lower()
+    coping = _match_bits(lowered, tables.get("coping", ()))
+    symptoms = _match_bits(lowered, tables.get("symptoms", ()))
+
+    # ---- If everything is empty → fallback to Groq (shed first under load) ----
+    if (not triggers and not symptoms and not coping and controller.allows("groq_fallback")
+            and deadline.allows("groq_extract", DEADLINE_MIN_GROQ_FALLBACK_S)):
+        with controller.stage("groq_extract"):
+            data = groq_extract(t, deadline)
+        if data:
+            triggers = as_terms(data["triggers"])
+            symptoms = VOCABS["symptoms"].encode(data["symptoms"])
+            coping = VOCABS["coping"].encode(data["coping"])
+
+    deadline.record("extract_signals", "ok")
+    return Signals(triggers, symptoms, coping, red_flags, urgent)
@@ -109,12 +109,83 @@
 # generate_response.py
 import os
 import re
-from groq import Groq
-from transformers import pipeline
-from config import FLAN_MODEL, DEVICE
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
+from groq import Groq, APITimeoutError
+from transformers import StoppingCriteria, StoppingCriteriaList
+import metrics
+from artifacts import load_pipeline, load_model
+from degradation import controller
+from deadline import Deadline, unbounded
+from registry import registry
+from signals import Signals
+from config import (
+    FLAN_MODEL, DEVICE, SEMANTIC_CACHE_ENABLED, GEN_PROFILES, DEFAULT_GEN_PROFILE,
+    AUTO_PROFILE_QUEUE_DEPTH, FLAN_LATENCY_SLO_MS, FLAN_DRAFT_MODEL,
+    DEGRADE_PREFERRED_GENERATOR,
+    RACE_LOSER_POLICY, RACE_TIMEOUT_S, RACE_MIN_CHARS, RACE_MAX_CHARS, RACE_MIN_DISTINCT_RATIO,
+    RACE_POOL_WORKERS,
+    DEADLINE_MIN_SECOND_GENERATOR_S, DEADLINE_MIN_GENERATION_S,
+    RESPONSE_BANK_ENABLED,
+)
 
-# ---- Local FLAN pipeline ----
-_flan_pipe = pipeline("text2text-generation", model=FLAN_MODEL, device=DEVICE)
+# ---- Local FLAN pipeline (loaded on first use) ----
+registry.register("flan", lambda: load_pipeline("text2text-generation", FLAN_MODEL, device=DEVICE))
+if FLAN_DRAFT_MODEL:
+    registry.register("flan_draft", lambda: load_model(FLAN_DRAFT_MODEL).to(registry.get("flan").model.device))
+
+# ---- Generation profiles ----
+# fastest last; auto selection only ever steps towards the end of this list
+PROFILE_ORDER = ["quality", "balanced", "fast"]
+
+_flan_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def select_profile(queue_depth: int = None) -> str:
+    """
+    Pick a profile for the current load: step down by in-flight FLAN calls
+    (AUTO_PROFILE_QUEUE_DEPTH), then once more if the choice is missing its latency SLO.
+    """
+    if queue_depth is None:
+        queue_depth = _flan_inflight
+    profile = DEFAULT_GEN_PROFILE
+    for name in PROFILE_ORDER:
+        threshold = AUTO_PROFILE_QUEUE_DEPTH.get(name)
+        if threshold is not None and queue_depth >= threshold and _is_faster(name, profile):
+            profile = name
+
+    if metrics.percentile(f"flan.latency_ms.{profile}", 95) > FLAN_LATENCY_SLO_MS:
+        idx = PROFILE_ORDER.index(profile) if profile in PROFILE_ORDER else len(PROFILE_ORDER) - 1
+        profile = PROFILE_ORDER[min(idx + 1, len(PROFILE_ORDER) - 1)]
+    return profile
+
+
+def _is_faster(a: str, b: str) -> bool:
+    if b not in PROFILE_ORDER:
+        return False
+    return a in PROFILE_ORDER and PROFILE_ORDER.index(a) > PROFILE_ORDER.index(b)
+
+
+def _generation_kwargs(profile: str, stack: ExitStack) -> dict:
+    """generate() kwargs for `profile`; an assisted profile's draft model stays pinned until `stack` exits."""
+    kwargs = dict(GEN_PROFILES[profile])
+    if kwargs.pop("assisted", False) and FLAN_DRAFT_MODEL:
+        kwargs["assistant_model"] = stack.enter_context(registry.use("flan_draft"))
+    return kwargs
+
+
+def profile_stats() -> dict:
+    """Observed p50 tokens/sec and p95 latency per profile, for choosing profiles against SLOs."""
+    return {
+        name: {
+            "tokens_per_sec_p50": metrics.percentile(f"flan.tokens_per_sec.{name}", 50),
+            "latency_ms_p95": metrics.percentile(f"flan.latency_ms.{name}", 95),
+        }
+        for name in GEN_PROFILES
+    }
 
 # ---- Groq client ----
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
@@ -127,22 +198,67 @@ def clean_text(text: str) -> str:
     text = re.sub(r"(I'm sorry.*?)( \1)+", r"\1", text)
     return text.strip()
 
-def flan_reply(user_text: str, stress_label: str, stress_score: float, signals: dict) -> str:
+def _context_line(context: str) -> str:
+    return f"Earlier in the conversation: {context}\n" if context else ""
+
+class _CancelCriteria(StoppingCriteria):
+    """Stops generate() at the next token once `event` is set or `deadline` runs out."""
+
+    def __init__(self, event: threading.Event = None, deadline: Deadline = None):
+        self.event = event
+        self.deadline = deadline
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        stop = (self.event is not None and self.event.is_set()) or (
+            self.deadline is not None and self.deadline.expired())
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+def flan_reply(user_text: str, stress_label: str, stress_score: float, signals: Signals,
+               profile: str = None, context: str = "", cancel: threading.Event = None,
+               deadline: Deadline = None) -> str:
+    """
+    FLAN reply using a named generation profile (None -> chosen by select_profile()).
+    `context` is the ConversationContext summary of earlier turns; setting `cancel`, or
+    `deadline` running out, stops decoding at the next token.
+    """
+    global _flan_inflight
     prompt = f"""
 You are a supportive mental health companion.
-User text: {user_text}
+{_context_line(context)}User text: {user_text}
 Stress level: {stress_label} ({stress_score:.2f})
 Extracted signals: {signals}
 
 Write a short, empathetic response. Validate feelings and suggest 2–3 practical coping steps.
 """
-    raw = _flan_pipe(prompt, max_new_tokens=120)[0]["generated_text"]
+    with _inflight_lock:
+        if profile is None:
+            profile = select_profile(_flan_inflight)
+        _flan_inflight += 1
+    try:
+        with ExitStack() as stack:
+            flan_pipe = stack.enter_context(registry.use("flan"))
+            kwargs = _generation_kwargs(profile, stack)
+            start = time.perf_counter()
+            if cancel is not None or deadline is not None:
+                kwargs["stopping_criteria"] = StoppingCriteriaList([_CancelCriteria(cancel, deadline)])
+            raw = flan_pipe(prompt, **kwargs)[0]["generated_text"]
+            elapsed = time.perf_counter() - start
+            n_tokens = len(flan_pipe.tokenizer(raw, add_special_tokens=False)["input_ids"])
+    finally:
+        with _inflight_lock:
+            _flan_inflight -= 1
+
+    metrics.observe(f"flan.latency_ms.{profile}", elapsed * 1000.0)
+    metrics.observe(f"flan.tokens_per_sec.{profile}", n_tokens / elapsed if elapsed else 0.0)
     return clean_text(raw)
 
-def groq_reply(user_text: str, stress_label: str, stress_score: float, signals: dict) -> str:
+def groq_reply(user_text: str, stress_label: str, stress_score: float, signals: Signals,
+               context: str = "", deadline: Deadline = None) -> str:
+    """Groq reply; the request times out (APITimeoutError) when `deadline` runs out."""
     prompt = f"""
 You are a supportive mental health companion.
-User text: {user_text}
+{_context_line(context)}User text: {user_text}
 Stress level: {stress_label} ({stress_score:.2f})
 Extracted signals: {signals}
 
@@ -150,14 +266,264 @@ Write a short, empathetic response. Validate feelings and suggest 2–3 practica
 """
     chat_completion = client.chat.completions.create(
         messages=[{"role": "user", "content": prompt}],
-        model="llama3-8b-8192"
+        model="llama3-8b-8192",
+        timeout=(deadline or unbounded()).timeout(),
     )
     raw = chat_completion.choices[0].message.content
     return clean_text(raw)
 
-def empathetic_reply(user_text: str, stress_label: str, stress_score: float, signals: dict) -> dict:
-    """Return both FLAN and Groq responses for comparison."""
-    return {
-        "flan": flan_reply(user_text, stress_label, stress_score, signals),
-        "groq": groq_reply(user_text, stress_label, stress_score, signals)
+# ---- Templated replies (last load-shedding step) ----
+TEMPLATES = {
+    "urgent": (
+        "I'm really sorry you're going through this, and I'm glad you told me. You don't have "
+        "to face it alone. If you're thinking about suicide or hurting yourself, please call or "
+        "text 988 (Suicide & Crisis Lifeline), text HOME to 741741 (Crisis Text Line), or call "
+        "911 if you're in immediate danger. Reaching out to someone you trust right now can help too."
+    ),
+    "high": (
+        "That sounds really heavy, and it makes sense that you feel overwhelmed. "
+        "Try slowing down with a few deep breaths, step away for a short walk, "
+        "and reach out to someone you trust today."
+    ),
+    "medium": (
+        "Thanks for sharing this — it sounds like a lot is on your plate. "
+        "Breaking things into one small next step, taking short breaks and "
+        "getting some rest tonight can help."
+    ),
+    "low": (
+        "It's good that you're checking in with yourself. Keep doing what helps — "
+        "a bit of movement, regular sleep and time with people you like."
+    ),
+}
+
+
+def templated_reply(stress_label: str, signals: Signals) -> str:
+    """Canned reply for the stress level, no model involved; crisis resources for red-flag messages."""
+    if signals.urgent or signals.red_flags:
+        return TEMPLATES["urgent"]
+    text = TEMPLATES.get(stress_label, TEMPLATES["medium"])
+    coping = signals.get("coping") or []
+    if coping:
+        text += f" You mentioned {coping[0]} — keep leaning on what already works for you."
+    return text
+
+
+
+# ---- Race mode (first reply that passes the quality gate wins) ----
+# Prompt echoed back: its labels, signals as a dict, or the prompt form of Signals
+# ("symptoms: anxious, tired; coping: walk; urgent", see signals._render).
+_LEAK_RE = re.compile(
+    r"'(triggers|symptoms|coping|red_flags|urgent)'\s*:|\{'|Extracted signals:|Stress level:|User text:"
+    r"|\bred_flags:"
+    r"|\b(?:triggers|symptoms|coping): [^;\n]*; (?:(?:triggers|symptoms|coping|red_flags): |urgent\b)"
+    r"|^(?:triggers|symptoms|coping): ",
+    re.MULTILINE,
+)
+# Replies must be free to talk about suicide and point to crisis lines; what is rejected is
+# content that encourages self-harm or gives method details.
+_HARMFUL_RE = re.compile(
+    r"\b(?:how to|ways? to|best way to|easiest way to|painless(?:ly)?)\s+(?:kill|hurt|cut|harm|overdose|end)\b"
+    r"|\b(?:lethal|fatal|deadly)\s+(?:dose|amount)\b"
+    r"|\b\d+\s*(?:mg|milligrams?|pills|tablets)\b"
+    r"|\byou\s+(?:should|could|might as well|deserve to)\s+(?:just\s+)?(?:kill yourself|die|end it|hurt yourself|cut yourself)\b"
+    r"|\b(?:go ahead and|just)\s+(?:kill yourself|end it all|end your life)\b"
+    r"|\byou(?:'re| are)\s+(?:worthless|hopeless|a burden)\b",
+    re.IGNORECASE,
+)
+_race_pool = ThreadPoolExecutor(max_workers=RACE_POOL_WORKERS, thread_name_prefix="race")
+
+
+def quality_gate(text: str):
+    """None if `text` is fit to show, otherwise the reason it is not."""
+    if not text or len(text) < RACE_MIN_CHARS:
+        return "too_short"
+    if len(text) > RACE_MAX_CHARS:
+        return "too_long"
+    words = text.lower().split()
+    trigrams = list(zip(words, words[1:], words[2:]))
+    if trigrams and len(set(trigrams)) / len(trigrams) < RACE_MIN_DISTINCT_RATIO:
+        return "repetitive"
+    if _LEAK_RE.search(text):
+        return "leaked_prompt"
+    if _HARMFUL_RE.search(text):
+        return "unsafe"
+    return None
+
+
+def race_reply(user_text: str, stress_label: str, stress_score: float, signals: Signals,
+               backends, profile: str = None, context: str = "", cache=None, cache_vec=None,
+               deadline: Deadline = None) -> dict:
+    """
+    Run `backends` ("flan"/"groq") concurrently and return as soon as one reply passes
+    quality_gate(): {"flan": ..., "groq": ..., "winner": name}, the loser's slot None.
+    RACE_LOSER_POLICY "cancel" stops FLAN decoding (a Groq request already sent cannot be
+    recalled and is discarded); "finish" lets the loser complete and stores both replies in
+    `cache` for comparison. With no acceptable reply within RACE_TIMEOUT_S (or the
+    deadline) the templated reply is returned.
+    """
+    deadline = deadline or unbounded()
+    start = time.perf_counter()
+    cancel = threading.Event()
+    runners = {
+        "flan": lambda: flan_reply(user_text, stress_label, stress_score, signals,
+                                   profile=profile, context=context, cancel=cancel, deadline=deadline),
+        "groq": lambda: groq_reply(user_text, stress_label, stress_score, signals, context=context,
+                                   deadline=deadline),
     }
+    futures = {_race_pool.submit(runners[name]): name for name in backends}
+    metrics.inc("race.races")
+    reply = {"flan": None, "groq": None, "winner": None}
+    finished = {}
+
+    def _result(fut):
+        name = futures[fut]
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        metrics.observe(f"race.latency_ms.{name}", elapsed_ms)
+        try:
+            text = fut.result()
+        except Exception as e:
+            print(f"Race backend {name} failed:", e)
+            metrics.inc(f"race.errors.{name}")
+            return None, "error"
+        reason = quality_gate(text)
+        if reason:
+            metrics.inc(f"race.gate_failed.{name}.{reason}")
+        return text, reason
+
+    pending = set(futures)
+    race_deadline = start + min(RACE_TIMEOUT_S, deadline.remaining())
+    while pending and reply["winner"] is None:
+        done, pending = wait(pending, timeout=max(0.0, race_deadline - time.perf_counter()),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            break  # timed out
+        for fut in done:
+            text, reason = _result(fut)
+            finished[futures[fut]] = text
+            if reason is None and reply["winner"] is None:
+                reply[futures[fut]] = text
+                reply["winner"] = futures[fut]
+
+    winner = reply["winner"]
+    if winner is not None:
+        metrics.inc(f"race.wins.{winner}")
+    for name in backends:
+        metrics.set_gauge(f"race.win_rate.{name}", metrics.counter(f"race.wins.{name}") / metrics.counter("race.races"))
+
+    deadline.record("race", "ok" if winner is not None else "timeout" if pending else "no_winner")
+    if winner is None:
+        metrics.inc("race.no_winner")
+        cancel.set()
+        reply["winner"] = "template"
+        reply[backends[0]] = templated_reply(stress_label, signals)
+        return reply
+
+    if RACE_LOSER_POLICY == "finish" and pending:
+        def _store_loser(fut):
+            text, _ = _result(fut)
+            if cache is not None and text:
+                both = {"flan": None, "groq": None, winner: reply[winner], futures[fut]: text}
+                cache.store(user_text, stress_label, signals, both, vec=cache_vec)
+        for fut in pending:
+            fut.add_done_callback(_store_loser)
+    else:
+        cancel.set()
+        for fut in pending:
+            fut.cancel()
+    return reply
+
+def _generate(name: str, user_text: str, stress_label: str, stress_score: float, signals: Signals,
+              profile: str, context: str, deadline: Deadline):
+    """One generator under the deadline; None if it timed out without a usable reply."""
+    try:
+        if name == "flan":
+            text = flan_reply(user_text, stress_label, stress_score, signals,
+                              profile=profile, context=context, deadline=deadline)
+        else:
+            text = groq_reply(user_text, stress_label, stress_score, signals, context=context,
+                              deadline=deadline)
+    except APITimeoutError:
+        deadline.record(name, "timeout")
+        return None
+    if deadline.expired():  # FLAN stopped early: keep the partial reply only if it is fit to show
+        deadline.record(name, "timeout")
+        return text if quality_gate(text) is None else None
+    deadline.record(name, "ok")
+    return text
+
+def empathetic_reply(user_text: str, stress_label: str, stress_score: float, signals: Signals,
+                     profile: str = None, model: str = "both", context: str = "",
+                     deadline: Deadline = None) -> dict:
+    """
+    Return FLAN and Groq responses for comparison.
+    `model` is "flan", "groq", "both" or "race" (see race_reply(); the result also names
+    the "winner"); a generator that was not requested, or was shed by the degradation
+    controller or the deadline, comes back as None. `context` summarises earlier turns
+    (see conversation.ConversationContext); replies with context are not semantically cached
+    or served from the response bank (tried first when RESPONSE_BANK_ENABLED).
+    With less than DEADLINE_MIN_SECOND_GENERATOR_S left "both" runs only the preferred
+    generator; with less than DEADLINE_MIN_GENERATION_S (or nothing usable before the
+    deadline) the templated reply is returned.
+    """
+    signals = Signals.from_dict(signals)  # accepts the old dict shape too
+    deadline = deadline or unbounded()
+    race = model == "race"
+    wanted = {"flan", "groq"} if model in ("both", "race") else {model}
+    first = "flan" if "flan" in wanted else "groq"
+
+    if RESPONSE_BANK_ENABLED and not context:
+        from response_bank import get_response_bank
+        text = get_response_bank().lookup(user_text, stress_label, signals)
+        if text is not None:
+            reply = {"flan": None, "groq": None, first: text}
+            if race:
+                reply["winner"] = "bank"
+            return reply
+
+    if not controller.allows("live_generation"):
+        metrics.inc("degradation.templated_replies")
+        return {"flan": None, "groq": None, first: templated_reply(stress_label, signals)}
+    if not deadline.allows("empathetic_reply", DEADLINE_MIN_GENERATION_S):
+        return {"flan": None, "groq": None, first: templated_reply(stress_label, signals)}
+
+    if len(wanted) > 1 and not controller.allows("both_generators"):
+        wanted = {DEGRADE_PREFERRED_GENERATOR}
+    if len(wanted) > 1 and not race and not deadline.allows("second_generator", DEADLINE_MIN_SECOND_GENERATOR_S):
+        wanted = {DEGRADE_PREFERRED_GENERATOR}
+    if not controller.allows("beam_search"):
+        profile = "fast"
+
+    cache = cache_vec = None
+    if SEMANTIC_CACHE_ENABLED and len(wanted) == 2 and not context:
+        from response_cache import get_semantic_cache
+        cache = get_semantic_cache()
+        cached, cache_vec = cache.lookup(user_text, stress_label, signals)
+        if cached is not None:
+            if race:
+                winner = next((k for k in ("groq", "flan") if cached.get(k) and quality_gate(cached[k]) is None), None)
+                if winner:
+                    return {"flan": None, "groq": None, winner: cached[winner], "winner": winner}
+            else:
+                return cached
+
+    if race:
+        # preferred (remote) generator first: it also gets the templated fallback slot
+        backends = sorted(wanted, key=lambda name: name != DEGRADE_PREFERRED_GENERATOR)
+        with controller.stage("empathetic_reply"):
+            return race_reply(user_text, stress_label, stress_score, signals, backends,
+                              profile=profile, context=context, cache=cache, cache_vec=cache_vec,
+                              deadline=deadline)
+
+    reply = {"flan": None, "groq": None}
+    with controller.stage("empathetic_reply"):
+        # preferred generator first, so a tight deadline cuts the other one
+        for i, name in enumerate(sorted(wanted, key=lambda name: name != DEGRADE_PREFERRED_GENERATOR)):
+            if i == 0 or deadline.allows(name, DEADLINE_MIN_GENERATION_S):
+                reply[name] = _generate(name, user_text, stress_label, stress_score, signals,
+                                        profile, context, deadline)
+    if not any(reply.values()):
+        metrics.inc("deadline.templated_replies")
+        reply[first] = templated_reply(stress_label, signals)
+    elif cache is not None and reply["flan"] and reply["groq"]:
+        cache.store(user_text, stress_label, signals, reply, vec=cache_vec)
+    return reply
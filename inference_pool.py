@@ -0,0 +1,350 @@
+# inference_pool.py
+# Process-pool inference: INFERENCE_WORKERS spawned processes, each pinned to its own slice of
+# cores with a fixed torch thread count, each holding its own classifier / extractor /
+# generate_response models (weights are memory-mapped, see artifacts.py, so workers share one
+# copy in the page cache). Each worker has its own request queue and the parent sends every
+# request to the worker with the fewest outstanding, so it always knows which worker holds
+# which request: when a worker dies, all of its requests (running or still queued) fail with
+# WorkerCrashed and a replacement is started. Worker exceptions are re-raised in the caller
+# with their original type (e.g. DeadlineExceeded), the worker traceback as __cause__.
+# Cancelling a Future, or cancelling the Deadline passed as `deadline=`, reaches the worker:
+# a queued request is skipped, a running one has its deadline cancelled so it stops at the
+# next check. Expired deadlines are checked in the worker before a request starts.
+
+import itertools
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List
+
+import torch.multiprocessing as mp
+
+import metrics
+from config import (
+    INFERENCE_WORKERS,
+    INFERENCE_CORES_PER_WORKER,
+    INFERENCE_PRELOAD,
+    INFERENCE_HEALTH_CHECK_S,
+    INFERENCE_CANCEL_POLL_S,
+)
+
+_SIGNALS = "__signals__"  # Signals bit ids are per process, so they cross as compact JSON
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker running a request exited before answering it."""
+
+
+class _RemoteTraceback(Exception):
+    def __init__(self, tb: str):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _to_wire(obj):
+    from signals import Signals
+    if isinstance(obj, Signals):
+        return (_SIGNALS, obj.dumps())
+    if isinstance(obj, dict):
+        return {k: _to_wire(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_wire(v) for v in obj)
+    return obj
+
+
+def _from_wire(obj):
+    if isinstance(obj, tuple) and len(obj) == 2 and obj[0] == _SIGNALS:
+        from signals import Signals
+        return Signals.loads(obj[1])
+    if isinstance(obj, dict):
+        return {k: _from_wire(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_from_wire(v) for v in obj)
+    return obj
+
+
+def _error_to_wire(e: Exception):
+    """(pickled exception or None if it does not pickle, formatted traceback)."""
+    tb = traceback.format_exc()
+    try:
+        return pickle.dumps(e), tb
+    except Exception:
+        return None, f"{type(e).__name__}: {e}\n{tb}"
+
+
+def _error_from_wire(value) -> BaseException:
+    payload, tb = value
+    exc = None
+    if payload is not None:
+        try:
+            exc = pickle.loads(payload)
+        except Exception:
+            pass
+    if exc is None:
+        return RuntimeError(tb)
+    exc.__cause__ = _RemoteTraceback(tb)
+    return exc
+
+
+# ---- Worker side ----
+# ops that take a `deadline=`; the worker adds one when the caller did not, so they can be cancelled
+_DEADLINE_OPS = {"detect_stress", "extract_signals", "empathetic_reply"}
+
+
+def _ops() -> Dict[str, callable]:
+    from classifier import detect_stress, detect_stress_batch
+    from extractor import extract_signals
+    from generate_response import empathetic_reply
+    return {
+        "detect_stress": detect_stress,
+        "detect_stress_batch": detect_stress_batch,
+        "extract_signals": extract_signals,
+        "empathetic_reply": empathetic_reply,
+    }
+
+
+def _watch_cancels(cancels, current: dict, cancelled: set, lock: threading.Lock):
+    """Cancel the running request's deadline, or remember the id until the request is dequeued."""
+    while True:
+        req_id = cancels.get()
+        if req_id is None:
+            break
+        with lock:
+            if current.get("id") == req_id:
+                if current["deadline"] is not None:
+                    current["deadline"].cancel()
+            else:
+                cancelled.add(req_id)
+
+
+def _worker_main(index: int, cores: List[int], requests, cancels, results):
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    from deadline import Deadline, DeadlineExceeded
+    from registry import registry
+    registry.configure_threads(len(cores) or None)
+    ops = _ops()
+    for name in INFERENCE_PRELOAD:
+        try:
+            registry.get(name)
+        except Exception as e:
+            print(f"Inference worker {index}: preload of '{name}' failed:", e)
+
+    current, cancelled, lock = {}, set(), threading.Lock()
+    threading.Thread(target=_watch_cancels, args=(cancels, current, cancelled, lock),
+                     name="inference-cancels", daemon=True).start()
+    results.put((None, "ready", index))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        req_id, op, args, kwargs = item
+        args, kwargs = _from_wire(args), _from_wire(kwargs)
+        deadline = kwargs.get("deadline")
+        if deadline is None and op in _DEADLINE_OPS:
+            deadline = kwargs["deadline"] = Deadline()
+        with lock:
+            skip = req_id in cancelled
+            # ids reach a worker in increasing order, so older cancels can no longer match
+            cancelled.difference_update([r for r in cancelled if r <= req_id])
+            if not skip:
+                current.update(id=req_id, deadline=deadline)
+        try:
+            if skip:
+                raise DeadlineExceeded(f"{op} cancelled before it started")
+            if deadline is not None:
+                deadline.check(op)
+            value = ops[op](*args, **kwargs)
+            results.put((req_id, "ok", _to_wire(value)))
+        except Exception as e:
+            results.put((req_id, "error", _error_to_wire(e)))
+        finally:
+            with lock:
+                current.clear()
+
+
+# ---- Parent side ----
+class InferencePool:
+    def __init__(self, workers: int = INFERENCE_WORKERS, cores_per_worker: int = INFERENCE_CORES_PER_WORKER):
+        self.workers = workers
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        per = cores_per_worker or max(1, len(available) // max(1, workers))
+        self.core_sets = [available[(i * per) % len(available):][:per] for i in range(workers)]
+        self._ctx = mp.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._procs = []
+        self._queues = []  # per worker: (requests, cancels)
+        self._pending: Dict[int, Future] = {}
+        self._assigned: Dict[int, int] = {}  # request id -> index of the worker holding it
+        self._deadlines: Dict[int, object] = {}  # request id -> the caller's Deadline, watched for cancel
+        self._load = [0] * len(self.core_sets)  # outstanding requests per worker
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready = set()
+        self._closing = False
+        self._collector = None
+
+    @property
+    def ready_workers(self) -> int:
+        """Live workers that have finished preloading their models."""
+        return len(self._ready)
+
+    def _spawn(self, index: int):
+        """Start worker `index` with fresh queues (anything left in a dead worker's queues is dropped)."""
+        queues = (self._ctx.Queue(), self._ctx.Queue())
+        p = self._ctx.Process(target=_worker_main, args=(index, self.core_sets[index], *queues, self._results),
+                              name=f"inference-{index}", daemon=True)
+        p.start()
+        return p, queues
+
+    def start(self):
+        started = [self._spawn(i) for i in range(len(self.core_sets))]
+        self._procs = [p for p, _ in started]
+        self._queues = [q for _, q in started]
+        self._collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self._collector.start()
+        return self
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                item = self._results.get(timeout=INFERENCE_CANCEL_POLL_S)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self._handle(*item)
+            self._pass_on_cancelled_deadlines()
+            if time.monotonic() - last_check >= INFERENCE_HEALTH_CHECK_S:
+                self._check_workers()
+                last_check = time.monotonic()
+
+    def _handle(self, req_id, status, value):
+        if req_id is None:
+            self._ready.add(value)
+            metrics.set_gauge("inference_pool.ready_workers", len(self._ready))
+            return
+        with self._lock:
+            fut = self._forget(req_id)
+            pending = len(self._pending)
+        metrics.set_gauge("inference_pool.pending", pending)
+        if fut is None or fut.done():
+            return
+        if status == "ok":
+            fut.set_result(_from_wire(value))
+        else:
+            metrics.inc("inference_pool.errors")
+            fut.set_exception(_error_from_wire(value))
+
+    def _forget(self, req_id: int):
+        """Drop a request's bookkeeping and return its Future (lock held)."""
+        fut = self._pending.pop(req_id, None)
+        index = self._assigned.pop(req_id, None)
+        self._deadlines.pop(req_id, None)
+        if index is not None:
+            self._load[index] -= 1
+        return fut
+
+    def _cancel(self, req_id: int):
+        """Tell the worker holding `req_id` to skip or stop it; its answer still clears the bookkeeping."""
+        with self._lock:
+            index = self._assigned.get(req_id)
+            self._deadlines.pop(req_id, None)
+            if index is None:
+                return
+            self._queues[index][1].put(req_id)
+        metrics.inc("inference_pool.cancels")
+
+    def _pass_on_cancelled_deadlines(self):
+        with self._lock:
+            cancelled = [req_id for req_id, d in self._deadlines.items() if d.cancelled]
+        for req_id in cancelled:
+            self._cancel(req_id)
+
+    def _check_workers(self):
+        """Fail every request held by a worker that died (running or queued) and start a replacement."""
+        if self._closing:
+            return
+        for index, p in enumerate(self._procs):
+            if p.is_alive():
+                continue
+            with self._lock:
+                lost = [req_id for req_id, worker in self._assigned.items() if worker == index]
+                futures = [self._forget(req_id) for req_id in lost]
+                self._procs[index], self._queues[index] = self._spawn(index)
+            self._ready.discard(index)
+            metrics.inc("inference_pool.worker_deaths")
+            metrics.set_gauge("inference_pool.ready_workers", len(self._ready))
+            print(f"Inference worker {index} exited (code {p.exitcode}); failing {len(futures)} request(s) and restarting it")
+            for fut in futures:
+                if fut is not None and not fut.done():
+                    fut.set_exception(WorkerCrashed(f"inference worker {index} exited with code {p.exitcode}"))
+
+    def submit(self, op: str, *args, **kwargs) -> Future:
+        """
+        Run `op` (see _ops) in a worker; returns a Future for its result. Cancelling the
+        Future, or the Deadline passed as `deadline=`, skips or stops the request in the worker.
+        """
+        fut = Future()
+        wire = (op, _to_wire(args), _to_wire(kwargs))
+        with self._lock:
+            req_id = next(self._ids)
+            index = min(range(len(self._load)), key=self._load.__getitem__)
+            self._pending[req_id] = fut
+            self._assigned[req_id] = index
+            self._load[index] += 1
+            if kwargs.get("deadline") is not None:
+                self._deadlines[req_id] = kwargs["deadline"]
+            self._queues[index][0].put((req_id, *wire))
+        metrics.inc(f"inference_pool.requests.{op}")
+
+        def on_done(f):
+            if f.cancelled():
+                self._cancel(req_id)
+
+        fut.add_done_callback(on_done)
+        return fut
+
+    def call(self, op: str, *args, timeout: float = None, **kwargs):
+        fut = self.submit(op, *args, **kwargs)
+        try:
+            return fut.result(timeout)
+        except FutureTimeout:
+            fut.cancel()
+            raise
+
+    def shutdown(self):
+        self._closing = True
+        for requests, cancels in self._queues:
+            requests.put(None)
+            cancels.put(None)
+        for p in self._procs:
+            p.join(timeout=10)
+        self._results.put(None)
+        if self._collector is not None:
+            self._collector.join(timeout=10)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool():
+    """Shared pool, started on first use; None when INFERENCE_WORKERS is 0 (run in-process)."""
+    global _pool
+    if INFERENCE_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool().start()
+    return _pool
@@ -0,0 +1,137 @@
+# jobs.py
+# Background analysis jobs for the Streamlit UI. Inference runs on a shared thread pool
+# instead of the script thread; each stage's result is published on the job as soon as it
+# finishes so the page can render progressively while polling. Cancellation is cooperative:
+# a cancelled job stops before its next stage, and its deadline (deadline.py) stops FLAN
+# decoding at the next token; every job also runs under a REQUEST_BUDGET_S deadline, and a
+# job still running UI_JOB_DEADLINE_GRACE_S after it expires is reported as failed.
+# With INFERENCE_WORKERS > 0 the stages run in the process pool (inference_pool.py) and the
+# job thread only waits on them, for at most the remaining budget plus that grace.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+from audit import audit
+from classifier import detect_stress
+from extractor import extract_signals
+from generate_response import empathetic_reply
+from degradation import controller
+from deadline import Deadline, DeadlineExceeded
+from inference_pool import get_inference_pool
+from config import UI_JOB_WORKERS, UI_JOB_DEADLINE_GRACE_S, REQUEST_BUDGET_S
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=UI_JOB_WORKERS, thread_name_prefix="ui-job")
+    return _executor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class AnalysisJob:
+    """
+    One message through detect_stress -> extract_signals -> empathetic_reply.
+    `results` gains "stress", "signals" and "responses" as the stages finish;
+    `error` holds the exception if a stage failed; `deadline.outcomes` records which
+    stages completed, were skipped or timed out.
+    """
+
+    STAGES = ("stress", "signals", "responses")
+
+    def __init__(self, user_text: str, redflags: dict = None, model: str = "both", context: str = "",
+                 budget_s: float = REQUEST_BUDGET_S):
+        self.user_text = user_text
+        self.redflags = redflags
+        self.model = model
+        self.context = context
+        self.results = {}
+        self.error = None
+        self.submitted_at = time.time()
+        self.future = None
+        self._cancel = threading.Event()
+        self.deadline = Deadline(budget_s, cancel=self._cancel)
+
+    def submit(self) -> "AnalysisJob":
+        self.future = get_executor().submit(self._run)
+        metrics.inc("ui.jobs.submitted")
+        return self
+
+    def cancel(self):
+        if self.done():
+            return
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()  # only succeeds if it has not started yet
+        metrics.inc("ui.jobs.cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def done(self) -> bool:
+        """Finished, or overrun: past its deadline plus the grace it is marked failed."""
+        if self.future is None:
+            return False
+        if self.future.done():
+            return True
+        if not self.cancelled and time.monotonic() > self.deadline.expires_at + UI_JOB_DEADLINE_GRACE_S:
+            if self.error is None:
+                self.error = DeadlineExceeded("analysis did not finish within its time budget")
+                metrics.inc("ui.jobs.overrun")
+            return True
+        return False
+
+    def _stage(self, name: str, fn, *args, **kwargs):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        pool = get_inference_pool()
+        if pool is not None:
+            timeout = self.deadline.timeout()
+            try:
+                self.results[name] = pool.call(fn.__name__, *args, **kwargs,
+                                               timeout=None if timeout is None else timeout + UI_JOB_DEADLINE_GRACE_S)
+            except FutureTimeout:
+                self.deadline.record(name, "timeout")
+                raise DeadlineExceeded(f"{name} did not finish within the deadline") from None
+        else:
+            self.results[name] = fn(*args, **kwargs)
+        metrics.observe(f"ui.jobs.{name}_ready_ms", (time.time() - self.submitted_at) * 1000)
+        return self.results[name]
+
+    def _run(self):
+        try:
+            with controller.request():
+                stress = self._stage("stress", detect_stress, self.user_text, deadline=self.deadline)
+                signals = self._stage("signals", extract_signals, self.user_text,
+                                      redflags=self.redflags, lang=stress.get("language"),
+                                      deadline=self.deadline)
+                self._stage("responses", empathetic_reply, self.user_text,
+                            stress["stress_label"], stress["stress_score"], signals,
+                            model=self.model, context=self.context, deadline=self.deadline)
+        except JobCancelled:
+            pass
+        except DeadlineExceeded as e:
+            if not self.cancelled:
+                self.error = e
+                metrics.inc("ui.jobs.deadline_exceeded")
+        except Exception as e:
+            self.error = e
+            metrics.inc("ui.jobs.failed")
+        finally:
+            audit("analysis", self.user_text, source="ui", model=self.model, mode=controller.mode,
+                  outcome="cancelled" if self.cancelled else "error" if self.error is not None else "ok",
+                  latency_ms=round((time.time() - self.submitted_at) * 1000.0, 1),
+                  stress=self.results.get("stress"), signals=self.results.get("signals"),
+                  redflags=self.redflags, responses=self.results.get("responses"),
+                  deadline=self.deadline.outcomes or None)
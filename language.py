@@ -0,0 +1,100 @@
+# language.py
+# Fast language identification in front of detect_stress / extract_signals.
+# Uses a fastText lid model when LANGID_MODEL_PATH is set, otherwise Unicode script
+# ranges plus stopword voting for Latin-script text (microseconds per message).
+
+import re
+import threading
+from typing import Tuple
+
+import metrics
+from config import DEFAULT_LANGUAGE, LANGUAGES, LANGID_MODEL_PATH, UNSUPPORTED_LANGUAGE_POLICY
+
+# --- Script ranges (first match wins) ---
+_SCRIPTS = [
+    ("ru", re.compile(r"[Ѐ-ӿ]")),
+    ("ar", re.compile(r"[؀-ۿ]")),
+    ("hi", re.compile(r"[ऀ-ॿ]")),
+    ("ja", re.compile(r"[぀-ヿ]")),
+    ("ko", re.compile(r"[가-힯]")),
+    ("zh", re.compile(r"[一-鿿]")),
+    ("el", re.compile(r"[Ͱ-Ͽ]")),
+    ("he", re.compile(r"[֐-׿]")),
+]
+
+# --- Stopwords for Latin-script languages ---
+_STOPWORDS = {
+    "en": {"the", "and", "i", "is", "to", "my", "it", "of", "a", "in", "that", "me", "am",
+           "i'm", "have", "with", "this", "so", "but", "not", "feel", "don't", "can't", "about"},
+    "es": {"el", "la", "y", "que", "de", "no", "me", "mi", "es", "en", "un", "una", "estoy",
+           "muy", "por", "con", "pero", "lo", "los", "las", "siento", "tengo", "yo", "para"},
+    "fr": {"le", "la", "et", "je", "suis", "de", "ne", "pas", "mon", "ma", "les", "un", "une",
+           "est", "que", "pour", "avec", "mais", "très", "j'ai", "moi", "des"},
+    "de": {"der", "die", "das", "und", "ich", "bin", "nicht", "mein", "meine", "ist", "ein",
+           "eine", "zu", "mit", "aber", "sehr", "habe", "mich", "auf", "für"},
+    "pt": {"o", "a", "e", "que", "de", "não", "eu", "estou", "meu", "minha", "um", "uma",
+           "muito", "com", "mas", "para", "tenho", "me", "os", "as"},
+    "it": {"il", "la", "e", "che", "di", "non", "io", "sono", "mio", "mia", "un", "una",
+           "molto", "con", "ma", "per", "ho", "mi", "gli", "le"},
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+_MIN_WORDS = 3  # shorter messages are too ambiguous to route away from the default
+
+_ft_model = None
+_ft_lock = threading.Lock()
+
+
+def _fasttext_model():
+    global _ft_model
+    if _ft_model is None and LANGID_MODEL_PATH:
+        with _ft_lock:
+            if _ft_model is None:
+                import fasttext
+                _ft_model = fasttext.load_model(LANGID_MODEL_PATH)
+    return _ft_model
+
+
+def detect_language(text: str) -> Tuple[str, float]:
+    """Return (ISO 639-1 code, confidence 0..1). Ambiguous or very short text -> DEFAULT_LANGUAGE."""
+    t = (text or "").strip()
+    if not t:
+        return DEFAULT_LANGUAGE, 0.0
+
+    model = _fasttext_model()
+    if model is not None:
+        labels, probs = model.predict(t.replace("\n", " "))
+        return labels[0].replace("__label__", ""), float(probs[0])
+
+    for lang, pattern in _SCRIPTS:
+        hits = len(pattern.findall(t))
+        if hits and hits >= 0.3 * len(t.replace(" ", "")):
+            return lang, 1.0
+
+    words = _WORD_RE.findall(t.lower())
+    if len(words) < _MIN_WORDS:
+        return DEFAULT_LANGUAGE, 0.0
+    scores = {lang: sum(w in stops for w in words) for lang, stops in _STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    if scores[best] == 0:
+        return DEFAULT_LANGUAGE, 0.0
+    if scores[best] == scores.get(DEFAULT_LANGUAGE, 0):  # ties go to the default
+        best = DEFAULT_LANGUAGE
+    return best, scores[best] / len(words)
+
+
+def route_language(text: str, lang: str = None) -> Tuple[str, bool]:
+    """
+    Language whose models/keywords should handle `text`, and whether local inference should run.
+    Unsupported languages either fall back to DEFAULT_LANGUAGE or are rejected
+    (UNSUPPORTED_LANGUAGE_POLICY), in which case the second value is False.
+    """
+    if lang is None:
+        lang, _ = detect_language(text)
+    metrics.inc(f"language.detected.{lang}")
+    if lang in LANGUAGES:
+        return lang, True
+    metrics.inc("language.unsupported")
+    if UNSUPPORTED_LANGUAGE_POLICY == "default":
+        return DEFAULT_LANGUAGE, True
+    return lang, False
@@ -0,0 +1,100 @@
+# memory_manager.py
+# Background eviction for the model registry: unload models idle longer than MODEL_IDLE_TTL_S,
+# and least-recently-used models while process RSS is above MEMORY_RSS_WATERMARK_MB.
+# Evicted models reload transparently on their next registry.use()/get().
+
+import os
+import threading
+import time
+
+import metrics
+from config import MODEL_IDLE_TTL_S, MEMORY_RSS_WATERMARK_MB, MEMORY_CHECK_INTERVAL_S
+
+try:
+    import psutil
+except ImportError:  # optional; /proc is used instead
+    psutil = None
+
+
+def process_rss_mb() -> float:
+    """Resident set size of this process in MB (0.0 if it cannot be read)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class MemoryManager:
+    def __init__(self, registry, idle_ttl_s: float = MODEL_IDLE_TTL_S,
+                 rss_watermark_mb: float = MEMORY_RSS_WATERMARK_MB,
+                 interval_s: float = MEMORY_CHECK_INTERVAL_S):
+        self.registry = registry
+        self.idle_ttl_s = idle_ttl_s
+        self.rss_watermark_mb = rss_watermark_mb
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _evict(self, name: str, reason: str, unused_since: float) -> bool:
+        # unused_since re-checks last use under the registry's lock, so a model picked from
+        # the resident snapshot is kept if a request touched it in the meantime
+        if self.registry.unload(name, unused_since=unused_since):
+            metrics.inc(f"memory.evictions.{reason}")
+            print(f"Evicted model '{name}' ({reason})")
+            return True
+        return False
+
+    def check(self):
+        """One eviction pass: idle TTL first, then LRU order while over the RSS watermark."""
+        now = time.time()
+        resident = self.registry.resident()
+
+        if self.idle_ttl_s:
+            for name, info in list(resident.items()):
+                if info["refcount"] == 0 and now - info["last_used"] > self.idle_ttl_s:
+                    if self._evict(name, "idle", now - self.idle_ttl_s):
+                        resident.pop(name)
+
+        rss = process_rss_mb()
+        metrics.set_gauge("memory.rss_mb", rss)
+        if self.rss_watermark_mb and rss > self.rss_watermark_mb:
+            lru = sorted(resident.items(), key=lambda kv: kv[1]["last_used"])
+            for name, info in lru:
+                if info["refcount"] == 0 and self._evict(name, "watermark", info["last_used"]):
+                    rss = process_rss_mb()
+                    if rss <= self.rss_watermark_mb:
+                        break
+            metrics.set_gauge("memory.rss_mb", rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.check()
+            except Exception as e:
+                print("Memory manager check failed:", e)
+
+    def start(self):
+        if self._thread is None and (self.idle_ttl_s or self.rss_watermark_mb):
+            self._thread = threading.Thread(target=self._run, name="memory-manager", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def start_memory_manager(registry) -> MemoryManager:
+    """Start (once) the background manager for `registry`."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = MemoryManager(registry)
+            _manager.start()
+    return _manager
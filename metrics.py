@@ -0,0 +1,84 @@
+# metrics.py
+# small in-process metrics registry: counters, gauges and latency samples
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_samples = defaultdict(lambda: deque(maxlen=2048))
+
+
+def inc(name: str, value: float = 1.0):
+    """Increment a counter."""
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value: float):
+    """Set a gauge to its current value."""
+    with _lock:
+        _gauges[name] = float(value)
+
+
+def observe(name: str, value: float):
+    """Record one sample (latencies in ms, throughputs, sizes...)."""
+    with _lock:
+        _samples[name].append(float(value))
+
+
+class timer:
+    """Context manager recording elapsed milliseconds under `name`."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed_ms = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed_ms = (time.perf_counter() - self._start) * 1000.0
+        observe(self.name, self.elapsed_ms)
+        return False
+
+
+def counter(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0.0)
+
+
+def percentile(name: str, q: float) -> float:
+    """q-th percentile (0-100) of the recent samples for `name`, 0.0 if none."""
+    with _lock:
+        values = sorted(_samples.get(name, ()))
+    if not values:
+        return 0.0
+    idx = min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def snapshot() -> Dict[str, dict]:
+    """All metrics as plain dicts (samples summarised as count/mean/p50/p95/p99)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        samples = {k: sorted(v) for k, v in _samples.items()}
+
+    summaries = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        n = len(values)
+        summaries[name] = {
+            "count": n,
+            "mean": sum(values) / n,
+            "p50": values[int(0.50 * (n - 1))],
+            "p95": values[int(0.95 * (n - 1))],
+            "p99": values[int(0.99 * (n - 1))],
+        }
+    return {"counters": counters, "gauges": gauges, "samples": summaries}
@@ -0,0 +1,98 @@
+# preprocessing.py
+# Shared preprocessing for the classification models: text is normalized once, tokenized with
+# explicit truncation (MAX_SEQ_LEN), and encodings are cached per tokenizer and text hash.
+# Tokenizers with identical definitions (e.g. the roberta-family sentiment and emotion models)
+# share one cache entry, so a message is tokenized once however many models read it.
+# classify() feeds the cached encodings straight to the model instead of going through the
+# pipeline's own tokenization.
+
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+import torch
+
+import metrics
+from config import MAX_SEQ_LEN, TOKEN_CACHE_SIZE
+
+_cache = OrderedDict()  # (tokenizer fingerprint, max_length, text hash) -> {"input_ids", "attention_mask"}
+_cache_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """NFC, collapsed whitespace, stripped. Every model sees the same string."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def _fingerprint(tokenizer) -> str:
+    """Hash of the full tokenizer definition (computed once per tokenizer object)."""
+    fp = getattr(tokenizer, "_mindcare_fingerprint", None)
+    if fp is None:
+        backend = getattr(tokenizer, "backend_tokenizer", None)
+        spec = backend.to_str() if backend is not None else f"{type(tokenizer).__name__}:{tokenizer.name_or_path}"
+        fp = hashlib.sha1(spec.encode("utf-8")).hexdigest()[:16]
+        tokenizer._mindcare_fingerprint = fp
+    return fp
+
+
+def _max_length(tokenizer, max_length: int = None) -> int:
+    limit = tokenizer.model_max_length if tokenizer.model_max_length and tokenizer.model_max_length < 100_000 else MAX_SEQ_LEN
+    return min(max_length or MAX_SEQ_LEN, limit)
+
+
+def encode_batch(tokenizer, texts: List[str], max_length: int = None) -> List[dict]:
+    """Truncated encodings for `texts` (already normalized); only cache misses are tokenized."""
+    fp = _fingerprint(tokenizer)
+    max_length = _max_length(tokenizer, max_length)
+    keys = [(fp, max_length, hashlib.sha1(t.encode("utf-8")).digest()) for t in texts]
+
+    out = [None] * len(texts)
+    missing = []
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            enc = _cache.get(key)
+            if enc is not None:
+                _cache.move_to_end(key)
+                out[i] = enc
+            else:
+                missing.append(i)
+    metrics.inc("tokens.cache_hits", len(texts) - len(missing))
+    metrics.inc("tokens.cache_misses", len(missing))
+
+    if missing:
+        batch = tokenizer([texts[i] for i in missing], truncation=True, max_length=max_length)
+        with _cache_lock:
+            for j, i in enumerate(missing):
+                enc = {"input_ids": batch["input_ids"][j], "attention_mask": batch["attention_mask"][j]}
+                if len(enc["input_ids"]) >= max_length:
+                    metrics.inc("tokens.truncated")
+                _cache[keys[i]] = out[i] = enc
+            while len(_cache) > TOKEN_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return out
+
+
+def model_inputs(tokenizer, texts: List[str], device, max_length: int = None) -> dict:
+    """Padded tensors for one forward pass, built from cached encodings."""
+    padded = tokenizer.pad(encode_batch(tokenizer, texts, max_length), return_tensors="pt")
+    return {k: v.to(device) for k, v in padded.items()}
+
+
+def classify(pipe, texts: List[str], max_length: int = None) -> Tuple[np.ndarray, List[str]]:
+    """
+    Class probabilities for `texts` from a text-classification pipeline's model:
+    float32 array of shape (len(texts), num_labels) and the lowercased labels in column order.
+    """
+    model = pipe.model
+    inputs = model_inputs(pipe.tokenizer, [normalize_text(t) for t in texts], model.device, max_length)
+    with torch.inference_mode():
+        logits = model(**inputs).logits.float()
+    if getattr(model.config, "problem_type", None) == "multi_label_classification":
+        probs = torch.sigmoid(logits)
+    else:
+        probs = torch.softmax(logits, dim=-1)
+    labels = [model.config.id2label[i].lower() for i in range(probs.shape[-1])]
+    return probs.cpu().numpy().astype(np.float32), labels
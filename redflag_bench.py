@@ -0,0 +1,237 @@
+# redflag_bench.py
+# Gating benchmark for the red-flag fast lane. Generates a deterministic synthetic corpus of
+# crisis-phrase variants (spacing, punctuation between words, inflections, leetspeak, case,
+# missing accents, surrounding noise), crises phrased around a negation cue ("never felt so
+# worthless", "why not end it all"), and benign / negated / near-miss messages composed from
+# parts so they rarely repeat, then measures recall (overall and for the negation-context
+# crises), false-positive rate and per-message latency of redflags.screen_redflags.
+#
+#   python redflag_bench.py                 # 200k messages, exit 1 if a gate is missed
+#   python redflag_bench.py --size 500000 --dump corpus.jsonl
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import List, Tuple
+
+import vocab
+from redflags import REDFLAGS_BY_LANG, screen_batch, screen_redflags
+from config import REDFLAG_BENCH_MIN_RECALL, REDFLAG_BENCH_MAX_FPR, REDFLAG_BENCH_MAX_P99_MS
+
+# ---- Surface forms per canonical phrase (beyond the phrase itself) ----
+_FORMS = {
+    "kill myself": ["kill my self", "killing myself", "killmyself", "kill-my-self"],
+    "self-harm": ["self harm", "selfharm", "self harming", "self-harmed"],
+    "end it all": ["ending it all", "end it. all"],
+    "suicide": ["suicides"],
+    "overdose": ["overdosed", "overdosing", "overdoses"],
+    "cutting": ["cut myself", "cut my self"],
+    "quitarme la vida": ["quitarme  la  vida"],
+    "autolesión": ["autolesion"],
+}
+
+_POS_TEMPLATES = [
+    "{p}", "i want to {p}", "I think about {p} every night", "honestly i feel {p}",
+    "sometimes I just want to {p}...", "{p}. that's all I can think about",
+    "been thinking of {p} lately tbh", "I can't stop thinking about {p}",
+    "my friend said I seem {p} and maybe they're right", "what if I {p}",
+    "{p}!!!", "(({p}))", "ugh, {p}, again", "no sé qué hacer, {p}", "tengo ganas de {p}",
+]
+
+# Crises with a negation cue nearby that does not negate the phrase: intensifiers, rhetorical
+# questions, a cue in an earlier clause. All must raise urgent.
+_NEGATION_CONTEXT_TEMPLATES = [
+    "I have never felt so {p}", "never been this {p} in my life", "why not {p}",
+    "honestly, why not just {p}?", "I don't know anymore, {p}", "not gonna lie, {p}",
+    "I'm not okay and I want to {p}", "never thought I'd say it but {p}",
+    "I don't want help. I want to {p}", "nothing is ever going to change so {p}",
+    "I can't not think about {p}", "nobody would even notice if I {p}",
+    "I'm trying so hard not to {p}", "I keep telling myself not to {p}",
+]
+
+# Benign messages are composed from parts; near-miss words ("cut", "killed it", "hopelessly")
+# appear in the activities.
+_OPENERS = ["", "so ", "today ", "honestly ", "yesterday ", "this week ", "ok, ", "well, "]
+_SUBJECTS = ["I", "my sister", "we", "my boss", "my roommate", "my friend", "the team", "mom", "she", "he"]
+_ACTIVITIES = [
+    "had a long day at work", "went for a walk in the park", "missed the bus", "watched a movie",
+    "cut the vegetables for dinner", "killed it at the presentation", "is cutting back on coffee",
+    "took a selfie", "finished the project", "cooked pasta", "went to the gym", "felt a bit anxious",
+    "was hopelessly late", "cut the grass", "talked about the exam", "slept badly", "fixed the bike",
+    "painted the kitchen", "had a tough meeting", "was overwhelmed but managed", "stayed home",
+]
+_TAILS = ["", " but I'm okay", " and it was fine", " lol", ", need sleep", " again", " before lunch",
+          ", kind of stressful", " and then we had pizza", " tbh"]
+_NEG_SPANISH = ["estoy cansado pero bien", "me siento un poco estresada hoy", "fuimos al cine",
+                "mañana tengo examen", "hoy corté el césped"]
+
+# Statements that directly negate a phrase (must not raise urgent); {p} is a negatable phrase
+_NEGATED_TEMPLATES = [
+    "I'm not {p}, just tired", "I would never {p}", "I don't feel {p} anymore",
+    "I'm not thinking about {p}, don't worry", "I have never been {p}", "not {p}, just stressed",
+    "she's not feeling {p} today", "I'm not {p}. I promise",
+]
+
+# Fixed sentences with a known answer, checked one by one on every run. Intensifiers,
+# rhetorical questions, imperatives and "not to" around a negation cue are still crises, and
+# suicide / overdose phrases are urgent even when negated.
+_REGRESSION = [
+    ("I have never felt so worthless", True),
+    ("never been this hopeless", True),
+    ("why not end it all", True),
+    ("I am trying so hard not to kill myself", True),
+    ("I keep telling myself not to end it all", True),
+    ("I promised my mom I would not overdose again", True),
+    ("Do not be worthless", True),
+    ("I'm not suicidal, just tired", True),
+    ("I would never kill myself", True),
+    ("so many suicides this year", True),
+    ("I'm not hopeless, just tired", False),
+    ("I have never been cutting", False),
+]
+
+_LEET = {"a": "4", "e": "3", "i": "1", "o": "0", "s": "5", "t": "7"}
+_NOISE = ["", "", "", "hey. ", "ok so ", "idk ", "lol ", "Day 3. "]
+
+
+def _leet(text: str, rng: random.Random) -> str:
+    return "".join(_LEET[c] if c in _LEET and rng.random() < 0.4 else c for c in text)
+
+
+def _perturb(phrase: str, rng: random.Random) -> str:
+    form = rng.choice([phrase] + _FORMS.get(phrase, []))
+    r = rng.random()
+    if r < 0.15:
+        form = _leet(form, rng)
+    elif r < 0.25:
+        form = form.upper()
+    elif r < 0.35:
+        form = rng.choice([" ", ". ", ", ", " - ", "  ", "_"]).join(form.split(" "))
+    elif r < 0.45:
+        form = form.title()
+    return form
+
+
+def _benign(rng: random.Random) -> str:
+    if rng.random() < 0.05:
+        return rng.choice(_NEG_SPANISH)
+    return (rng.choice(_OPENERS) + rng.choice(_SUBJECTS) + " " + rng.choice(_ACTIVITIES)
+            + rng.choice(_TAILS) + rng.choice(["", "", " " + str(rng.randint(1, 99))]))
+
+
+def generate_corpus(size: int, seed: int = 0, positive_share: float = 0.5) -> Tuple[List[str], List[bool], List[str]]:
+    """(texts, expected urgent flags, kind) with kind in positive / negation_context / benign / negated."""
+    rng = random.Random(seed)
+    phrases = [p for ps in REDFLAGS_BY_LANG.values() for p in ps]
+    english = REDFLAGS_BY_LANG.get("en", [])
+    negatable = sorted(vocab.current().negatable)
+    texts, expected, kinds = [], [], []
+    for _ in range(size):
+        if rng.random() < positive_share:
+            if rng.random() < 0.2:
+                text = rng.choice(_NEGATION_CONTEXT_TEMPLATES).format(p=_perturb(rng.choice(english), rng))
+                kinds.append("negation_context")
+            else:
+                text = rng.choice(_POS_TEMPLATES).format(p=_perturb(rng.choice(phrases), rng))
+                kinds.append("positive")
+            expected.append(True)
+        elif rng.random() < 0.1 and negatable:
+            text = rng.choice(_NEGATED_TEMPLATES).format(p=_perturb(rng.choice(negatable), rng))
+            expected.append(False)
+            kinds.append("negated")
+        else:
+            text = _benign(rng)
+            expected.append(False)
+            kinds.append("benign")
+        texts.append(rng.choice(_NOISE) + text)
+    return texts, expected, kinds
+
+
+def run(size: int = 200_000, seed: int = 0, latency_sample: int = 5000) -> dict:
+    texts, expected, kinds = generate_corpus(size, seed)
+
+    start = time.perf_counter()
+    flagged = screen_batch(texts)
+    batch_s = time.perf_counter() - start
+
+    tp = sum(f and e for f, e in zip(flagged, expected))
+    fp = sum(f and not e for f, e in zip(flagged, expected))
+    positives = sum(expected)
+    negatives = len(expected) - positives
+    in_context = [f for f, k in zip(flagged, kinds) if k == "negation_context"]
+    misses, false_pos = {}, {}
+    for text, f, e in zip(texts, flagged, expected):
+        if f != e:
+            errors = misses if e else false_pos
+            errors[text] = errors.get(text, 0) + 1
+
+    # per-message latency of the real entry point on a sample
+    rng = random.Random(seed + 1)
+    sample = rng.sample(texts, min(latency_sample, len(texts)))
+    lat = []
+    for text in sample:
+        t0 = time.perf_counter()
+        screen_redflags(text)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    lat.sort()
+
+    def pct(q):
+        return lat[min(len(lat) - 1, int(q / 100 * len(lat)))] if lat else 0.0
+
+    regressions = [text for text, urgent in _REGRESSION if screen_redflags(text)["urgent"] != urgent]
+
+    return {
+        "messages": len(texts),
+        "recall": tp / positives if positives else 1.0,
+        "negation_context_recall": sum(in_context) / len(in_context) if in_context else 1.0,
+        "false_positive_rate": fp / negatives if negatives else 0.0,
+        "distinct_negatives": len({t for t, e in zip(texts, expected) if not e}),
+        "batch_msgs_per_s": len(texts) / batch_s if batch_s else 0.0,
+        "latency_ms": {"p50": pct(50), "p99": pct(99), "max": lat[-1] if lat else 0.0},
+        "top_misses": sorted(misses.items(), key=lambda kv: -kv[1])[:10],
+        "top_false_positives": sorted(false_pos.items(), key=lambda kv: -kv[1])[:10],
+        "regressions": regressions,
+    }
+
+
+def gate(report: dict) -> List[str]:
+    """Gates that the report misses (empty list = pass)."""
+    failures = []
+    if report["recall"] < REDFLAG_BENCH_MIN_RECALL:
+        failures.append(f"recall {report['recall']:.4f} < {REDFLAG_BENCH_MIN_RECALL}")
+    if report["negation_context_recall"] < REDFLAG_BENCH_MIN_RECALL:
+        failures.append(f"negation-context recall {report['negation_context_recall']:.4f} < {REDFLAG_BENCH_MIN_RECALL}")
+    if report["false_positive_rate"] > REDFLAG_BENCH_MAX_FPR:
+        failures.append(f"false positive rate {report['false_positive_rate']:.4f} > {REDFLAG_BENCH_MAX_FPR}")
+    for text in report["regressions"]:
+        failures.append(f"regression case wrong: {text!r}")
+    if report["latency_ms"]["p99"] > REDFLAG_BENCH_MAX_P99_MS:
+        failures.append(f"p99 latency {report['latency_ms']['p99']:.3f}ms > {REDFLAG_BENCH_MAX_P99_MS}ms")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Red-flag recall / false-positive / latency benchmark.")
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dump", help="also write the generated corpus as JSONL")
+    args = parser.parse_args(argv)
+
+    if args.dump:
+        texts, expected, kinds = generate_corpus(args.size, args.seed)
+        with open(args.dump, "w", encoding="utf-8") as f:
+            for text, e, kind in zip(texts, expected, kinds):
+                f.write(json.dumps({"text": text, "urgent": e, "kind": kind}, ensure_ascii=False) + "\n")
+
+    report = run(args.size, args.seed)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    failures = gate(report)
+    for failure in failures:
+        print("GATE FAILED:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
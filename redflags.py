@@ -0,0 +1,131 @@
+# redflags.py
+# Red-flag fast lane: precompiled crisis-phrase matcher that runs before any model inference
+
+import re
+import time
+from bisect import bisect_right
+from typing import Dict, List
+
+import vocab
+from config import REDFLAG_BUDGET_MS, REDFLAG_URGENT_WEIGHT
+
+# Phrases, spelling variants and weights come from the vocabulary file (see vocab.py) and are
+# hot-reloaded. Screening is language-independent: every language's phrases are in the one
+# matcher, so a crisis message is caught even if language detection gets it wrong.
+# REDFLAGS / REDFLAGS_BY_LANG are the phrases at import time; use vocab.current() for live ones.
+REDFLAGS_BY_LANG = vocab.current().redflags_by_lang
+REDFLAGS = REDFLAGS_BY_LANG.get("en", [])
+
+# --- Negation ---
+# A hit counts as negated only when a cue directly negates it, optionally through a short
+# copula / feeling verb: "not hopeless", "I'm not feeling worthless", "never been cutting".
+# Intensified, rhetorical, imperative and "not to" forms stay urgent: "never felt so
+# worthless", "why not end it all", "do not be worthless", "trying not to cut". Negated hits
+# are reported but do not raise urgent. Which phrases can be negated is set in the
+# vocabulary file; suicide, overdose and "kill myself" style phrases never are, so they are
+# urgent however they are phrased.
+_NEGATION_CUES = {
+    "not", "never", "don't", "dont", "doesn't", "didn't", "isn't", "wasn't", "aren't",
+}
+# words allowed between the cue and the phrase (at most _NEGATION_MAX_LINKS of them)
+_NEGATION_LINKS = {"be", "been", "being", "feel", "feeling", "thinking", "about"}
+_NEGATION_MAX_LINKS = 2
+# a cue right after one of these is not a negation ("why not end it all")
+_NEGATION_BREAKERS = {"why"}
+# "don't be" / "do not be" is an imperative, not a statement about oneself
+_IMPERATIVE_CUES = {"don't", "dont"}
+_CLAUSE_RE = re.compile(r"[.,;:!?\n]")
+_WORD_RE = re.compile(r"[a-z']+")
+# Text is normalized before matching with a one-to-one character map, so match offsets
+# still index the original text: curly apostrophes, and leetspeak ("su1c1de", "k1ll my$elf").
+_NORMALIZE = str.maketrans({
+    "’": "'", "‘": "'", "`": "'",
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s",
+})
+
+
+def _is_negated(prefix: str) -> bool:
+    """Whether the text right before a hit (`prefix`) directly negates it."""
+    clause = _CLAUSE_RE.split(prefix)[-1]
+    words = _WORD_RE.findall(clause.lower())
+    i = len(words) - 1
+    links = 0
+    while i >= 0 and words[i] in _NEGATION_LINKS and links < _NEGATION_MAX_LINKS:
+        i -= 1
+        links += 1
+    if i < 0 or words[i] not in _NEGATION_CUES:
+        return False
+    if i + 1 < len(words) and words[i + 1] == "be" and (
+            words[i] in _IMPERATIVE_CUES or (words[i] == "not" and i > 0 and words[i - 1] == "do")):
+        return False
+    return not (i > 0 and words[i - 1] in _NEGATION_BREAKERS)
+
+
+def screen_redflags(text: str) -> Dict[str, object]:
+    """
+    Scan text for red-flag phrases without touching any model.
+    Returns:
+      {
+        "red_flags": list of canonical phrases found (not negated),
+        "negated": list of canonical phrases found only in negated form,
+        "urgent": bool,
+        "elapsed_ms": float,
+        "within_budget": bool
+      }
+    """
+    start = time.perf_counter()
+    t = (text or "").translate(_NORMALIZE)
+
+    v = vocab.current()
+    hits, negated = set(), set()
+    for m in v.redflag_re.finditer(t):
+        phrase = v.redflag_phrases[int(m.lastgroup[1:])]
+        if phrase in v.negatable and _is_negated(t[max(0, m.start() - 40):m.start()]):
+            negated.add(phrase)
+        else:
+            hits.add(phrase)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    return {
+        "red_flags": sorted(hits),
+        "negated": sorted(negated - hits),
+        "urgent": sum(v.redflag_weights[p] for p in hits) >= REDFLAG_URGENT_WEIGHT,
+        "elapsed_ms": elapsed_ms,
+        "within_budget": elapsed_ms <= REDFLAG_BUDGET_MS,
+    }
+
+
+def screen_batch(texts: List[str]) -> List[bool]:
+    """
+    Urgent flag per text, same decision as screen_redflags() but with one regex pass over
+    all texts joined together (for benchmarks and offline scoring). A hit that spans texts
+    is discarded and every text it touches re-screened on its own (it may have swallowed a
+    real hit in the later one).
+    """
+    v = vocab.current()
+    norm = [(t or "").translate(_NORMALIZE) for t in texts]
+    starts, pos = [], 0
+    for t in norm:
+        starts.append(pos)
+        pos += len(t) + 2
+    joined = "\n\n".join(norm)
+
+    weight = [0.0] * len(norm)
+    seen = set()
+    recheck = set()
+    for m in v.redflag_re.finditer(joined):
+        i = bisect_right(starts, m.start()) - 1
+        if m.end() > starts[i] + len(norm[i]):
+            recheck.update(range(i, bisect_right(starts, m.end() - 1)))
+            continue
+        phrase = v.redflag_phrases[int(m.lastgroup[1:])]
+        if (i, phrase) in seen:
+            continue
+        lo = max(starts[i], m.start() - 40)
+        if phrase not in v.negatable or not _is_negated(joined[lo:m.start()]):
+            seen.add((i, phrase))
+            weight[i] += v.redflag_weights[phrase]
+    urgent = [w >= REDFLAG_URGENT_WEIGHT for w in weight]
+    for i in recheck:
+        urgent[i] = screen_redflags(texts[i])["urgent"]
+    return urgent
@@ -0,0 +1,178 @@
+# registry.py
+# Central model registry: one lock-guarded singleton per model, bounded concurrent inference
+# per model, refcounts so a model is never unloaded mid-call, and a residency/memory report.
+
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import torch
+
+import metrics
+from config import MODEL_INFERENCE_SLOTS, TORCH_NUM_THREADS
+from degradation import controller
+
+
+def model_bytes(obj) -> int:
+    """Parameter + buffer bytes of a model or pipeline (0 if it has no torch module)."""
+    module = getattr(obj, "model", obj)
+    if not isinstance(module, torch.nn.Module):
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _Entry:
+    def __init__(self, factory: Callable, slots: int):
+        self.factory = factory
+        self.load_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(slots)
+        self.state_lock = threading.Lock()
+        self.obj = None
+        self.refcount = 0
+        self.bytes = 0
+        self.loaded_at = None
+        self.last_used = None
+        self.load_count = 0
+
+
+class ModelRegistry:
+    def __init__(self, slots: int = MODEL_INFERENCE_SLOTS):
+        self.slots = slots
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._threads_configured = False
+
+    def register(self, name: str, factory: Callable, slots: int = None):
+        """Declare how to build `name`; nothing is loaded until first use."""
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(factory, slots or self.slots)
+
+    def _entry(self, name: str) -> _Entry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"Model '{name}' is not registered") from None
+
+    def configure_threads(self, n: int = None):
+        """
+        Split the cores between concurrently running models instead of oversubscribing them.
+        `n` fixes the intra-op thread count (e.g. the cores an inference worker is pinned to).
+        """
+        if self._threads_configured:
+            return
+        with self._lock:
+            if self._threads_configured:
+                return
+            n = n or TORCH_NUM_THREADS
+            if n is None:
+                workers = max(1, len(self._entries) * self.slots)
+                n = max(1, (os.cpu_count() or 1) // workers)
+            torch.set_num_threads(n)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:  # already set, or parallel work has started
+                pass
+            self._threads_configured = True
+
+    def get(self, name: str):
+        """Loaded object for `name`, loading it exactly once across threads."""
+        entry = self._entry(name)
+        with entry.state_lock:
+            obj = entry.obj
+            entry.last_used = time.time()
+        if obj is None:
+            waited = time.perf_counter()
+            self.configure_threads()
+            try:
+                with entry.load_lock:
+                    obj = entry.obj
+                    if obj is None:
+                        start = time.perf_counter()
+                        obj = entry.factory()
+                        with entry.state_lock:
+                            entry.obj = obj
+                            entry.bytes = model_bytes(obj)
+                            entry.loaded_at = entry.last_used = time.time()
+                            entry.load_count += 1
+                        metrics.observe(f"registry.load_ms.{name}", (time.perf_counter() - start) * 1000.0)
+                        metrics.set_gauge(f"registry.bytes.{name}", entry.bytes)
+                        if entry.load_count > 1:
+                            metrics.inc(f"registry.reloads.{name}")
+                        # idle / memory-pressure eviction runs alongside the first loaded model
+                        from memory_manager import start_memory_manager
+                        start_memory_manager(self)
+            finally:
+                # loading (or waiting for another thread's load) is not stage latency
+                controller.exclude((time.perf_counter() - waited) * 1000.0)
+        return obj
+
+    def acquire(self, name: str):
+        """Load if needed and pin: the model cannot be unloaded until release()."""
+        entry = self._entry(name)
+        with entry.state_lock:
+            entry.refcount += 1
+        try:
+            return self.get(name)
+        except Exception:
+            self.release(name)
+            raise
+
+    def release(self, name: str):
+        entry = self._entry(name)
+        with entry.state_lock:
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.time()
+
+    @contextmanager
+    def use(self, name: str):
+        """Pinned model plus one of its inference slots for the duration of a call."""
+        obj = self.acquire(name)
+        entry = self._entries[name]
+        try:
+            with entry.slots:
+                yield obj
+        finally:
+            self.release(name)
+
+    def unload(self, name: str, unused_since: float = None) -> bool:
+        """
+        Drop a model that nobody holds; returns False if it is in use, not loaded, or (with
+        `unused_since`) was used after that time. Its weight files are unmapped by the garbage
+        collector once the last tensor viewing them is gone, never closed explicitly.
+        """
+        entry = self._entry(name)
+        with entry.load_lock, entry.state_lock:
+            if entry.obj is None or entry.refcount > 0:
+                return False
+            if unused_since is not None and entry.last_used > unused_since:
+                return False
+            entry.obj = None
+            entry.bytes = 0
+            entry.loaded_at = None
+        gc.collect()
+        metrics.set_gauge(f"registry.bytes.{name}", 0)
+        metrics.inc(f"registry.unloads.{name}")
+        return True
+
+    def resident(self) -> Dict[str, dict]:
+        """Loaded models with refcount, parameter bytes, load/last-use time and load count."""
+        report = {}
+        for name, entry in list(self._entries.items()):
+            with entry.state_lock:
+                if entry.obj is not None:
+                    report[name] = {
+                        "refcount": entry.refcount,
+                        "bytes": entry.bytes,
+                        "loaded_at": entry.loaded_at,
+                        "last_used": entry.last_used,
+                        "load_count": entry.load_count,
+                    }
+        return report
+
+
+registry = ModelRegistry()
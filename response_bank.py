@@ -0,0 +1,241 @@
+# response_bank.py
+# Curated replies for common (stress label, symptoms, coping) combinations, served by
+# empathetic_reply as a first tier before live generation (RESPONSE_BANK_ENABLED).
+# `python response_bank.py build history.jsonl` runs historical messages through
+# detect_stress / extract_signals, keeps combinations seen at least RESPONSE_BANK_MIN_SUPPORT
+# times, and curates up to RESPONSE_BANK_VARIANTS replies for each: replies already in the
+# history first, then freshly generated ones; each must pass quality_gate, must not mention
+# the source message's triggers (names, places), and must differ from the kept variants.
+# At runtime the bank is a dict keyed on (stress label, symptoms bits, coping bits), so a
+# lookup is one hash of three values; a variant is picked at random per hit. The key cannot
+# tell a bereavement or a named person from a generic message, so messages with triggers
+# are never served from the bank, nor is any message with a red-flag phrase, negated or not.
+#
+# History lines: {"text": "...", "reply": "..."} or {"text": "...", "replies": {"flan": ..., "groq": ...}}
+# (replies optional).
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from redflags import screen_redflags
+from signals import Signals, VOCABS
+from config import (
+    RESPONSE_BANK_PATH, RESPONSE_BANK_MIN_SUPPORT, RESPONSE_BANK_VARIANTS, EVAL_BATCH_SIZE,
+)
+
+_rng = random.Random()
+
+
+def _excluded(signals: Signals) -> bool:
+    """
+    Crisis messages always get a live reply; so do messages that name people, places or
+    events (triggers) and messages with no symptom or coping terms.
+    """
+    return bool(signals.urgent or signals.red_flags or signals.triggers
+                or not (signals.symptoms or signals.coping))
+
+
+def _mentions_red_flag(user_text: str) -> bool:
+    """Any red-flag phrase, including ones the screen judged negated ("I'm not suicidal")."""
+    screen = screen_redflags(user_text)
+    return bool(screen["red_flags"] or screen["negated"])
+
+
+class ResponseBank:
+    """Immutable lookup table built from a bank file."""
+
+    def __init__(self, entries: List[dict] = (), meta: dict = None):
+        self.meta = meta or {}
+        self._index: Dict[Tuple[str, int, int], Tuple[str, ...]] = {}
+        for entry in entries:
+            key = (entry["stress_label"],
+                   VOCABS["symptoms"].encode(entry["symptoms"]),
+                   VOCABS["coping"].encode(entry["coping"]))
+            variants = tuple(v["text"] for v in entry["variants"] if v.get("text"))
+            if variants:
+                self._index[key] = variants
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @classmethod
+    def load(cls, path: str = RESPONSE_BANK_PATH) -> "ResponseBank":
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        bank = cls(data.get("entries", []), {k: v for k, v in data.items() if k != "entries"})
+        metrics.set_gauge("response_bank.entries", len(bank))
+        return bank
+
+    def lookup(self, user_text: str, stress_label: str, signals: Signals) -> Optional[str]:
+        """A random curated variant for this combination, or None."""
+        if _excluded(signals) or _mentions_red_flag(user_text):
+            metrics.inc("response_bank.skipped")
+            return None
+        variants = self._index.get((stress_label, signals.symptoms, signals.coping))
+        metrics.inc("response_bank.hits" if variants else "response_bank.misses")
+        metrics.set_gauge("response_bank.hit_rate", hit_rate())
+        return _rng.choice(variants) if variants else None
+
+
+def hit_rate() -> float:
+    """Share of eligible lookups served from the bank (skipped lookups not counted)."""
+    hits = metrics.counter("response_bank.hits")
+    total = hits + metrics.counter("response_bank.misses")
+    return hits / total if total else 0.0
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_response_bank() -> ResponseBank:
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = ResponseBank.load()
+    return _bank
+
+
+# ---- Offline build ----
+def _read_jsonl(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _history_replies(item: dict) -> List[str]:
+    replies = list((item.get("replies") or {}).values())
+    if item.get("reply"):
+        replies.append(item["reply"])
+    return [r for r in replies if isinstance(r, str) and r.strip()]
+
+
+def _curate(candidates: List[Tuple[str, str, Tuple[str, ...]]], limit: int) -> List[dict]:
+    """Keep up to `limit` (text, source) candidates that pass the gate and are distinct."""
+    from generate_response import quality_gate
+
+    kept, seen = [], set()
+    for text, source, triggers in candidates:
+        text = text.strip()
+        norm = " ".join(text.lower().split())
+        if norm in seen or quality_gate(text) is not None:
+            continue
+        if any(len(t) >= 3 and t.lower() in norm for t in triggers):
+            continue  # refers to someone's specifics
+        seen.add(norm)
+        kept.append({"text": text, "source": source})
+        if len(kept) >= limit:
+            break
+    return kept
+
+
+def build(history: str, out: str = RESPONSE_BANK_PATH, min_support: int = RESPONSE_BANK_MIN_SUPPORT,
+          variants: int = RESPONSE_BANK_VARIANTS, generate: str = "both",
+          batch_size: int = EVAL_BATCH_SIZE) -> dict:
+    """Build the bank file from `history`; returns the coverage report stored in it."""
+    from classifier import detect_stress_batch
+    from extractor import extract_signals
+    from generate_response import flan_reply, groq_reply
+
+    generators = {"flan": lambda *a: flan_reply(*a, profile="quality"), "groq": groq_reply}
+    backends = ("groq", "flan") if generate == "both" else () if generate == "none" else (generate,)
+
+    items = list(_read_jsonl(history))
+    groups = defaultdict(list)  # (label, symptoms, coping) -> [(item, stress result, signals)]
+    excluded = 0
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        for item, res in zip(batch, detect_stress_batch([it["text"] for it in batch], batch_size=batch_size)):
+            signals = extract_signals(item["text"], lang=res["language"])
+            if res["stress_label"] == "unknown" or _excluded(signals) or _mentions_red_flag(item["text"]):
+                excluded += 1
+                continue
+            key = (res["stress_label"], signals["symptoms"], signals["coping"])
+            groups[key].append((item, res, signals))
+
+    entries, covered = [], 0
+    for (label, symptoms, coping), members in sorted(groups.items(), key=lambda kv: -len(kv[1])):
+        if len(members) < min_support:
+            continue
+        candidates = [(reply, "history", signals["triggers"])
+                      for item, _, signals in members for reply in _history_replies(item)]
+        chosen = _curate(candidates, variants)
+        # the generators are called directly so the semantic cache / an older bank are not reused
+        for item, res, signals in members[:2 * variants]:
+            if len(chosen) >= variants or not backends:
+                break
+            fresh = []
+            for name in backends:
+                try:
+                    text = generators[name](item["text"], label, res["stress_score"], signals)
+                except Exception as e:
+                    print(f"Response bank: {name} generation failed:", e)
+                    continue
+                fresh.append((text, name, signals["triggers"]))
+            chosen = _curate([(v["text"], v["source"], ()) for v in chosen] + fresh, variants)
+        if not chosen:
+            continue
+        covered += len(members)
+        entries.append({"stress_label": label, "symptoms": list(symptoms), "coping": list(coping),
+                        "support": len(members), "variants": chosen})
+
+    eligible = len(items) - excluded
+    report = {
+        "messages": len(items),
+        "eligible": eligible,
+        "combinations": len(groups),
+        "entries": len(entries),
+        "variants": sum(len(e["variants"]) for e in entries),
+        "coverage": covered / eligible if eligible else 0.0,
+    }
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"built_at": time.time(), "source": os.path.basename(history), "report": report,
+                   "entries": entries}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, out)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the curated response bank.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="build the bank from historical messages")
+    b.add_argument("history", help="JSONL file, one historical message per line")
+    b.add_argument("--out", default=RESPONSE_BANK_PATH)
+    b.add_argument("--min-support", type=int, default=RESPONSE_BANK_MIN_SUPPORT)
+    b.add_argument("--variants", type=int, default=RESPONSE_BANK_VARIANTS)
+    b.add_argument("--generate", choices=["flan", "groq", "both", "none"], default="both",
+                   help="generator for combinations without enough historical replies")
+    b.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE)
+    r = sub.add_parser("report", help="print the coverage report of a built bank")
+    r.add_argument("--path", default=RESPONSE_BANK_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        report = build(args.history, args.out, args.min_support, args.variants, args.generate, args.batch_size)
+    else:
+        bank = ResponseBank.load(args.path)
+        if not bank.meta:
+            print(f"No response bank at {args.path}")
+            return 1
+        report = {**bank.meta.get("report", {}), "loaded_entries": len(bank)}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+# response_cache.py
+# Opt-in semantic cache for empathetic_reply: embeds (message, stress label, signals),
+# looks up near neighbours in a local ANN index and reuses a previous response.
+# Replies are shared across users, so messages naming people, places or events (any
+# trigger) are never cached, and only embeddings and a hash of the key text are persisted,
+# never the message itself.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import metrics
+from artifacts import load_pipeline
+from registry import registry
+from signals import Signals
+from config import (
+    DEVICE,
+    EMBED_MODEL,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_THRESHOLD,
+)
+
+try:
+    import hnswlib
+except ImportError:  # optional; brute-force NumPy search is used instead
+    hnswlib = None
+
+# --- Embedding pipeline ---
+registry.register("embed", lambda: load_pipeline("feature-extraction", EMBED_MODEL, device=DEVICE))
+
+
+def get_embed_pipe():
+    return registry.get("embed")
+
+
+def cache_key_text(user_text: str, stress_label: str, signals: Signals) -> str:
+    """Text that gets embedded: stress label and keyword signals first, then the message."""
+    parts = [f"stress: {stress_label}"]
+    for key in ("symptoms", "coping"):
+        values = signals.get(key) or []
+        if values:
+            parts.append(f"{key}: {', '.join(values)}")
+    parts.append((user_text or "").strip().lower())
+    return " | ".join(parts)
+
+
+def embed(text: str) -> np.ndarray:
+    """Mean-pooled, L2-normalised sentence embedding (float32)."""
+    with registry.use("embed") as pipe:
+        tokens = np.asarray(pipe(text, truncation=True)[0], dtype=np.float32)
+    vec = tokens.mean(axis=0)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+# --- Vector indexes ---
+class _NumpyIndex:
+    """
+    Brute-force cosine search over a dense matrix (vectors are pre-normalised). Rows are
+    preallocated for `capacity` entries and freed rows reused, so inserts do not copy.
+    """
+
+    def __init__(self, dim: int, capacity: int):
+        self.dim = dim
+        self._reset(capacity)
+
+    def _reset(self, capacity: int):
+        self.capacity = capacity
+        self.ids = np.full(capacity, -1, dtype=np.int64)  # -1 marks a free row
+        self.vecs = np.zeros((capacity, self.dim), dtype=np.float32)
+        self._rows = {}  # item id -> row
+        self._free = list(range(capacity - 1, -1, -1))  # lowest row is reused first
+        self._size = 0  # rows past this were never used
+
+    def add(self, item_id: int, vec: np.ndarray):
+        row = self._rows.get(item_id)
+        if row is None:
+            row = self._free.pop()
+            self._rows[item_id] = row
+            self.ids[row] = item_id
+            self._size = max(self._size, row + 1)
+        self.vecs[row] = vec
+
+    def remove(self, item_id: int):
+        row = self._rows.pop(item_id, None)
+        if row is not None:
+            self.ids[row] = -1
+            self._free.append(row)
+
+    def query(self, vec: np.ndarray):
+        if not self._rows:
+            return None, 0.0
+        sims = self.vecs[:self._size] @ vec
+        sims[self.ids[:self._size] < 0] = -np.inf
+        best = int(np.argmax(sims))
+        return int(self.ids[best]), float(sims[best])
+
+    def save(self, path: str):
+        used = self.ids[:self._size] >= 0
+        np.savez(path + ".npz", ids=self.ids[:self._size][used], vecs=self.vecs[:self._size][used])
+
+    def load(self, path: str):
+        data = np.load(path + ".npz")
+        ids, vecs = data["ids"], data["vecs"]
+        self._reset(max(self.capacity, len(ids)))
+        for item_id, vec in zip(ids, vecs):
+            self.add(int(item_id), vec)
+
+
+class _HnswIndex:
+    """HNSW index (hnswlib) with slot reuse for evicted entries."""
+
+    def __init__(self, dim: int, capacity: int):
+        self.dim = dim
+        self.capacity = capacity
+        self.index = hnswlib.Index(space="cosine", dim=dim)
+        self.index.init_index(max_elements=capacity, ef_construction=200, M=16,
+                              allow_replace_deleted=True)
+        self.index.set_ef(64)
+        self.size = 0
+
+    def add(self, item_id: int, vec: np.ndarray):
+        self.index.add_items(vec[None, :], [item_id], replace_deleted=True)
+        self.size += 1
+
+    def remove(self, item_id: int):
+        self.index.mark_deleted(item_id)
+        self.size -= 1
+
+    def query(self, vec: np.ndarray):
+        if self.size <= 0:
+            return None, 0.0
+        labels, distances = self.index.knn_query(vec[None, :], k=1)
+        return int(labels[0][0]), 1.0 - float(distances[0][0])
+
+    def save(self, path: str):
+        self.index.save_index(path + ".hnsw")
+
+    def load(self, path: str):
+        self.index.load_index(path + ".hnsw", max_elements=self.capacity,
+                              allow_replace_deleted=True)
+
+
+# --- Cache ---
+_SAVE_EVERY = 50  # persist after this many inserts
+
+
+class SemanticCache:
+    """
+    LRU-bounded semantic cache of reply dicts.
+    Urgent / red-flag messages and messages with triggers are never looked up or stored.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 path: Optional[str] = SEMANTIC_CACHE_PATH):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> {"reply": dict, "key_hash": str, "created": float}
+        self._index = None
+        self._next_id = 0
+        if path and os.path.exists(path + ".json"):
+            self.load()
+
+    def _make_index(self, dim: int):
+        cls = _HnswIndex if hnswlib is not None else _NumpyIndex
+        return cls(dim, self.max_entries)
+
+    @staticmethod
+    def _excluded(signals: Signals) -> bool:
+        return bool(signals.urgent or signals.red_flags or signals.triggers)
+
+    def lookup(self, user_text: str, stress_label: str,
+               signals: Signals) -> Tuple[Optional[Dict[str, str]], Optional[np.ndarray]]:
+        """
+        (cached reply dict for a near-duplicate request or None, the request's embedding).
+        Pass the embedding to store() on a miss so it is not computed twice.
+        """
+        if self._excluded(signals):
+            metrics.inc("semantic_cache.skipped")
+            return None, None
+
+        with metrics.timer("semantic_cache.lookup_ms"):
+            vec = embed(cache_key_text(user_text, stress_label, signals))
+            with self._lock:
+                hit_id, sim = (None, 0.0) if self._index is None else self._index.query(vec)
+                entry = self._entries.get(hit_id) if sim >= self.threshold else None
+                if entry is not None:
+                    self._entries.move_to_end(hit_id)
+
+        if entry is None:
+            metrics.inc("semantic_cache.misses")
+            return None, vec
+        metrics.inc("semantic_cache.hits")
+        metrics.observe("semantic_cache.hit_similarity", sim)
+        return dict(entry["reply"]), vec
+
+    def store(self, user_text: str, stress_label: str, signals: Signals, reply: Dict[str, str],
+              vec: np.ndarray = None):
+        """Insert a freshly generated reply, evicting the least recently used entry if full."""
+        if self._excluded(signals):
+            return
+        key = cache_key_text(user_text, stress_label, signals)
+        if vec is None:
+            vec = embed(key)
+        with self._lock:
+            if self._index is None:
+                self._index = self._make_index(vec.shape[0])
+            while len(self._entries) >= self.max_entries:
+                old_id, _ = self._entries.popitem(last=False)
+                self._index.remove(old_id)
+                metrics.inc("semantic_cache.evictions")
+            item_id = self._next_id
+            self._next_id += 1
+            self._index.add(item_id, vec)
+            self._entries[item_id] = {"reply": dict(reply), "created": time.time(),
+                                      "key_hash": hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]}
+            metrics.set_gauge("semantic_cache.entries", len(self._entries))
+
+        if (item_id + 1) % _SAVE_EVERY == 0:
+            self.save()
+
+    def hit_rate(self) -> float:
+        hits = metrics.counter("semantic_cache.hits")
+        total = hits + metrics.counter("semantic_cache.misses")
+        return hits / total if total else 0.0
+
+    # --- Persistence ---
+    def save(self):
+        if not self.path or self._index is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            self._index.save(self.path)
+            state = {
+                "next_id": self._next_id,
+                "dim": self._index.dim,
+                "backend": type(self._index).__name__,
+                "entries": [[k, v] for k, v in self._entries.items()],
+            }
+        with open(self.path + ".json", "w") as f:
+            json.dump(state, f)
+
+    def load(self):
+        with open(self.path + ".json") as f:
+            state = json.load(f)
+        index = self._make_index(state["dim"])
+        if type(index).__name__ != state["backend"]:
+            # index written by the other backend: rebuild lazily from new traffic
+            print("Semantic cache backend changed; starting empty.")
+            return
+        if any("key" in entry for _, entry in state["entries"]):
+            # older files stored message text and cached trigger-bearing replies
+            print("Semantic cache file is in an old format; starting empty.")
+            return
+        index.load(self.path)
+        with self._lock:
+            self._index = index
+            self._next_id = state["next_id"]
+            self._entries = OrderedDict((int(k), v) for k, v in state["entries"])
+            if isinstance(index, _HnswIndex):
+                index.size = len(self._entries)
+        metrics.set_gauge("semantic_cache.entries", len(self._entries))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
@@ -0,0 +1,198 @@
+# signals.py
+# Canonical, immutable representation of extracted signals. Each keyword category is a
+# bitset (Python int) over an interned per-category vocabulary, so deduplication, merging,
+# equality and hashing are integer operations and the same value can be cached, stored in
+# history and rendered into prompts without rebuilding lists and sets.
+# Triggers are open-vocabulary (NER entities, Groq free text) and stay a sorted tuple of
+# strings; keyword vocabularies are bounded by SIGNALS_VOCAB_MAX_TERMS.
+# Dict-style access (signals["symptoms"], signals.get(...)) returns sorted tuples of terms,
+# so code written against the old dict result keeps working.
+
+import json
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+import metrics
+from redflags import REDFLAGS_BY_LANG
+from config import SIGNALS_VOCAB_MAX_TERMS
+
+CATEGORIES = ("triggers", "symptoms", "coping", "red_flags")
+FIELDS = CATEGORIES + ("urgent",)
+
+
+class Vocab:
+    """
+    Append-only term <-> id table. Ids are stable for the life of the process. Once
+    `max_terms` are interned, new terms get no id and are left out of encoded bitsets.
+    """
+
+    def __init__(self, terms: Iterable[str] = (), max_terms: int = SIGNALS_VOCAB_MAX_TERMS, name: str = ""):
+        self.name = name
+        self.max_terms = max_terms
+        self._ids: Dict[str, int] = {}
+        self._terms = []
+        self._lock = threading.Lock()
+        self.decode = lru_cache(maxsize=4096)(self._decode)
+        self.intern_all(terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def intern(self, term: str) -> Optional[int]:
+        """Id of `term`, or None if it is new and the vocabulary is full."""
+        i = self._ids.get(term)
+        if i is None:
+            with self._lock:
+                i = self._ids.get(term)
+                if i is None:
+                    if len(self._terms) >= self.max_terms:
+                        metrics.inc(f"signals.vocab_full.{self.name}")
+                        return None
+                    i = self._ids[term] = len(self._terms)
+                    self._terms.append(term)
+        return i
+
+    def intern_all(self, terms: Iterable[str]):
+        for term in terms:
+            self.intern(term)
+
+    def bit(self, term: str) -> int:
+        i = self.intern(term)
+        return 0 if i is None else 1 << i
+
+    def encode(self, terms: Iterable[str]) -> int:
+        bits = 0
+        for term in as_terms(terms):
+            bits |= self.bit(term)
+        return bits
+
+    def _decode(self, bits: int) -> Tuple[str, ...]:
+        out = []
+        while bits:
+            low = bits & -bits  # walk set bits only
+            out.append(self._terms[low.bit_length() - 1])
+            bits ^= low
+        return tuple(sorted(out))
+
+
+def as_terms(terms: Iterable[str]) -> Tuple[str, ...]:
+    """Stripped, deduplicated, sorted non-empty terms."""
+    out = set()
+    for term in terms or ():
+        term = (term or "").strip() if isinstance(term, str) else str(term)
+        if term:
+            out.add(term)
+    return tuple(sorted(out))
+
+
+# Keyword categories are seeded by extractor.py (so its keywords get the low ids);
+# Groq free-text symptoms / coping fill the rest up to SIGNALS_VOCAB_MAX_TERMS.
+VOCABS = {
+    "symptoms": Vocab(name="symptoms"),
+    "coping": Vocab(name="coping"),
+    "red_flags": Vocab((p for phrases in REDFLAGS_BY_LANG.values() for p in phrases), name="red_flags"),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Signals:
+    triggers: Tuple[str, ...] = ()
+    symptoms: int = 0
+    coping: int = 0
+    red_flags: int = 0
+    urgent: bool = False
+
+    @classmethod
+    def from_lists(cls, triggers=(), symptoms=(), coping=(), red_flags=(), urgent=False) -> "Signals":
+        return cls(
+            as_terms(triggers),
+            VOCABS["symptoms"].encode(symptoms or ()),
+            VOCABS["coping"].encode(coping or ()),
+            VOCABS["red_flags"].encode(red_flags or ()),
+            bool(urgent),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Signals":
+        if isinstance(data, Signals):
+            return data
+        return cls.from_lists(*(data.get(key) or () for key in CATEGORIES), urgent=data.get("urgent", False))
+
+    def merge(self, other: "Signals") -> "Signals":
+        return Signals(
+            as_terms(self.triggers + other.triggers),
+            self.symptoms | other.symptoms,
+            self.coping | other.coping,
+            self.red_flags | other.red_flags,
+            self.urgent or other.urgent,
+        )
+
+    __or__ = merge
+
+    def __bool__(self) -> bool:
+        return bool(self.triggers or self.symptoms or self.coping or self.red_flags or self.urgent)
+
+    # ---- dict compatibility ----
+    def __getitem__(self, key: str):
+        if key == "urgent":
+            return self.urgent
+        if key == "triggers":
+            return self.triggers
+        if key not in CATEGORIES:
+            raise KeyError(key)
+        return VOCABS[key].decode(getattr(self, key))
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return FIELDS
+
+    def items(self):
+        return [(key, self[key]) for key in FIELDS]
+
+    def to_dict(self) -> dict:
+        return {key: (self[key] if key == "urgent" else list(self[key])) for key in FIELDS}
+
+    # ---- serialization / rendering ----
+    def dumps(self) -> str:
+        """Compact JSON: non-empty categories only. Terms (not ids) so it is portable across processes."""
+        data = {key: list(self[key]) for key in CATEGORIES if getattr(self, key)}
+        if self.urgent:
+            data["urgent"] = True
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, text: str) -> "Signals":
+        return cls.from_dict(json.loads(text or "{}"))
+
+    def __str__(self) -> str:
+        return _render(self)
+
+
+@lru_cache(maxsize=4096)
+def _render(signals: Signals) -> str:
+    """Prompt form, e.g. 'symptoms: anxious, tired; coping: walk'."""
+    parts = [f"{key}: {', '.join(signals[key])}" for key in CATEGORIES if getattr(signals, key)]
+    if signals.urgent:
+        parts.append("urgent")
+    return "; ".join(parts) or "none"
+
+
+EMPTY = Signals()
+
+
+def json_default(obj):
+    """`default=` hook for json.dumps over structures that contain Signals, datetimes or arrays."""
+    if isinstance(obj, Signals):
+        return obj.to_dict()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if hasattr(obj, "tolist"):  # NumPy arrays / scalars (emotion vectors)
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -7,13 +7,23 @@ import plotly.graph_objects as go
 import pandas as pd
 from typing import Dict, List
 import re
+import time
+import uuid
 
 # Import your custom modules (make sure these files are in the same directory)
 try:
     from classifier import detect_stress
     from extractor import extract_signals
+    from signals import json_default
+    from redflags import screen_redflags
     from generate_response import empathetic_reply
     from config import STRESS_THRESHOLD
+    from degradation import controller
+    from conversation import ConversationContext
+    from trends import get_trend_engine, user_key
+    from charts import cached_stress_chart, cached_emotion_chart
+    from jobs import AnalysisJob
+    from config import UI_POLL_INTERVAL_S
 except ImportError as e:
     st.error(f"Error importing modules: {e}")
     st.error("Please ensure all required Python files (classifier.py, extractor.py, generate_response.py, config.py) are in the same directory as this Streamlit app.")
@@ -107,6 +117,21 @@ if 'emotion_history' not in st.session_state:
     st.session_state.emotion_history = []
 if 'user_name' not in st.session_state:
     st.session_state.user_name = ""
+if 'remember_history' not in st.session_state:
+    st.session_state.remember_history = False  # opt-in to a persistent trend store
+if 'passphrase' not in st.session_state:
+    st.session_state.passphrase = ""
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = ConversationContext()
+if 'chart_cache' not in st.session_state:
+    st.session_state.chart_cache = {}
+if 'pending' not in st.session_state:
+    st.session_state.pending = None  # {"job": AnalysisJob, "model_used": selectbox label}
+if 'last_redflags' not in st.session_state:
+    st.session_state.last_redflags = None  # red-flag screen of the latest message
+
+# Response model selectbox label -> empathetic_reply(model=...)
+MODEL_KEYS = {"FLAN-T5": "flan", "Groq (Llama)": "groq", "Fastest (race)": "race"}
 
 def get_stress_color_class(stress_label: str) -> str:
     """Return CSS class based on stress level"""
@@ -140,56 +165,143 @@ def format_chat_message(message: dict) -> str:
     </div>
     """
 
+def remembered_user() -> bool:
+    """Whether the user opted in to keeping their trend history across sessions"""
+    return bool(st.session_state.remember_history and st.session_state.user_name and st.session_state.passphrase)
+
+def current_user_id() -> str:
+    """Trend-store id: keyed name + passphrase if the user opted in, otherwise one per browser session"""
+    if remembered_user():
+        return user_key(st.session_state.user_name, st.session_state.passphrase)
+    if 'anon_user_id' not in st.session_state:
+        st.session_state.anon_user_id = uuid.uuid4().hex[:16]
+    return st.session_state.anon_user_id
+
+def current_trend_engine():
+    """Trend engine for current_user_id(); anonymous sessions' history stays in memory"""
+    return get_trend_engine(current_user_id(), persist=remembered_user())
+
 def create_stress_chart():
-    """Create a chart showing stress levels over time"""
-    if not st.session_state.stress_history:
-        return None
-    
-    df = pd.DataFrame(st.session_state.stress_history)
-    
-    fig = px.line(df, x='timestamp', y='stress_score', 
-                  title='Stress Level Over Time',
-                  labels={'stress_score': 'Stress Score', 'timestamp': 'Time'},
-                  color_discrete_sequence=['#2196F3'])
-    
-    # Add color zones
-    fig.add_hline(y=0.7, line_dash="dash", line_color="red", 
-                  annotation_text="High Stress Zone")
-    fig.add_hline(y=0.4, line_dash="dash", line_color="orange", 
-                  annotation_text="Medium Stress Zone")
-    
-    fig.update_layout(height=400)
-    return fig
+    """Create a chart showing stress levels over time (memoized on the trend history version)"""
+    uid = current_user_id()
+    return cached_stress_chart(current_trend_engine(), st.session_state.chart_cache.setdefault(uid, {}))
 
 def create_emotion_chart():
-    """Create a chart showing emotion distribution"""
-    if not st.session_state.emotion_history:
-        return None
+    """Create a chart showing emotion distribution (memoized on the trend history version)"""
+    uid = current_user_id()
+    return cached_emotion_chart(current_trend_engine(), st.session_state.chart_cache.setdefault(uid, {}))
+
+def cancel_pending_job():
+    """Cancel the running analysis, if any (its finished stages are discarded)"""
+    pending = st.session_state.pending
+    if pending:
+        pending['job'].cancel()
+    st.session_state.pending = None
+
+def combine_responses(responses: dict, response_model: str) -> str:
+    """Text shown for the selected response model"""
+    if response_model == "FLAN-T5":
+        return responses['flan']
+    elif response_model == "Groq (Llama)":
+        return responses['groq']
+    elif response_model == "Fastest (race)":
+        return responses['groq'] or responses['flan']  # only the winner's slot is filled
+    # under load only one generator may have run
+    return "\n\n".join(
+        f"**{name} Response:**\n{responses[key]}"
+        for name, key in (("FLAN-T5", "flan"), ("Groq", "groq"))
+        if responses[key]
+    )
+
+def finish_pending_job():
+    """Move a finished background job into the chat/stress/emotion history (script thread only)"""
+    pending = st.session_state.pending
+    if not pending or not pending['job'].done():
+        return
+    st.session_state.pending = None
+    job = pending['job']
+    if job.cancelled:
+        return
+    if job.error is not None:
+        st.error(f"Error processing your message: {str(job.error)}")
+        st.error("Please make sure all required dependencies are installed and API keys are configured.")
+        return
+    
+    stress_result = job.results['stress']
+    signals = job.results['signals']
     
-    # Aggregate emotions across all messages
-    all_emotions = {}
-    for entry in st.session_state.emotion_history:
-        for emotion, score in entry['emotions'].items():
-            if emotion not in all_emotions:
-                all_emotions[emotion] = []
-            all_emotions[emotion].append(score)
+    # Store in chat history
+    chat_entry = {
+        'timestamp': datetime.fromtimestamp(job.submitted_at).strftime("%H:%M:%S"),
+        'user_text': job.user_text,
+        'bot_response': combine_responses(job.results['responses'], pending['model_used']),
+        'stress_info': stress_result,
+        'signals': signals,
+        'model_used': pending['model_used']
+    }
+    st.session_state.chat_history.append(chat_entry)
+    st.session_state.conversation.add_turn(
+        job.user_text, stress_result['stress_label'], signals
+    )
     
-    # Calculate average scores
-    avg_emotions = {emotion: sum(scores)/len(scores) 
-                   for emotion, scores in all_emotions.items()}
+    # Store stress and emotion history
+    st.session_state.stress_history.append({
+        'timestamp': datetime.now(),
+        'stress_label': stress_result['stress_label'],
+        'stress_score': stress_result['stress_score']
+    })
     
-    if avg_emotions:
-        fig = px.bar(x=list(avg_emotions.keys()), y=list(avg_emotions.values()),
-                     title='Average Emotion Distribution',
-                     labels={'x': 'Emotion', 'y': 'Average Score'},
-                     color=list(avg_emotions.values()),
-                     color_continuous_scale='viridis')
-        fig.update_layout(height=400)
-        return fig
+    st.session_state.emotion_history.append({
+        'timestamp': datetime.now(),
+        'emotion_vector': stress_result.get('emotion_vector')  # float32, EMOTION_LABELS order
+    })
     
-    return None
+    # Update the persisted per-user trend aggregates
+    current_trend_engine().record(
+        datetime.now(),
+        stress_result['stress_score'],
+        stress_result['stress_label'],
+        stress_result.get('emotion_vector')
+    )
+
+def render_urgent_alert():
+    st.error("⚠️ URGENT: Your message contains concerning content. Please reach out to emergency services or a trusted person immediately.")
+    st.markdown("""
+    <div class="urgent-alert">
+    <strong>🆘 Immediate Help Resources:</strong><br>
+    • Call 988 (Suicide & Crisis Lifeline)<br>
+    • Text "HELLO" to 741741 (Crisis Text Line)<br>
+    • Call 911 for emergency services<br>
+    • Go to your nearest emergency room<br>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_job_progress(job: AnalysisJob):
+    """Partial results of the running job, each shown as soon as its stage finishes"""
+    st.markdown(f'<div class="user-message"><strong>You:</strong><br>{job.user_text}</div>',
+                unsafe_allow_html=True)
+    stress_result = job.results.get('stress')
+    if stress_result is None:
+        st.info("⏳ Analyzing your message...")
+        return
+    stress_class = get_stress_color_class(stress_result['stress_label'])
+    st.markdown(f"""
+    **Stress Level:** <span class="{stress_class}">{stress_result['stress_label'].upper()}</span>  
+    **Stress Score:** {stress_result['stress_score']:.2f}
+    """, unsafe_allow_html=True)
+    signals = job.results.get('signals')
+    if signals is None:
+        st.info("⏳ Extracting triggers and symptoms...")
+        return
+    found = [f"{key}: {', '.join(signals[key])}" for key in ('symptoms', 'triggers', 'coping') if signals.get(key)]
+    if found:
+        st.caption(" | ".join(found))
+    st.info("⏳ Generating response...")
 
 def main():
+    # Pick up a background analysis that finished since the last rerun
+    finish_pending_job()
+    
     # Header
     st.markdown('<h1 class="main-header">🧠 MindCare - Mental Health Chatbot</h1>', 
                 unsafe_allow_html=True)
@@ -205,18 +317,30 @@ def main():
                                   placeholder="Enter your name...")
         if user_name != st.session_state.user_name:
             st.session_state.user_name = user_name
+        st.session_state.remember_history = st.checkbox(
+            "Keep my history across sessions",
+            value=st.session_state.remember_history,
+            help="Your stress trends are stored under your name and a passphrase only you know."
+        )
+        if st.session_state.remember_history:
+            st.session_state.passphrase = st.text_input(
+                "Passphrase", value=st.session_state.passphrase, type="password",
+                placeholder="Needed to open your history again..."
+            )
         
         # Statistics
         st.subheader("Session Statistics")
         total_messages = len(st.session_state.chat_history)
         st.metric("Total Messages", total_messages)
         
-        if st.session_state.stress_history:
-            avg_stress = sum(entry['stress_score'] for entry in st.session_state.stress_history) / len(st.session_state.stress_history)
-            st.metric("Average Stress Level", f"{avg_stress:.2f}")
+        trend = current_trend_engine().summary()
+        if trend['count']:
+            st.metric("Average Stress Level (all sessions)", f"{trend['average']:.2f}")
             
-            current_stress = st.session_state.stress_history[-1]['stress_label'] if st.session_state.stress_history else "N/A"
+            current_stress = trend['current_label'] or "N/A"
             st.metric("Current Stress Level", current_stress.capitalize())
+            if trend['spikes']:
+                st.caption(f"Last stress spike: {trend['spikes'][-1][0][:16].replace('T', ' ')}")
         
         # Emergency contacts
         st.subheader("🆘 Emergency Resources")
@@ -231,9 +355,14 @@ def main():
         
         # Clear chat button
         if st.button("🗑️ Clear Chat History", type="secondary"):
+            cancel_pending_job()
             st.session_state.chat_history = []
             st.session_state.stress_history = []
             st.session_state.emotion_history = []
+            st.session_state.conversation = ConversationContext()
+            st.session_state.last_redflags = None
+            current_trend_engine().reset()
+            st.session_state.chart_cache = {}
             st.rerun()
         
         # Export data
@@ -247,7 +376,7 @@ def main():
                 }
                 st.download_button(
                     label="Download JSON",
-                    data=json.dumps(export_data, indent=2),
+                    data=json.dumps(export_data, indent=2, default=json_default),
                     file_name=f"mindcare_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                     mime="application/json"
                 )
@@ -268,81 +397,42 @@ def main():
         # Model selection
         response_model = st.selectbox(
             "Choose Response Model:",
-            ["Both (FLAN + Groq)", "FLAN-T5", "Groq (Llama)"],
+            ["Both (FLAN + Groq)", "FLAN-T5", "Groq (Llama)", "Fastest (race)"],
             index=0
         )
         
         # Process user input
         if st.button("💨 Send Message", type="primary"):
             if user_input.strip():
-                with st.spinner("Analyzing your message and generating response..."):
-                    try:
-                        # Detect stress and emotions
-                        stress_result = detect_stress(user_input)
-                        
-                        # Extract signals (triggers, symptoms, coping strategies)
-                        signals = extract_signals(user_input)
-                        
-                        # Check for urgent situations
-                        if signals.get('urgent', False):
-                            st.error("⚠️ URGENT: Your message contains concerning content. Please reach out to emergency services or a trusted person immediately.")
-                            st.markdown("""
-                            <div class="urgent-alert">
-                            <strong>🆘 Immediate Help Resources:</strong><br>
-                            • Call 988 (Suicide & Crisis Lifeline)<br>
-                            • Text "HELLO" to 741741 (Crisis Text Line)<br>
-                            • Call 911 for emergency services<br>
-                            • Go to your nearest emergency room<br>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        
-                        # Generate empathetic response
-                        responses = empathetic_reply(
-                            user_input, 
-                            stress_result['stress_label'],
-                            stress_result['stress_score'],
-                            signals
-                        )
-                        
-                        # Choose which response to show
-                        if response_model == "FLAN-T5":
-                            bot_response = responses['flan']
-                        elif response_model == "Groq (Llama)":
-                            bot_response = responses['groq']
-                        else:
-                            bot_response = f"**FLAN-T5 Response:**\n{responses['flan']}\n\n**Groq Response:**\n{responses['groq']}"
-                        
-                        # Store in chat history
-                        chat_entry = {
-                            'timestamp': datetime.now().strftime("%H:%M:%S"),
-                            'user_text': user_input,
-                            'bot_response': bot_response,
-                            'stress_info': stress_result,
-                            'signals': signals,
-                            'model_used': response_model
-                        }
-                        st.session_state.chat_history.append(chat_entry)
-                        
-                        # Store stress and emotion history
-                        st.session_state.stress_history.append({
-                            'timestamp': datetime.now(),
-                            'stress_label': stress_result['stress_label'],
-                            'stress_score': stress_result['stress_score']
-                        })
-                        
-                        st.session_state.emotion_history.append({
-                            'timestamp': datetime.now(),
-                            'emotions': stress_result.get('emotions', {})
-                        })
-                        
-                        st.rerun()
-                        
-                    except Exception as e:
-                        st.error(f"Error processing your message: {str(e)}")
-                        st.error("Please make sure all required dependencies are installed and API keys are configured.")
+                # Red-flag fast lane: screen before any model runs so the crisis
+                # banner renders immediately
+                redflags = screen_redflags(user_input)
+                st.session_state.last_redflags = redflags
+                
+                # A new message supersedes whatever is still running; inference
+                # continues in the background and this rerun returns immediately
+                cancel_pending_job()
+                st.session_state.pending = {
+                    'job': AnalysisJob(
+                        user_input,
+                        redflags=redflags,
+                        model=MODEL_KEYS.get(response_model, "both"),
+                        context=st.session_state.conversation.render()
+                    ).submit(),
+                    'model_used': response_model
+                }
             else:
                 st.warning("Please enter a message before sending.")
         
+        # Crisis banner for the latest message, whether its analysis is running, done or failed
+        last_redflags = st.session_state.last_redflags
+        if last_redflags and last_redflags['urgent']:
+            render_urgent_alert()
+        
+        # In-flight analysis
+        if st.session_state.pending:
+            render_job_progress(st.session_state.pending['job'])
+        
         # Display chat history
         st.subheader("📝 Conversation History")
         chat_container = st.container()
@@ -358,16 +448,14 @@ def main():
         st.subheader("📈 Analytics")
         
         # Stress level chart
-        if st.session_state.stress_history:
-            stress_fig = create_stress_chart()
-            if stress_fig:
-                st.plotly_chart(stress_fig, use_container_width=True)
+        stress_fig = create_stress_chart()
+        if stress_fig:
+            st.plotly_chart(stress_fig, use_container_width=True)
         
         # Emotion distribution chart
-        if st.session_state.emotion_history:
-            emotion_fig = create_emotion_chart()
-            if emotion_fig:
-                st.plotly_chart(emotion_fig, use_container_width=True)
+        emotion_fig = create_emotion_chart()
+        if emotion_fig:
+            st.plotly_chart(emotion_fig, use_container_width=True)
         
         # Latest analysis
         if st.session_state.chat_history:
@@ -411,6 +499,11 @@ def main():
     If you're experiencing a mental health emergency, please contact emergency services immediately.</p>
     </div>
     """, unsafe_allow_html=True)
+    
+    # Poll the background job; any widget interaction interrupts this and reruns at once
+    if st.session_state.pending:
+        time.sleep(UI_POLL_INTERVAL_S)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,13 +7,21 @@ import plotly.graph_objects as go
 import pandas as pd
 from typing import Dict, List
 import re
+import uuid
 
 # Import your custom modules (make sure these files are in the same directory)
 try:
     from classifier import detect_stress
     from extractor import extract_signals
+    from signals import json_default
+    from redflags import screen_redflags
     from generate_response import empathetic_reply
     from config import STRESS_THRESHOLD
+    from degradation import controller
+    from audit import audit
+    from conversation import ConversationContext
+    from trends import get_trend_engine, user_key
+    from charts import cached_stress_chart, cached_emotion_chart
     from evaluation import evaluate_classifier, evaluate_responses
 except ImportError as e:
     st.error(f"Error importing modules: {e}")
@@ -106,6 +114,14 @@ if 'emotion_history' not in st.session_state:
     st.session_state.emotion_history = []
 if 'user_name' not in st.session_state:
     st.session_state.user_name = ""
+if 'remember_history' not in st.session_state:
+    st.session_state.remember_history = False  # opt-in to a persistent trend store
+if 'passphrase' not in st.session_state:
+    st.session_state.passphrase = ""
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = ConversationContext()
+if 'chart_cache' not in st.session_state:
+    st.session_state.chart_cache = {}
 if 'accuracy_data' not in st.session_state:
     st.session_state.accuracy_data = {"predictions": [], "actual": [], "responses": [], "references": []}
 
@@ -227,6 +243,9 @@ def create_accuracy_dashboard():
     except Exception as e:
         st.error(f"Error calculating accuracy: {e}")
         return None
+# Response model selectbox label -> empathetic_reply(model=...)
+MODEL_KEYS = {"FLAN-T5": "flan", "Groq (Llama)": "groq", "Fastest (race)": "race"}
+
 def get_stress_color_class(stress_label: str) -> str:
     """Return CSS class based on stress level"""
     if stress_label == "high":
@@ -259,54 +278,31 @@ def format_chat_message(message: dict) -> str:
     </div>
     """
 
+def remembered_user() -> bool:
+    """Whether the user opted in to keeping their trend history across sessions"""
+    return bool(st.session_state.remember_history and st.session_state.user_name and st.session_state.passphrase)
+
+def current_user_id() -> str:
+    """Trend-store id: keyed name + passphrase if the user opted in, otherwise one per browser session"""
+    if remembered_user():
+        return user_key(st.session_state.user_name, st.session_state.passphrase)
+    if 'anon_user_id' not in st.session_state:
+        st.session_state.anon_user_id = uuid.uuid4().hex[:16]
+    return st.session_state.anon_user_id
+
+def current_trend_engine():
+    """Trend engine for current_user_id(); anonymous sessions' history stays in memory"""
+    return get_trend_engine(current_user_id(), persist=remembered_user())
+
 def create_stress_chart():
-    """Create a chart showing stress levels over time"""
-    if not st.session_state.stress_history:
-        return None
-    
-    df = pd.DataFrame(st.session_state.stress_history)
-    
-    fig = px.line(df, x='timestamp', y='stress_score', 
-                  title='Stress Level Over Time',
-                  labels={'stress_score': 'Stress Score', 'timestamp': 'Time'},
-                  color_discrete_sequence=['#2196F3'])
-    
-    # Add color zones
-    fig.add_hline(y=0.7, line_dash="dash", line_color="red", 
-                  annotation_text="High Stress Zone")
-    fig.add_hline(y=0.4, line_dash="dash", line_color="orange", 
-                  annotation_text="Medium Stress Zone")
-    
-    fig.update_layout(height=400)
-    return fig
+    """Create a chart showing stress levels over time (memoized on the trend history version)"""
+    uid = current_user_id()
+    return cached_stress_chart(current_trend_engine(), st.session_state.chart_cache.setdefault(uid, {}))
 
 def create_emotion_chart():
-    """Create a chart showing emotion distribution"""
-    if not st.session_state.emotion_history:
-        return None
-    
-    # Aggregate emotions across all messages
-    all_emotions = {}
-    for entry in st.session_state.emotion_history:
-        for emotion, score in entry['emotions'].items():
-            if emotion not in all_emotions:
-                all_emotions[emotion] = []
-            all_emotions[emotion].append(score)
-    
-    # Calculate average scores
-    avg_emotions = {emotion: sum(scores)/len(scores) 
-                   for emotion, scores in all_emotions.items()}
-    
-    if avg_emotions:
-        fig = px.bar(x=list(avg_emotions.keys()), y=list(avg_emotions.values()),
-                     title='Average Emotion Distribution',
-                     labels={'x': 'Emotion', 'y': 'Average Score'},
-                     color=list(avg_emotions.values()),
-                     color_continuous_scale='viridis')
-        fig.update_layout(height=400)
-        return fig
-    
-    return None
+    """Create a chart showing emotion distribution (memoized on the trend history version)"""
+    uid = current_user_id()
+    return cached_emotion_chart(current_trend_engine(), st.session_state.chart_cache.setdefault(uid, {}))
 
 def main():
     # Header
@@ -324,18 +320,30 @@ def main():
                                   placeholder="Enter your name...")
         if user_name != st.session_state.user_name:
             st.session_state.user_name = user_name
+        st.session_state.remember_history = st.checkbox(
+            "Keep my history across sessions",
+            value=st.session_state.remember_history,
+            help="Your stress trends are stored under your name and a passphrase only you know."
+        )
+        if st.session_state.remember_history:
+            st.session_state.passphrase = st.text_input(
+                "Passphrase", value=st.session_state.passphrase, type="password",
+                placeholder="Needed to open your history again..."
+            )
         
         # Statistics
         st.subheader("Session Statistics")
         total_messages = len(st.session_state.chat_history)
         st.metric("Total Messages", total_messages)
         
-        if st.session_state.stress_history:
-            avg_stress = sum(entry['stress_score'] for entry in st.session_state.stress_history) / len(st.session_state.stress_history)
-            st.metric("Average Stress Level", f"{avg_stress:.2f}")
+        trend = current_trend_engine().summary()
+        if trend['count']:
+            st.metric("Average Stress Level (all sessions)", f"{trend['average']:.2f}")
             
-            current_stress = st.session_state.stress_history[-1]['stress_label'] if st.session_state.stress_history else "N/A"
+            current_stress = trend['current_label'] or "N/A"
             st.metric("Current Stress Level", current_stress.capitalize())
+            if trend['spikes']:
+                st.caption(f"Last stress spike: {trend['spikes'][-1][0][:16].replace('T', ' ')}")
         
         # Emergency contacts
         st.subheader("🆘 Emergency Resources")
@@ -353,7 +361,10 @@ def main():
             st.session_state.chat_history = []
             st.session_state.stress_history = []
             st.session_state.emotion_history = []
+            st.session_state.conversation = ConversationContext()
             st.session_state.accuracy_data = {"predictions": [], "actual": [], "responses": [], "references": []}
+            current_trend_engine().reset()
+            st.session_state.chart_cache = {}
             st.rerun()
         
         # Export data
@@ -367,7 +378,7 @@ def main():
                 }
                 st.download_button(
                     label="Download JSON",
-                    data=json.dumps(export_data, indent=2),
+                    data=json.dumps(export_data, indent=2, default=json_default),
                     file_name=f"mindcare_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                     mime="application/json"
                 )
@@ -388,7 +399,7 @@ def main():
         # Model selection
         response_model = st.selectbox(
             "Choose Response Model:",
-            ["Both (FLAN + Groq)", "FLAN-T5", "Groq (Llama)"],
+            ["Both (FLAN + Groq)", "FLAN-T5", "Groq (Llama)", "Fastest (race)"],
             index=0
         )
         
@@ -411,44 +422,58 @@ def main():
         # Process user input
         if st.button("💨 Send Message", type="primary"):
             if user_input.strip():
-                with st.spinner("Analyzing your message and generating response..."):
+                # Red-flag fast lane: screen before any model runs so the crisis
+                # banner renders immediately
+                redflags = screen_redflags(user_input)
+                if redflags['urgent']:
+                    st.error("⚠️ URGENT: Your message contains concerning content. Please reach out to emergency services or a trusted person immediately.")
+                    st.markdown("""
+                    <div class="urgent-alert">
+                    <strong>🆘 Immediate Help Resources:</strong><br>
+                    • Call 988 (Suicide & Crisis Lifeline)<br>
+                    • Text "HELLO" to 741741 (Crisis Text Line)<br>
+                    • Call 911 for emergency services<br>
+                    • Go to your nearest emergency room<br>
+                    </div>
+                    """, unsafe_allow_html=True)
+
+                with st.spinner("Analyzing your message and generating response..."), controller.request():
                     try:
                         # Detect stress and emotions
                         stress_result = detect_stress(user_input)
                         
                         # Extract signals (triggers, symptoms, coping strategies)
-                        signals = extract_signals(user_input)
-                        
-                        # Check for urgent situations
-                        if signals.get('urgent', False):
-                            st.error("⚠️ URGENT: Your message contains concerning content. Please reach out to emergency services or a trusted person immediately.")
-                            st.markdown("""
-                            <div class="urgent-alert">
-                            <strong>🆘 Immediate Help Resources:</strong><br>
-                            • Call 988 (Suicide & Crisis Lifeline)<br>
-                            • Text "HELLO" to 741741 (Crisis Text Line)<br>
-                            • Call 911 for emergency services<br>
-                            • Go to your nearest emergency room<br>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        signals = extract_signals(user_input, redflags=redflags,
+                                                  lang=stress_result.get('language'))
                         
                         # Generate empathetic response
                         responses = empathetic_reply(
                             user_input, 
                             stress_result['stress_label'],
                             stress_result['stress_score'],
-                            signals
+                            signals,
+                            model=MODEL_KEYS.get(response_model, "both"),
+                            context=st.session_state.conversation.render()
                         )
+                        audit("analysis", user_input, source="ui", model=MODEL_KEYS.get(response_model, "both"),
+                              mode=controller.mode, stress=stress_result, signals=signals,
+                              redflags=redflags, responses=responses)
                         
                         # Choose which response to show and clean it
                         if response_model == "FLAN-T5":
                             bot_response = clean_bot_response(responses['flan'])
                         elif response_model == "Groq (Llama)":
                             bot_response = clean_bot_response(responses['groq'])
+                        elif response_model == "Fastest (race)":
+                            # only the winner's slot is filled
+                            bot_response = clean_bot_response(responses['groq'] or responses['flan'])
                         else:
-                            flan_clean = clean_bot_response(responses['flan'])
-                            groq_clean = clean_bot_response(responses['groq'])
-                            bot_response = f"**FLAN-T5 Response:**\n{flan_clean}\n\n**Groq Response:**\n{groq_clean}"
+                            # under load only one generator may have run
+                            bot_response = "\n\n".join(
+                                f"**{name} Response:**\n{clean_bot_response(responses[key])}"
+                                for name, key in (("FLAN-T5", "flan"), ("Groq", "groq"))
+                                if responses[key]
+                            )
                         
                         # Store cleaned response for accuracy evaluation
                         st.session_state.accuracy_data["responses"].append(bot_response)
@@ -463,6 +488,9 @@ def main():
                             'model_used': response_model
                         }
                         st.session_state.chat_history.append(chat_entry)
+                        st.session_state.conversation.add_turn(
+                            user_input, stress_result['stress_label'], signals
+                        )
                         
                         # Store stress and emotion history
                         st.session_state.stress_history.append({
@@ -473,12 +501,22 @@ def main():
                         
                         st.session_state.emotion_history.append({
                             'timestamp': datetime.now(),
-                            'emotions': stress_result.get('emotions', {})
+                            'emotion_vector': stress_result.get('emotion_vector')  # float32, EMOTION_LABELS order
                         })
                         
+                        # Update the persisted per-user trend aggregates
+                        current_trend_engine().record(
+                            datetime.now(),
+                            stress_result['stress_score'],
+                            stress_result['stress_label'],
+                            stress_result.get('emotion_vector')
+                        )
+                        
                         st.rerun()
                         
                     except Exception as e:
+                        audit("analysis", user_input, source="ui", outcome="error",
+                              mode=controller.mode, redflags=redflags)
                         st.error(f"Error processing your message: {str(e)}")
                         st.error("Please make sure all required dependencies are installed and API keys are configured.")
             else:
@@ -503,16 +541,14 @@ def main():
             st.subheader("📈 Analytics")
             
             # Stress level chart
-            if st.session_state.stress_history:
-                stress_fig = create_stress_chart()
-                if stress_fig:
-                    st.plotly_chart(stress_fig, use_container_width=True)
+            stress_fig = create_stress_chart()
+            if stress_fig:
+                st.plotly_chart(stress_fig, use_container_width=True)
             
             # Emotion distribution chart
-            if st.session_state.emotion_history:
-                emotion_fig = create_emotion_chart()
-                if emotion_fig:
-                    st.plotly_chart(emotion_fig, use_container_width=True)
+            emotion_fig = create_emotion_chart()
+            if emotion_fig:
+                st.plotly_chart(emotion_fig, use_container_width=True)
             
             # Latest analysis
             if st.session_state.chat_history:
@@ -0,0 +1,89 @@
+# structured.py
+# Tolerant JSON extraction from LLM output. Models wrap JSON in prose or ``` fences, or stop
+# mid-object; JsonObjectScanner finds the first complete top-level {...} in text fed to it
+# chunk by chunk, so a streamed completion can be cut off as soon as the object closes.
+
+import json
+import re
+from typing import Iterable, Optional
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _loads_lenient(candidate: str) -> Optional[dict]:
+    for text in (candidate, _TRAILING_COMMA_RE.sub(r"\1", candidate)):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            continue
+        return data if isinstance(data, dict) else None
+    return None
+
+
+class JsonObjectScanner:
+    """Incremental brace matcher (string/escape aware). `result` is set once an object parses."""
+
+    def __init__(self):
+        self._buf = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self.result = None
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        if self.result is not None:
+            return self.result
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._buf = ["{"]
+                    self._depth = 1
+                continue
+            self._buf.append(ch)
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = _loads_lenient("".join(self._buf))
+                    if self.result is not None:
+                        return self.result
+                    self._buf = []  # not valid JSON; keep looking for another object
+        return None
+
+
+def extract_json(text_or_chunks) -> Optional[dict]:
+    """First JSON object in a string or an iterable of string chunks (None if there is none)."""
+    scanner = JsonObjectScanner()
+    chunks: Iterable[str] = [text_or_chunks] if isinstance(text_or_chunks, str) else text_or_chunks
+    for chunk in chunks:
+        if scanner.feed(chunk or "") is not None:
+            break
+    return scanner.result
+
+
+def validate_keys(data, keys) -> Optional[dict]:
+    """
+    Coerce `data` to {key: [str, ...]} for `keys`. A bare string becomes a one-item list and
+    non-string items are dropped. Returns None if `data` is not an object or has none of the keys.
+    """
+    if not isinstance(data, dict) or not any(k in data for k in keys):
+        return None
+    out = {}
+    for key in keys:
+        value = data.get(key) or []
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            return None
+        out[key] = [v.strip() for v in value if isinstance(v, str) and v.strip()]
+    return out
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("groq")
+os.environ.setdefault("GROQ_API_KEY", "test")  # the client is built at import; no request is made
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import api  # noqa: E402
+from signals import Signals  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_call(fn, *args, **kwargs):
+        if fn is api.detect_stress_batch:
+            return [{"stress_label": "medium", "stress_score": 0.5, "language": "en"} for _ in args[0]]
+        if fn is api.extract_signals:
+            return Signals()
+        raise RuntimeError("generator failed")
+
+    monkeypatch.setattr(api, "_call", fake_call)
+    # no lifespan: it would preload the real models
+    api.app.state.admission = api._Admission()
+    api.app.state.batcher = api._StressBatcher()
+    return TestClient(api.app)
+
+
+def _events(body: str):
+    return [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+
+
+def test_stream_reports_unexpected_errors(client):
+    response = client.post("/reply/stream", json={"text": "work is a lot this week", "model": "flan"})
+    assert response.status_code == 200
+    events = _events(response.text)
+    assert events[:3] == ["redflags", "stress", "signals"]
+    assert events[-1] == "error"
+    assert "done" not in events
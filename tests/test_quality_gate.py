@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("groq")
+os.environ.setdefault("GROQ_API_KEY", "test")  # the client is built at import; no request is made
+
+from generate_response import quality_gate  # noqa: E402
+from signals import Signals  # noqa: E402
+
+
+def test_echoed_rendered_signals_are_a_leak():
+    signals = Signals.from_lists(symptoms=["anxious", "tired"], coping=["walk"], urgent=True)
+    reply = f"I hear how much you are carrying right now. {signals}. Take a slow breath with me."
+    assert quality_gate(reply) == "leaked_prompt"
+
+
+def test_echoed_dict_signals_are_a_leak():
+    reply = "I hear how much you are carrying right now. {'symptoms': ['tired'], 'coping': []}"
+    assert quality_gate(reply) == "leaked_prompt"
+
+
+def test_talking_about_symptoms_is_not_a_leak():
+    reply = ("Common symptoms: poor sleep and tension are normal under stress; coping with them "
+             "takes time, so try a short walk and an early night.")
+    assert quality_gate(reply) is None
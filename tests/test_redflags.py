@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from redflags import screen_batch, screen_redflags
+
+
+def test_batch_rescreens_the_text_after_a_cross_boundary_match():
+    # "cut" + "my self" would match "cut my self" across the join and swallow "self-harm"
+    texts = ["we had to cut", "my self-harm is back", "ok"]
+    assert screen_batch(texts) == [False, True, False]
+
+
+def test_batch_matches_single_screening():
+    rng = random.Random(0)
+    parts = ["we had to cut", "my self", "-harm", "end it", "all", "kill", "myself", "not", "hopeless",
+             "I'm fine", "", "suicides", "never been", "worthless", "trying not to", "overdose"]
+    texts = [" ".join(rng.choice(parts) for _ in range(rng.randint(0, 3))) for _ in range(2000)]
+    assert screen_batch(texts) == [screen_redflags(t)["urgent"] for t in texts]
+
+
+@pytest.mark.parametrize("text", [
+    "I am trying so hard not to kill myself",
+    "I keep telling myself not to end it all",
+    "I promised my mom I would not overdose again",
+    "Do not be worthless",
+    "I would never kill myself",
+    "so many suicides this year",
+])
+def test_urgent_despite_a_negation_cue(text):
+    assert screen_redflags(text)["urgent"]
+
+
+def test_negated_hopeless_is_not_urgent():
+    result = screen_redflags("I'm not hopeless, just tired")
+    assert not result["urgent"]
+    assert result["negated"] == ["hopeless"]
@@ -0,0 +1,297 @@
+# trends.py
+# Per-user longitudinal stress/emotion analytics. Every analysed message updates small
+# persisted aggregates incrementally (hourly/daily buckets, EMA, spike and change-point
+# state), so dashboards read precomputed rollups instead of replaying full histories.
+# Stores persist across sessions only for users who opt in with a name and a passphrase;
+# the store id is an HMAC of both under a server secret (MINDCARE_TREND_KEY), so knowing
+# someone's name is not enough to open their history. Writes are debounced per user.
+# Anonymous sessions get in-memory engines only, never written to disk; the least recently
+# used are dropped past TREND_ANON_MAX_ENGINES.
+
+import atexit
+import hashlib
+import hmac
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+import emotions as emo
+from config import (
+    TREND_STORE_DIR,
+    TREND_EMA_ALPHA,
+    TREND_SPIKE_Z,
+    TREND_CUSUM_K,
+    TREND_CUSUM_H,
+    TREND_HOURLY_RETENTION_DAYS,
+    TREND_RECENT_POINTS,
+    TREND_SAVE_INTERVAL_S,
+    TREND_ANON_MAX_ENGINES,
+)
+
+_BUCKETS = {"hourly": "%Y-%m-%dT%H:00", "daily": "%Y-%m-%d"}
+_EVENTS_KEPT = 100  # spikes / change points remembered per user
+
+
+_secret = os.getenv("MINDCARE_TREND_KEY")
+if not _secret:
+    print("MINDCARE_TREND_KEY not set; trend history only persists for the life of this process.")
+_KEY = _secret.encode("utf-8") if _secret else secrets.token_bytes(32)
+
+
+def user_key(user_name: str, passphrase: str) -> str:
+    """File-safe store id for a name + passphrase (neither is written to disk)."""
+    if not passphrase:
+        raise ValueError("a passphrase is required for a persistent trend store")
+    msg = f"{(user_name or '').strip().lower()}\0{passphrase}".encode("utf-8")
+    return hmac.new(_KEY, msg, hashlib.sha256).hexdigest()[:32]
+
+
+class TrendEngine:
+    """Incremental time-series aggregates for one user (kept in memory only unless `persist`)."""
+
+    def __init__(self, user_id: str, store_dir: str = TREND_STORE_DIR, persist: bool = True):
+        self.user_id = user_id
+        self.path = os.path.join(store_dir, f"{user_id}.json") if persist else None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._timer = None
+        self._state = self._empty()
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                self._state.update(json.load(f))
+            self._migrate()
+        self._emotion_sum = np.asarray(self._state["emotion_sum"], dtype=np.float64)
+        self._recent = deque(self._state["recent"], maxlen=TREND_RECENT_POINTS)
+
+    @staticmethod
+    def _empty() -> dict:
+        return {
+            "count": 0,
+            "sum": 0.0,
+            "hourly": {},  # bucket -> [n, sum, sumsq, min, max]
+            "daily": {},
+            "emotion_n": 0,  # messages with an emotion vector
+            "emotion_sum": [0.0] * len(emo.LABELS),  # per-label sums in EMOTION_LABELS order
+            "ema": None,
+            "dev_mean": 0.0,  # running mean/M2 of (score - EMA) residuals (Welford)
+            "dev_m2": 0.0,
+            "cusum_pos": 0.0,
+            "cusum_neg": 0.0,
+            "spikes": [],
+            "change_points": [],
+            "recent": [],  # [iso timestamp, score, label]
+            "last_label": None,
+        }
+
+    def _migrate(self):
+        """Older stores kept label -> [n, sum]; convert to a vector sum with the same means."""
+        old = self._state.pop("emotions", None)
+        if old and not self._state["emotion_n"]:
+            n = max(count for count, _ in old.values())
+            means = emo.from_dict({label: total / count for label, (count, total) in old.items() if count})
+            self._state["emotion_n"] = n
+            self._state["emotion_sum"] = (means.astype(np.float64) * n).tolist()
+
+    # --- Updates ---
+    def record(self, ts: datetime, stress_score: float, stress_label: str, emotions=None):
+        """
+        Fold one analysed message into the aggregates and persist them.
+        `emotions` is an emotion vector (EMOTION_LABELS order), or a label -> score dict.
+        """
+        x = float(stress_score)
+        with self._lock:
+            s = self._state
+            s["count"] += 1
+            s["sum"] += x
+            s["last_label"] = stress_label
+
+            for name, fmt in _BUCKETS.items():
+                b = s[name].setdefault(ts.strftime(fmt), [0, 0.0, 0.0, x, x])
+                b[0] += 1
+                b[1] += x
+                b[2] += x * x
+                b[3] = min(b[3], x)
+                b[4] = max(b[4], x)
+
+            if isinstance(emotions, dict):
+                emotions = emo.from_dict(emotions) if emotions else None
+            if emotions is not None:
+                self._emotion_sum += emotions
+                s["emotion_n"] += 1
+
+            self._update_detectors(ts, x)
+            self._recent.append([ts.isoformat(), x, stress_label])
+            self._prune(ts)
+            self._schedule_save()
+
+    def _update_detectors(self, ts: datetime, x: float):
+        s = self._state
+        if s["ema"] is None:
+            s["ema"] = x
+            return
+
+        resid = x - s["ema"]
+        n = s["count"] - 1  # residuals seen so far, including this one
+        std = math.sqrt(s["dev_m2"] / (n - 2)) if n > 2 else 0.0
+        z = (resid - s["dev_mean"]) / std if std > 0 else 0.0
+        if abs(z) > TREND_SPIKE_Z:
+            s["spikes"] = (s["spikes"] + [[ts.isoformat(), x, z]])[-_EVENTS_KEPT:]
+        delta = resid - s["dev_mean"]
+        s["dev_mean"] += delta / n
+        s["dev_m2"] += delta * (resid - s["dev_mean"])
+
+        # two-sided CUSUM on deviations from the EMA
+        s["cusum_pos"] = max(0.0, s["cusum_pos"] + resid - TREND_CUSUM_K)
+        s["cusum_neg"] = max(0.0, s["cusum_neg"] - resid - TREND_CUSUM_K)
+        if s["cusum_pos"] > TREND_CUSUM_H or s["cusum_neg"] > TREND_CUSUM_H:
+            direction = "up" if s["cusum_pos"] > TREND_CUSUM_H else "down"
+            s["change_points"] = (s["change_points"] + [[ts.isoformat(), direction]])[-_EVENTS_KEPT:]
+            s["cusum_pos"] = s["cusum_neg"] = 0.0
+
+        s["ema"] = TREND_EMA_ALPHA * x + (1 - TREND_EMA_ALPHA) * s["ema"]
+
+    def _prune(self, now: datetime):
+        cutoff = (now - timedelta(days=TREND_HOURLY_RETENTION_DAYS)).strftime(_BUCKETS["hourly"])
+        hourly = self._state["hourly"]
+        if len(hourly) > TREND_HOURLY_RETENTION_DAYS * 24:
+            for key in [k for k in hourly if k < cutoff]:
+                del hourly[key]
+
+    def reset(self):
+        """Forget all history (and overwrite the store, if persisted)."""
+        with self._lock:
+            self._state = self._empty()
+            self._emotion_sum = np.zeros(len(emo.LABELS), dtype=np.float64)
+            self._recent.clear()
+            self._schedule_save()
+
+    def _schedule_save(self):
+        """Write now if the last write is old enough, otherwise once the interval is up (lock held)."""
+        if self.path is None:
+            return
+        self._dirty = True
+        wait = self._last_save + TREND_SAVE_INTERVAL_S - time.monotonic()
+        if wait <= 0:
+            self._save()
+        elif self._timer is None:
+            self._timer = threading.Timer(wait, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write pending updates to disk."""
+        with self._lock:
+            self._timer = None
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        self._dirty = False
+        self._last_save = time.monotonic()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._state["recent"] = list(self._recent)
+        self._state["emotion_sum"] = self._emotion_sum.tolist()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._state, f)
+        os.replace(tmp, self.path)
+
+    # --- Queries ---
+    def rollup(self, freq: str = "daily") -> pd.DataFrame:
+        """Bucketed stats: index=bucket start, columns count/mean/std/min/max."""
+        with self._lock:
+            buckets = dict(self._state[freq])
+        if not buckets:
+            return pd.DataFrame(columns=["count", "mean", "std", "min", "max"])
+        arr = np.asarray(list(buckets.values()), dtype=np.float64)
+        n, total, sumsq = arr[:, 0], arr[:, 1], arr[:, 2]
+        mean = total / n
+        std = np.sqrt(np.maximum(sumsq / n - mean ** 2, 0.0))
+        df = pd.DataFrame(
+            {"count": n.astype(int), "mean": mean, "std": std, "min": arr[:, 3], "max": arr[:, 4]},
+            index=pd.to_datetime(list(buckets.keys())),
+        )
+        return df.sort_index()
+
+    def percentile_bands(self, freq: str = "daily", window: int = 7,
+                         quantiles=(0.1, 0.5, 0.9)) -> pd.DataFrame:
+        """Rolling quantile bands over bucket means, plus an EMA of the means."""
+        df = self.rollup(freq)
+        if df.empty:
+            return df
+        means = df["mean"]
+        out = pd.DataFrame({"mean": means, "ema": means.ewm(alpha=TREND_EMA_ALPHA).mean()})
+        roll = means.rolling(window, min_periods=1)
+        for q in quantiles:
+            out[f"p{int(q * 100)}"] = roll.quantile(q)
+        return out
+
+    def recent_points(self) -> pd.DataFrame:
+        """Last TREND_RECENT_POINTS raw points (timestamp, stress_score, stress_label)."""
+        with self._lock:
+            rows = list(self._recent)
+        df = pd.DataFrame(rows, columns=["timestamp", "stress_score", "stress_label"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        return df
+
+    def emotion_vector(self):
+        """Mean emotion vector over all messages (None before the first one)."""
+        with self._lock:
+            n = self._state["emotion_n"]
+            return (self._emotion_sum / n).astype(np.float32) if n else None
+
+    def emotion_means(self) -> Dict[str, float]:
+        return emo.as_dict(self.emotion_vector())
+
+    def summary(self) -> dict:
+        """Constant-time numbers for dashboards."""
+        with self._lock:
+            s = self._state
+            return {
+                "count": s["count"],
+                "average": s["sum"] / s["count"] if s["count"] else 0.0,
+                "ema": s["ema"],
+                "current_label": s["last_label"],
+                "spikes": list(s["spikes"]),
+                "change_points": list(s["change_points"]),
+            }
+
+
+_engines = {}  # persisted (opted-in) users
+_anon_engines = OrderedDict()  # anonymous sessions, least recently used first
+_engines_lock = threading.Lock()
+
+
+def get_trend_engine(user_id: str, persist: bool = False) -> TrendEngine:
+    """Shared engine per user within this process; only `persist` engines are written to disk."""
+    with _engines_lock:
+        if persist:
+            if user_id not in _engines:
+                _engines[user_id] = TrendEngine(user_id)
+            return _engines[user_id]
+        engine = _anon_engines.pop(user_id, None) or TrendEngine(user_id, persist=False)
+        _anon_engines[user_id] = engine
+        while len(_anon_engines) > TREND_ANON_MAX_ENGINES:
+            _anon_engines.popitem(last=False)
+        return engine
+
+
+@atexit.register
+def _flush_all():
+    with _engines_lock:
+        engines = list(_engines.values())
+    for engine in engines:
+        try:
+            engine.flush()
+        except OSError as e:
+            print("Trend store could not be saved:", e)
@@ -0,0 +1,172 @@
+# vocab.py
+# Clinical keyword vocabularies (red flags, symptoms, coping) live in VOCAB_PATH (JSON, or YAML
+# when PyYAML is installed) and are compiled into matchers here. A watcher thread recompiles
+# when the file changes and swaps the compiled object in with a single assignment; callers
+# take one current() reference per request, so in-flight requests finish on the version they
+# started with. A file that fails to load or compile is reported and the old version kept.
+#
+# File format (entries may also be plain strings):
+#   {"version": "...", "negation_languages": ["en"],
+#    "red_flags": {"en": [{"term": "kill myself", "synonyms": ["kill my self"], "weight": 1.0,
+#                          "negatable": true, "not_followed_by": ["..."]}, ...], ...},
+#    "symptoms": {"en": [...]}, "coping": {"en": [...]}}
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import metrics
+from config import VOCAB_PATH, VOCAB_RELOAD_INTERVAL_S
+
+KEYWORD_CATEGORIES = ("symptoms", "coping")
+
+# Words of a phrase may be joined by any run of spaces/punctuation (or nothing):
+# "self-harm" also matches "self harm" and "selfharm", "kill my self" also "kill myself".
+_SEP = r"[\W_]*"
+# accented letters also match their unaccented spelling ("autolesion", "suicidio")
+_ACCENTS = {"á": "[áa]", "é": "[ée]", "í": "[íi]", "ó": "[óo]", "ú": "[úu]", "ñ": "[ñn]"}
+
+
+def _word_pattern(word: str) -> str:
+    return "".join(_ACCENTS.get(ch, re.escape(ch)) for ch in word)
+
+
+def _surface_pattern(surface: str) -> str:
+    return _SEP.join(_word_pattern(w) for w in re.split(r"[\s\-]+", surface.lower()) if w)
+
+
+def _entries(items) -> List[dict]:
+    out = []
+    for item in items or []:
+        entry = {"term": item} if isinstance(item, str) else dict(item)
+        if not isinstance(entry.get("term"), str) or not entry["term"].strip():
+            raise ValueError(f"vocabulary entry without a term: {item!r}")
+        entry["term"] = entry["term"].strip()
+        entry["synonyms"] = [s.strip() for s in entry.get("synonyms", []) if s.strip()]
+        entry["weight"] = float(entry.get("weight", 1.0))
+        out.append(entry)
+    return out
+
+
+class CompiledVocabulary:
+    """Immutable compiled form of one vocabulary file version."""
+
+    def __init__(self, data: dict, path: str = None, mtime: float = 0.0):
+        start = time.perf_counter()
+        self.version = str(data.get("version", "unversioned"))
+        self.path = path
+        self.mtime = mtime
+        negation_langs = set(data.get("negation_languages", []))
+
+        # ---- Red flags: one regex, one named group per canonical phrase ----
+        self.redflags_by_lang: Dict[str, List[str]] = {}
+        self.redflag_phrases: List[str] = []
+        self.redflag_weights: Dict[str, float] = {}
+        self.negatable = set()
+        groups = []
+        for lang, items in (data.get("red_flags") or {}).items():
+            for entry in _entries(items):
+                term = entry["term"]
+                self.redflags_by_lang.setdefault(lang, []).append(term)
+                if term in self.redflag_weights:
+                    continue  # same phrase listed for several languages
+                alts = "|".join(_surface_pattern(s) for s in [term] + entry["synonyms"])
+                if entry.get("not_followed_by"):
+                    stops = "|".join(_word_pattern(w.lower()) for w in entry["not_followed_by"])
+                    alts = rf"(?:{alts})(?!{_SEP}(?:{stops})\b)"
+                groups.append(f"(?P<g{len(self.redflag_phrases)}>{alts})")
+                self.redflag_phrases.append(term)
+                self.redflag_weights[term] = entry["weight"]
+                if entry.get("negatable", lang in negation_langs):
+                    self.negatable.add(term)
+        source = rf"\b(?:{'|'.join(groups)})\b" if groups else r"(?!x)x"
+        self.redflag_re = re.compile(source, re.IGNORECASE)
+
+        # ---- Keywords: (lowercased surface form, canonical term) per language/category ----
+        self.keywords: Dict[str, Dict[str, List[Tuple[str, str]]]] = {}
+        self.keyword_weights: Dict[Tuple[str, str], float] = {}
+        for category in KEYWORD_CATEGORIES:
+            for lang, items in (data.get(category) or {}).items():
+                table = self.keywords.setdefault(lang, {}).setdefault(category, [])
+                for entry in _entries(items):
+                    self.keyword_weights[(category, entry["term"])] = entry["weight"]
+                    for surface in [entry["term"]] + entry["synonyms"]:
+                        table.append((surface.lower(), entry["term"]))
+
+        self.compile_ms = (time.perf_counter() - start) * 1000.0
+        self.pattern_chars = len(source)
+
+    def keyword_terms(self, lang: str, category: str) -> List[str]:
+        return list(dict.fromkeys(term for _, term in self.keywords.get(lang, {}).get(category, [])))
+
+
+def load_vocabulary(path: str = VOCAB_PATH) -> CompiledVocabulary:
+    mtime = os.path.getmtime(path)
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: top level must be a mapping")
+    vocab = CompiledVocabulary(data, path, mtime)
+
+    metrics.observe("vocab.compile_ms", vocab.compile_ms)
+    metrics.set_gauge("vocab.matcher_patterns", len(vocab.redflag_phrases))
+    metrics.set_gauge("vocab.matcher_regex_chars", vocab.pattern_chars)
+    for category in KEYWORD_CATEGORIES:
+        metrics.set_gauge(f"vocab.terms.{category}",
+                          sum(len(tables.get(category, [])) for tables in vocab.keywords.values()))
+    return vocab
+
+
+_current = None
+_lock = threading.Lock()
+_watcher = None
+
+
+def current() -> CompiledVocabulary:
+    """The vocabulary in effect now (loaded, and the watcher started, on first call)."""
+    global _current
+    if _current is None:
+        with _lock:
+            if _current is None:
+                _current = load_vocabulary()
+                _start_watcher()
+    return _current
+
+
+def reload(force: bool = False) -> bool:
+    """Recompile if the file changed (or `force`); True if a new version was swapped in."""
+    global _current
+    with _lock:
+        old = _current
+        try:
+            if not force and old is not None and os.path.getmtime(old.path) == old.mtime:
+                return False
+            new = load_vocabulary(old.path if old is not None else VOCAB_PATH)
+        except Exception as e:
+            print("Vocabulary reload failed, keeping the previous version:", e)
+            metrics.inc("vocab.reload_failed")
+            return False
+        _current = new
+    metrics.inc("vocab.reloads")
+    print(f"Vocabulary {new.version} loaded ({new.compile_ms:.1f} ms, {len(new.redflag_phrases)} red-flag phrases)")
+    return True
+
+
+def _watch():
+    while True:
+        time.sleep(VOCAB_RELOAD_INTERVAL_S)
+        reload()
+
+
+def _start_watcher():
+    global _watcher
+    if _watcher is None and VOCAB_RELOAD_INTERVAL_S:
+        _watcher = threading.Thread(target=_watch, name="vocab-watcher", daemon=True)
+        _watcher.start()